@@ -3,21 +3,38 @@
 import timeit
 import constants
 import os
-import csv
 import logging
 import datetime
 import daemon
 import argparse
+import csv
+import filemanagement as fm
+import memprofile
+import results
+import search
 from repository import RandomRepository, Repository
+from classifier import get_classifier
+from backend import BACKEND_CHOICES
 
 from constants import CURRENT_VERSION
 
 
 logger = logging.getLogger('fixcache_logger')
 
+# two-sided 95% band of the analytic random cache
+CONFIDENCE_Z = 1.96
+
+APPROXIMATE_DISTANCE_COLUMNS = [
+    'distance', 'capacity', 'hits', 'misses', 'hit_rate', 'deviation',
+    'distances', 'distance_bytes', 'ttr']
+
 
 def basic_fixcache_analyser(repo, *args, **kwargs):
-    """Basic analyser, used for one line in the csv files."""
+    """Basic analyser, used for one row of the result store.
+
+    The row ends with the per phase timings of the run, see
+    timing.COLUMNS.
+    """
     repo.reset(*args, **kwargs)
     time = timeit.timeit(repo.run_fixcache, number=1)
 
@@ -28,169 +45,367 @@ def basic_fixcache_analyser(repo, *args, **kwargs):
         repo.cache_size,
         repo.distance_to_fetch,
         repo.pre_fetch_size,
-        time)
+        time) + tuple(repo.timer.get_row())
+
+
+def write_memory_profile(repo, file_):
+    """Write the memory samples of a profiled repository next to file_."""
+    if repo.profiler is not None:
+        repo.profiler.write_csv(os.path.splitext(file_)[0] + '_memory.csv')
+
+
+def _get_analysis_dir(version, repo_dir):
+    dir_ = os.path.join(constants.CSV_ROOT, version, repo_dir)
+    if not os.path.exists(dir_):
+        os.makedirs(dir_)
+
+    return dir_
+
+
+def _run_analyses(store, repo, version, analysis, parameters):
+    """Run and store the (cr, dtf, pfs) analyses missing from the store.
+
+    Every point is memoised for the head of the branch and the classifier
+    of the fixing commits, the points of another head or classifier are
+    run again. Returns the number of analyses run.
+    """
+    missing = [(cr, dtf, pfs) for cr, dtf, pfs in parameters
+               if not store.has_analysis(
+                   repo.repo_dir, version, analysis, cr, dtf, pfs,
+                   branch=repo.branch, head=repo.head,
+                   classifier=repo.classifier.name)]
+    if len(missing) > 0:
+        logger.info('%s of %s points to run at %s' % (
+            len(missing), len(parameters), repo.head))
+
+    for cr, dtf, pfs in missing:
+        logger.debug(
+            ('Running fixcache for %s with ratio of %s and dtf of %s, ' +
+             'with pfs of %s') % (repo.repo_dir, cr, dtf, pfs))
+        store.add_analysis(
+            version, analysis, cr, dtf, pfs, basic_fixcache_analyser(
+                repo=repo, cache_ratio=cr, distance_to_fetch=dtf,
+                pre_fetch_size=pfs),
+            branch=repo.branch, head=repo.head,
+            classifier=repo.classifier.name)
+    store.flush()
+
+    return len(missing)
+
+
+def _export_analysis(store, repo, version, analysis, file_, ran, **kwargs):
+    """Export the stored analysis to its csv file, if new or outdated."""
+    if ran > 0 or not os.path.exists(file_):
+        store.export_analysis_csv(file_, store.get_analysis(
+            repo.repo_dir, version, analysis, branch=repo.branch,
+            head=repo.head, classifier=repo.classifier.name, **kwargs))
+        write_memory_profile(repo, file_)
 
 
 def analyse_by_cache_ratio(version, repo, distance_to_fetch,
-                           pre_fetch_size, progressive=True):
+                           pre_fetch_size, progressive=True, store=None):
     """Analyse a repository by cache ratio, with given pfs and dtf."""
     logger.info(
         "Starting fixcache analysis for %s with dtf=%s, pfs=%s, at %s" %
         (repo.repo_dir, distance_to_fetch,
          pre_fetch_size, datetime.datetime.now()))
-    dir_ = os.path.join(constants.CSV_ROOT, version, repo.repo_dir)
-
-    if not os.path.exists(dir_):
-        os.makedirs(dir_)
-
-    if progressive:
-        file_ = os.path.join(
-            dir_, ('analyse_by_cache_ratio_progressive_dtf_' +
-                   str(distance_to_fetch) +
-                   '_pfs_' + str(pre_fetch_size) + '.csv')
-        )
-    else:
-        file_ = os.path.join(
-            dir_, ('analyse_by_cache_ratio_' + str(distance_to_fetch) +
-                   '_pfs_' + str(pre_fetch_size) +
-                   '.csv'))
-
-    if os.path.exists(file_):
-        logger.info('Analysis exists.\nExit\n')
-        return
+    store = store or results.ResultStore()
+    analysis = 'cache_ratio_progressive' if progressive else 'cache_ratio'
+    file_ = os.path.join(
+        _get_analysis_dir(version, repo.repo_dir),
+        results.get_analysis_file_name(
+            analysis, distance_to_fetch=distance_to_fetch,
+            pre_fetch_size=pre_fetch_size))
 
     cache_ratio_range = [(x + 1) / 100.0 for x in range(100)]
-    with open(file_, 'wb') as out:
-        csv_out = csv.writer(out)
-        csv_out.writerow(
-            ['repo_dir', 'hits', 'misses', 'cache_size', 'dtf', 'pfs', 'ttr'])
-        for ratio in cache_ratio_range:
-            logging.debug(
-                ('Running fixcache for %s with ratio of %s and dtf of %s, ' +
-                 'with pfs of %s') %
-                (repo.repo_dir, ratio, distance_to_fetch, pre_fetch_size))
-
-            csv_out.writerow(basic_fixcache_analyser(
-                repo=repo, cache_ratio=ratio,
-                distance_to_fetch=distance_to_fetch,
-                pre_fetch_size=pre_fetch_size))
-
+    ran = _run_analyses(
+        store, repo, version, analysis,
+        [(cr, distance_to_fetch, pre_fetch_size)
+         for cr in cache_ratio_range])
+    if ran == 0:
+        logger.info('Analysis exists.')
+
+    _export_analysis(
+        store, repo, version, analysis, file_, ran,
+        distance_to_fetch=distance_to_fetch, pre_fetch_size=pre_fetch_size)
     logger.info("Analysis finished at %s\n" % (datetime.datetime.now(),))
 
 
-def analyse_by_fixed_cache_ratio(version, repo, cache_ratio, pfs_set, dtf_set):
+def analyse_by_fixed_cache_ratio(version, repo, cache_ratio, pfs_set, dtf_set,
+                                 store=None):
     """Analyse with fixed cache ratio, varying pfs and dtf."""
     logger.info(
         "Starting fixcache for fixed cache of %s at %s" %
         (cache_ratio, datetime.datetime.now()))
-    dir_ = os.path.join(constants.CSV_ROOT, version, repo.repo_dir)
+    store = store or results.ResultStore()
+    analysis = 'fixed_cache_ratio'
+    file_ = os.path.join(
+        _get_analysis_dir(version, repo.repo_dir),
+        results.get_analysis_file_name(analysis, cache_ratio=cache_ratio))
+
+    ran = _run_analyses(
+        store, repo, version, analysis,
+        [(cache_ratio, dtf, pfs) for pfs in pfs_set for dtf in dtf_set])
+    if ran == 0:
+        logger.info('Analysis exists.')
+
+    _export_analysis(
+        store, repo, version, analysis, file_, ran, cache_ratio=cache_ratio)
+    logger.info("Analysis finished at %s\n" % (datetime.datetime.now(),))
 
-    if not os.path.exists(dir_):
-        os.makedirs(dir_)
 
+def search_fixed_cache_ratio(version, repo, cache_ratio, pfs_set, dtf_set,
+                             store=None):
+    """Search the best dtf and pfs for a fixed cache ratio.
+
+    A coordinate search over the dtf_set and pfs_set replaces the full
+    grid of analyse_by_fixed_cache_ratio(). The points already stored by
+    the grid are reused, the points run are stored and exported like the
+    grid. Returns the best (dtf, pfs), its hit rate and the number of
+    points scored.
+    """
+    logger.info(
+        "Starting fixcache search for fixed cache of %s at %s" %
+        (cache_ratio, datetime.datetime.now()))
+    store = store or results.ResultStore()
+    analysis = 'fixed_cache_ratio_search'
     file_ = os.path.join(
-        dir_, 'analyse_by_fixed_cache_%s.csv' % (cache_ratio,))
+        _get_analysis_dir(version, repo.repo_dir),
+        results.get_analysis_file_name(analysis, cache_ratio=cache_ratio))
+
+    counts = {'ran': 0}
+
+    def get_hit_rate(dtf, pfs):
+        for name in ('fixed_cache_ratio', analysis):
+            rows = store.get_analysis(
+                repo.repo_dir, version, name, distance_to_fetch=dtf,
+                pre_fetch_size=pfs, cache_ratio=cache_ratio,
+                branch=repo.branch, head=repo.head,
+                classifier=repo.classifier.name)
+            if len(rows) > 0:
+                return rows[0]['hit_rate']
+
+        counts['ran'] += _run_analyses(
+            store, repo, version, analysis, [(cache_ratio, dtf, pfs)])
+        return get_hit_rate(dtf, pfs)
+
+    (dtf, pfs), hit_rate, scored = search.coordinate_search(
+        get_hit_rate, [dtf_set, pfs_set])
+    logger.info(
+        'Best of %s points of %s: dtf=%s, pfs=%s, hit rate %s' %
+        (scored, len(dtf_set) * len(pfs_set), dtf, pfs, hit_rate))
+
+    _export_analysis(
+        store, repo, version, analysis, file_, counts['ran'],
+        cache_ratio=cache_ratio)
+    logger.info("Analysis finished at %s\n" % (datetime.datetime.now(),))
+
+    return (dtf, pfs), hit_rate, scored
+
 
-    if os.path.exists(file_):
-        logger.info('Analysis exists.\nExit\n')
-        return
+def approximate_distance_analyser(version, repo, cache_ratio,
+                                  distance_to_fetch, pre_fetch_size,
+                                  capacities):
+    """Compare approximate distance sets of capacities to the exact one.
+
+    The repository is replayed with the exact DistanceSet, then with an
+    ApproximateDistanceSet of every capacity. The hit rate deviation from
+    the exact replay, and the size of the distances, are written to a csv
+    file and returned as rows.
+    """
+    logger.info(
+        "Starting approximate distance analysis for %s at %s" %
+        (repo.repo_dir, datetime.datetime.now()))
+    file_ = os.path.join(
+        _get_analysis_dir(version, repo.repo_dir),
+        'approximate_distance_cr_%s_dtf_%s_pfs_%s.csv' % (
+            cache_ratio, distance_to_fetch, pre_fetch_size))
+
+    distances = repo.file_distances
+    settings = [('exact', None, fm.DistanceSet())] + [
+        ('approximate', capacity, fm.ApproximateDistanceSet(capacity))
+        for capacity in capacities]
+    rows = []
+    exact_hit_rate = None
+    try:
+        for name, capacity, distance_set in settings:
+            repo.file_distances = distance_set
+            row = basic_fixcache_analyser(
+                repo=repo, cache_ratio=cache_ratio,
+                distance_to_fetch=distance_to_fetch,
+                pre_fetch_size=pre_fetch_size)
+            footprint = memprofile.get_footprint(repo)
+
+            hits, misses, ttr = row[1], row[2], row[6]
+            hit_rate = float(hits) / (hits + misses) if hits + misses else 0
+            if exact_hit_rate is None:
+                exact_hit_rate = hit_rate
+            rows.append(
+                (name, capacity, hits, misses, hit_rate,
+                 hit_rate - exact_hit_rate, footprint['distances'],
+                 footprint['distance_bytes'], ttr))
+    finally:
+        repo.file_distances = distances
 
     with open(file_, 'wb') as out:
         csv_out = csv.writer(out)
-        csv_out.writerow(
-            ['repo_dir', 'hits', 'misses', 'cache_size', 'dtf', 'pfs', 'ttr'])
-
-        for pfs in pfs_set:
-            for dtf in dtf_set:
-                logging.info(
-                    ('Running fixcache for %s with ratio of %s and dtf ' +
-                     'of %s, with pfs of %s') %
-                    (repo.repo_dir, cache_ratio, dtf, pfs))
-                csv_out.writerow(basic_fixcache_analyser(
-                    repo=repo, cache_ratio=cache_ratio, distance_to_fetch=dtf,
-                    pre_fetch_size=pfs))
+        csv_out.writerow(APPROXIMATE_DISTANCE_COLUMNS)
+        for row in rows:
+            csv_out.writerow(row)
 
     logger.info("Analysis finished at %s\n" % (datetime.datetime.now(),))
 
+    return rows
 
-def random_cache_analyser(repo, **kwargs):
-    """Analyse a repository by cache ratio, with given pfs and dtf."""
+
+def random_cache_analyser(repo, analytic=True, store=None, **kwargs):
+    """Analyse a repository by cache ratio, with a random cache.
+
+    By default the history is replayed once, and the expected hits of a
+    random cache, with a confidence band, are computed analytically for
+    every cache ratio. Otherwise the random cache is sampled, with one full
+    replay for every cache ratio.
+    """
     logger.info(
         "Starting fixcache analysis for %s with random cache, at %s" %
         (repo.repo_dir, datetime.datetime.now()))
-    dir_ = os.path.join(constants.CSV_ROOT, 'random', repo.repo_dir)
-
-    if not os.path.exists(dir_):
-        os.makedirs(dir_)
-
+    store = store or results.ResultStore()
+    version = 'random'
+    analysis = 'random_cache_analytic' if analytic else 'random_cache'
     file_ = os.path.join(
-        dir_, ('analyse_by_random_cache.csv'))
-
-    if os.path.exists(file_):
-        logger.info('Analysis exists.\nExit\n')
-        return
+        _get_analysis_dir(version, repo.repo_dir),
+        results.get_analysis_file_name(analysis))
 
     cache_ratio_range = [(x + 1) / 100.0 for x in range(100)]
-    with open(file_, 'wb') as out:
-        csv_out = csv.writer(out)
-        csv_out.writerow(
-            ['repo_dir', 'hits', 'misses', 'cache_size', 'dtf', 'pfs', 'ttr'])
-        for ratio in cache_ratio_range:
-
-            csv_out.writerow(basic_fixcache_analyser(
-                repo=repo, cache_ratio=ratio,
-                pre_fetch_size=0, distance_to_fetch=0))
-
+    if not analytic:
+        ran = _run_analyses(
+            store, repo, version, analysis,
+            [(cr, 0, 0) for cr in cache_ratio_range])
+    else:
+        missing = [cr for cr in cache_ratio_range if not store.has_analysis(
+            repo.repo_dir, version, analysis, cr, branch=repo.branch,
+            head=repo.head, classifier=repo.classifier.name)]
+        ran = len(missing)
+        if ran > 0:
+            repo.reset()
+            time = timeit.timeit(
+                lambda: repo.run_fixcache(sampled=False), number=1)
+            timings = repo.timer.get_row()
+            for ratio in missing:
+                cache_size = max(1, int(ratio * float(repo.file_count)))
+                hits, misses, sd = repo.get_expected_hits(cache_size)
+                store.add_analysis(
+                    version, analysis, ratio, None, None,
+                    (repo.repo_dir, hits, misses, cache_size, None, None,
+                     time) + tuple(timings),
+                    hits_low=max(0.0, hits - CONFIDENCE_Z * sd),
+                    hits_high=hits + CONFIDENCE_Z * sd,
+                    branch=repo.branch, head=repo.head,
+                    classifier=repo.classifier.name)
+            store.flush()
+
+    if ran == 0:
+        logger.info('Analysis exists.')
+
+    _export_analysis(store, repo, version, analysis, file_, ran)
     logger.info("Analysis finished at %s\n" % (datetime.datetime.now(),))
 
 
 def main(parser):
     """Main entry."""
     args = parser.parse_args()
+    classifier = get_classifier(args.issues)
+    store = results.ResultStore(args.db)
+    try:
+        _run_function(parser, args, classifier, store)
+    finally:
+        store.close()
 
+
+def _run_function(parser, args, classifier, store):
     if args.function == 'random_cache_analyser':
-        repo = RandomRepository(repo_dir=args.repository, branch=args.b)
-        random_cache_analyser(repo)
+        repo = RandomRepository(
+            repo_dir=args.repository, branch=args.b, classifier=classifier,
+            backend=args.backend, profile_interval=args.profile_memory)
+        with repo:
+            random_cache_analyser(
+                repo, analytic=not args.sampled, store=store)
     else:
         if args.v != CURRENT_VERSION:
             parser.error('Version has to be %s' % (CURRENT_VERSION,))
         else:
             version = 'version_' + str(CURRENT_VERSION)
-            repo = Repository(args.repository, branch=args.b)
-
-            if args.function == 'analyse_by_cache_ratio':
-                dtf_set = [0.1, 0.2, 0.3, 0.4, 0.5]
-                pfs_set = [0.1, 0.15, 0.2]
-                for i in dtf_set:
-                    for j in pfs_set:
-                        analyse_by_cache_ratio(
-                            version=version, repo=repo, distance_to_fetch=i,
-                            pre_fetch_size=j)
-            elif args.function == 'analyse_by_fixed_cache_ratio':
-                # dtf_set = [0.1, 0.15, 0.2, .., 0.55]
-                dtf_set = [float(x + 2) / 20 for x in range(10)]
-                # pfs_set = [0.1, 0.15, ..., 0.35]
-                pfs_set = dtf_set[:6]
-                # cache_ratio = [0.05, 0.1, 0.15, ..., 0.5]
-                cache_ratio = [float(x + 1) / 20 for x in range(10)]
-
-                for cr in cache_ratio:
-                    analyse_by_fixed_cache_ratio(
+            # results of other distance sets are kept apart
+            if args.distance != 'exact':
+                version += '_' + args.distance
+            repo = Repository(
+                args.repository, branch=args.b, classifier=classifier,
+                backend=args.backend, profile_interval=args.profile_memory,
+                distance=args.distance)
+            with repo:
+                _run_repository_function(parser, args, repo, version, store)
+
+
+def _run_repository_function(parser, args, repo, version, store):
+    if args.function == 'analyse_by_cache_ratio':
+        dtf_set = [0.1, 0.2, 0.3, 0.4, 0.5]
+        pfs_set = [0.1, 0.15, 0.2]
+        for i in dtf_set:
+            for j in pfs_set:
+                analyse_by_cache_ratio(
+                    version=version, repo=repo, distance_to_fetch=i,
+                    pre_fetch_size=j, store=store)
+    elif args.function in ('analyse_by_fixed_cache_ratio',
+                           'search_fixed_cache_ratio'):
+        # dtf_set = [0.1, 0.15, 0.2, .., 0.55]
+        dtf_set = [float(x + 2) / 20 for x in range(10)]
+        # pfs_set = [0.1, 0.15, ..., 0.35]
+        pfs_set = dtf_set[:6]
+        # cache_ratio = [0.05, 0.1, 0.15, ..., 0.5]
+        cache_ratio = [float(x + 1) / 20 for x in range(10)]
+
+        if args.function == 'analyse_by_fixed_cache_ratio':
+            for cr in cache_ratio:
+                analyse_by_fixed_cache_ratio(
+                    version=version, repo=repo,
+                    cache_ratio=cr, dtf_set=dtf_set,
+                    pfs_set=pfs_set, store=store)
+        else:
+            if args.cr is not None:
+                cache_ratio = [args.cr]
+            print 'cr : dtf : pfs : hit_rate : points'
+            for cr in cache_ratio:
+                (dtf, pfs), hit_rate, scored = \
+                    search_fixed_cache_ratio(
                         version=version, repo=repo,
-                        cache_ratio=cr, dtf_set=dtf_set, pfs_set=pfs_set)
-            elif args.function == 'analyse_single':
-                if args.pfs is None or args.dtf is None:
-                    parser.error('pfs and dtf has to be set')
-                else:
-                    analyse_by_cache_ratio(
-                        version=version, repo=repo, pre_fetch_size=args.pfs,
-                        distance_to_fetch=args.dtf)
+                        cache_ratio=cr, dtf_set=dtf_set,
+                        pfs_set=pfs_set, store=store)
+                print cr, ':', dtf, ':', pfs, ':', \
+                    '%.4f' % (hit_rate,), ':', scored
+    elif args.function == 'approximate_distance_report':
+        rows = approximate_distance_analyser(
+            version=version, repo=repo, cache_ratio=args.cr or 0.1,
+            distance_to_fetch=args.dtf or 0.3,
+            pre_fetch_size=args.pfs or 0.2,
+            capacities=args.capacity)
+        print ' : '.join(APPROXIMATE_DISTANCE_COLUMNS)
+        for row in rows:
+            print ' : '.join(str(x) for x in row)
+    elif args.function == 'analyse_single':
+        if args.pfs is None or args.dtf is None:
+            parser.error('pfs and dtf has to be set')
+        else:
+            analyse_by_cache_ratio(
+                version=version, repo=repo, pre_fetch_size=args.pfs,
+                distance_to_fetch=args.dtf, store=store)
 
 ANALYSIS_CHOICES = [
     'analyse_by_cache_ratio',
     'analyse_single',
     'random_cache_analyser',
-    'analyse_by_fixed_cache_ratio']
+    'analyse_by_fixed_cache_ratio',
+    'search_fixed_cache_ratio',
+    'approximate_distance_report']
 
 parser = argparse.ArgumentParser(
     description='Run FixCache analysis for different repos')
@@ -206,6 +421,21 @@ parser.add_argument('--dtf', '--distance_to_fetch', type=float)
 parser.add_argument('--b', '--branch', type=str, default='master')
 parser.add_argument('--logging', default='info')
 parser.add_argument('--v', '--version', type=int)
+parser.add_argument('--issues', type=str, default=None,
+                    help='file of bug issue ids, one per line')
+parser.add_argument('--sampled', action='store_true',
+                    help='sample the random cache instead of computing it')
+parser.add_argument('--backend', choices=BACKEND_CHOICES, default='gitpython')
+parser.add_argument('--profile_memory', type=int, default=None, metavar='N',
+                    help='sample the memory every N commits')
+parser.add_argument('--distance', choices=fm.DISTANCE_CHOICES,
+                    default='exact',
+                    help='distance set weighting the co-changes of files')
+parser.add_argument('--capacity', type=int, nargs='+',
+                    default=[4, 8, 16, 32, 64],
+                    help='counters per file of the approximate distances')
+parser.add_argument('--db', type=str, default=None,
+                    help='path of the result store, constants.RESULTS_DB')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,819 @@
+"""Backend module, the interface of fixcache to the history of a repository.
+
+A HistoryBackend answers the questions the fixcache replay asks about a
+history: the commits in order, the numstat and the patch of a commit, the
+blame of a file and the files of a tree. Three implementations are given:
+
+- GitPythonBackend, on top of git.Repo,
+- SubprocessBackend, batching the git command line into long-lived
+  processes,
+- InMemoryBackend, fed from a synthetic history without any git I/O.
+
+Commits are handed out as lightweight Commit records, their parents are
+given as hexshas.
+
+The blames of several files are run by blame_multiple(), on a bounded
+thread pool for the backends whose blame is a git process of its own.
+"""
+import binascii
+import logging
+import os
+import subprocess
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import git
+except ImportError:
+    git = None
+
+
+DIFF_SENTINEL = 'END-OF-DIFF'
+
+# blobs are counted in chunks, never held in memory as a whole
+CHUNK_SIZE = 64 * 1024
+
+BACKEND_CHOICES = ['gitpython', 'subprocess']
+
+MAX_BLAME_WORKERS = 4
+
+
+def _get_blame_workers():
+    """Return the number of concurrent blames, at most one per CPU."""
+    try:
+        return min(MAX_BLAME_WORKERS, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 1
+
+
+# concurrent blames of the backends running git blame processes
+BLAME_WORKERS = _get_blame_workers()
+
+
+class BackendError(Exception):
+    """Backend Error."""
+
+    def __init__(self, value):
+        """Initalization of the class."""
+        self.value = value
+
+    def __str__(self):
+        """String representation of the class."""
+        return repr(self.value)
+
+
+class Commit(object):
+    """A commit of the history, without any of its content."""
+
+    __slots__ = ('hexsha', 'parents', 'message', 'tree')
+
+    def __init__(self, hexsha, parents, message='', tree=None):
+        """Initialization, parents is a tuple of hexshas."""
+        self.hexsha = hexsha
+        self.parents = tuple(parents)
+        self.message = message
+        self.tree = tree
+
+    def __str__(self):
+        """String representation, the hexsha."""
+        return self.hexsha
+
+
+class Diff(object):
+    """The diff of a single file, without context lines."""
+
+    __slots__ = ('a_path', 'b_path', 'new_file', 'deleted_file', 'renamed',
+                 'diff')
+
+    def __init__(self, a_path, b_path, diff='', new_file=False,
+                 deleted_file=False, renamed=False):
+        """Initialization, a_path is None for new files, b_path for deleted.
+        """
+        self.a_path = a_path
+        self.b_path = b_path
+        self.diff = diff
+        self.new_file = new_file
+        self.deleted_file = deleted_file
+        self.renamed = renamed
+
+
+def count_lines(content):
+    """Return the number of lines of a blob, as git blame counts them."""
+    line_count = content.count('\n')
+    if len(content) > 0 and not content.endswith('\n'):
+        line_count += 1
+
+    return line_count
+
+
+def count_stream_lines(stream, size):
+    """Return the number of lines of a blob of size bytes read from stream.
+    """
+    line_count = 0
+    last = '\n'
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(min(remaining, CHUNK_SIZE))
+        if len(chunk) == 0:
+            raise BackendError('Blob truncated, %s bytes missing' % (
+                remaining,))
+        line_count += chunk.count('\n')
+        last = chunk[-1]
+        remaining -= len(chunk)
+
+    if last != '\n':
+        line_count += 1
+
+    return line_count
+
+
+def parse_ls_tree(out):
+    """Return the (path, blob oid) of the blobs of a git ls-tree -r -z."""
+    blobs = []
+    for entry in out.split('\x00'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, type_, oid = info.split(' ')
+        # submodules are listed as commits
+        if type_ == 'blob':
+            blobs.append((path, oid))
+
+    return blobs
+
+
+def load_line_counts(path):
+    """Load line counts saved by save_line_counts()."""
+    counts = {}
+    with open(path, 'r') as trace:
+        for line in trace:
+            line_count, file_path = line.rstrip('\n').split('\t', 1)
+            counts[file_path.decode('utf-8')] = int(line_count)
+
+    return counts
+
+
+def save_line_counts(path, counts):
+    """Save a dict of line counts, one 'count<TAB>path' line per file."""
+    dir_ = os.path.dirname(path)
+    if not os.path.exists(dir_):
+        os.makedirs(dir_)
+
+    with open(path, 'w') as trace:
+        for file_path, line_count in counts.iteritems():
+            trace.write('%d\t%s\n' % (line_count, file_path.encode('utf-8')))
+
+
+class HistoryBackend(object):
+    """HistoryBackend interface.
+
+    Traces derived from the history, such as the verdicts of classifiers,
+    are only persisted for persistent backends.
+    """
+
+    persistent = True
+
+    # blames run at once by blame_multiple(), 1 runs them in turn
+    blame_workers = 1
+
+    _pool = None
+
+    def iter_commits(self, branch):
+        """Return the commits of a branch, oldest first."""
+        raise NotImplementedError
+
+    def get_stats(self, commit):
+        """Return the numstat of a commit, compared to its first parent.
+
+        The numstat is a dict of path to a dict of 'insertions',
+        'deletions' and 'lines', like git.Commit.stats.files. Renames are
+        not detected, a renamed file is deleted from its old path and
+        created at its new path.
+        """
+        raise NotImplementedError
+
+    def get_diffs(self, commit):
+        """Return the list of Diffs of a commit, compared to its parent."""
+        raise NotImplementedError
+
+    def blame(self, hexsha, path):
+        """Return the blame of a file as (hexsha, lines) tuples."""
+        raise NotImplementedError
+
+    def blame_multiple(self, hexsha, paths):
+        """Return a dict of path to the blame of every file at a commit.
+
+        The blames run on a pool of blame_workers threads. A blame failing
+        with a BackendError maps to the error, so that the blames which
+        are not used can fail silently.
+        """
+        def blame(path):
+            try:
+                return self.blame(hexsha, path)
+            except BackendError as be:
+                return be
+
+        if self.blame_workers > 1 and len(paths) > 1:
+            if self._pool is None:
+                self._pool = ThreadPool(self.blame_workers)
+            blames = self._pool.map(blame, paths)
+        else:
+            blames = [blame(path) for path in paths]
+
+        return dict(zip(paths, blames))
+
+    def get_tree_files(self, hexsha):
+        """Return the paths of every blob in the tree of a commit."""
+        raise NotImplementedError
+
+    def get_line_count(self, hexsha, path):
+        """Return the line count of a file at a commit."""
+        raise NotImplementedError
+
+    def get_line_counts(self, hexsha, paths):
+        """Return a dict of the line counts of several files at a commit.
+        """
+        return dict(
+            (path, self.get_line_count(hexsha, path)) for path in paths)
+
+    def close(self):
+        """Release the resources of the backend."""
+        self._close_pool()
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class GitPythonBackend(HistoryBackend):
+    """Backend on top of GitPython.
+
+    A blame is a git blame process, its output is parsed without reading
+    the object database, so blames can run concurrently.
+    """
+
+    blame_workers = BLAME_WORKERS
+
+    def __init__(self, path):
+        """Open the repository at path."""
+        if git is None:
+            raise BackendError('GitPython is required by GitPythonBackend')
+
+        try:
+            self.repo = git.Repo(path)
+        except (git.exc.NoSuchPathError,
+                git.exc.InvalidGitRepositoryError) as e:
+            logging.warning(e)
+            raise BackendError(
+                "The path %s is not a valid repository" % (path,))
+
+        if self.repo.bare:
+            raise BackendError("The repository at %s is bare" % (path,))
+
+    def iter_commits(self, branch):
+        """Return the commits of a branch, oldest first."""
+        return [
+            Commit(c.hexsha, [p.hexsha for p in c.parents], c.message,
+                   c.tree.hexsha)
+            for c in reversed(list(self.repo.iter_commits(branch)))]
+
+    def get_stats(self, commit):
+        """Return the numstat of a commit, compared to its first parent."""
+        numstat = self.repo.git.diff(
+            commit.parents[0], commit.hexsha, '--', numstat=True,
+            no_renames=True)
+
+        return git.Stats._list_from_string(self.repo, numstat).files
+
+    def get_diffs(self, commit):
+        """Return the list of Diffs of a commit, compared to its parent."""
+        parent = self.repo.commit(commit.parents[0])
+        diffs = parent.diff(commit.hexsha, create_patch=True, unified=0)
+
+        return [
+            Diff(None if d.new_file else d.a_path,
+                 None if d.deleted_file else d.b_path,
+                 d.diff, d.new_file, d.deleted_file, d.renamed)
+            for d in diffs]
+
+    def blame(self, hexsha, path):
+        """Return the blame of a file as (hexsha, lines) tuples."""
+        try:
+            return [(c.hexsha, lines)
+                    for c, lines in self.repo.blame(hexsha, path)]
+        except git.exc.GitCommandError as gce:
+            logging.warning(gce)
+            raise BackendError("Error during blame of %s" % (path,))
+
+    def _get_blobs(self, hexsha):
+        try:
+            out = self.repo.git.ls_tree('-r', '-z', hexsha)
+        except git.exc.GitCommandError as gce:
+            logging.warning(gce)
+            raise BackendError("Error during listing of %s" % (hexsha,))
+
+        return parse_ls_tree(out)
+
+    def get_tree_files(self, hexsha):
+        """Return the paths of every blob in the tree of a commit.
+
+        Submodule gitlinks are not files of the repository, they are left
+        out, see parse_ls_tree().
+        """
+        return [path for path, oid in self._get_blobs(hexsha)]
+
+    def get_line_counts(self, hexsha, paths):
+        """Return a dict of the line counts of several files at a commit.
+
+        The blobs are streamed through the cat-file process of GitPython.
+        """
+        oids = dict(self._get_blobs(hexsha))
+        counts = {}
+        for path in paths:
+            if path not in oids:
+                counts[path] = 0
+                continue
+            stream = self.repo.odb.stream(binascii.unhexlify(oids[path]))
+            counts[path] = count_stream_lines(stream, stream.size)
+
+        return counts
+
+    def get_line_count(self, hexsha, path):
+        """Return the line count of a file at a commit."""
+        line_count = 0
+        for commit, lines in self.blame(hexsha, path):
+            line_count += len(lines)
+
+        return line_count
+
+    def close(self):
+        """Stop the git processes kept by GitPython."""
+        self._close_pool()
+        self.repo.close()
+
+
+def _unquote_path(path):
+    """Unquote a path quoted by git, because of special characters."""
+    if path.startswith('"') and path.endswith('"'):
+        return path[1:-1].decode('string_escape')
+
+    return path
+
+
+def _split_diff_header(header):
+    """Return the a/ and b/ paths of a 'diff --git' header, as unicode.
+
+    Either path may be quoted. Unquoted paths are ambiguous when they
+    contain ' b/', the paths of a header without rename are equal.
+    """
+    if header.startswith('"'):
+        end = 1
+        while header[end] != '"':
+            end += 2 if header[end] == '\\' else 1
+        a_path, b_path = header[:end + 1], header[end + 2:]
+    elif header.endswith('"'):
+        a_path, b_path = header[:header.rindex(' "')], \
+            header[header.rindex(' "') + 1:]
+    else:
+        middle = (len(header) - 1) // 2
+        if header[middle] == ' ' and header[2:middle] == header[middle + 3:]:
+            a_path, b_path = header[:middle], header[middle + 1:]
+        else:
+            a_path, b_path = header.split(' b/', 1)
+            b_path = 'b/' + b_path
+
+    return _get_path(a_path), _get_path(b_path)
+
+
+def _get_path(path):
+    """Return the unicode path of a possibly quoted a/ or b/ diff path."""
+    path = _unquote_path(path.rstrip('\t'))
+    if path == '/dev/null':
+        return None
+    return path[2:].decode('utf-8')
+
+
+class SubprocessBackend(HistoryBackend):
+    """Backend running the git command line.
+
+    The history and all numstats are read by a single git log. Patches and
+    blobs are streamed through long-lived git diff-tree --stdin and git
+    cat-file --batch processes. Every blame is a git blame process, so
+    blames can run concurrently.
+    """
+
+    blame_workers = BLAME_WORKERS
+
+    def __init__(self, path, git_binary='git'):
+        """Open the repository at path."""
+        if not os.path.isdir(path):
+            raise BackendError(
+                "The path %s is not a valid repository" % (path,))
+
+        self.path = path
+        self.git_binary = git_binary
+        self.stats = {}
+        self._diff_tree = None
+        self._cat_file = None
+
+        try:
+            self._git('rev-parse', '--git-dir')
+        except BackendError:
+            raise BackendError(
+                "The path %s is not a valid repository" % (path,))
+
+    def _git(self, *args):
+        try:
+            return subprocess.check_output(
+                (self.git_binary, '-C', self.path) + args,
+                stderr=subprocess.PIPE)
+        except (subprocess.CalledProcessError, OSError) as e:
+            logging.warning(e)
+            raise BackendError("Error during git %s" % (args[0],))
+
+    def _popen(self, *args):
+        env = dict(os.environ)
+        env['GIT_FLUSH'] = '1'
+        return subprocess.Popen(
+            (self.git_binary, '-C', self.path) + args, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def iter_commits(self, branch):
+        """Return the commits of a branch, oldest first.
+
+        The numstats of every commit are read by the same git log.
+        """
+        out = self._git(
+            'log', '--reverse', '--numstat', '--no-renames', '--no-color',
+            '--format=%x01%H%x00%P%x00%T%x00%B%x00', branch)
+
+        commits = []
+        for chunk in out.split('\x01')[1:]:
+            hexsha, parents, tree, message, numstat = chunk.split('\x00', 4)
+            commits.append(
+                Commit(hexsha, parents.split(), message.decode('utf-8'),
+                       tree))
+            self.stats[hexsha] = self._parse_numstat(numstat)
+
+        return commits
+
+    def _parse_numstat(self, numstat):
+        files = {}
+        for line in numstat.splitlines():
+            fields = line.split('\t', 2)
+            if len(fields) != 3:
+                continue
+            insertions, deletions, path = fields
+            insertions = int(insertions) if insertions != '-' else 0
+            deletions = int(deletions) if deletions != '-' else 0
+            files[_unquote_path(path).decode('utf-8')] = {
+                'insertions': insertions,
+                'deletions': deletions,
+                'lines': insertions + deletions,
+            }
+
+        return files
+
+    def get_stats(self, commit):
+        """Return the numstat of a commit, compared to its first parent."""
+        if commit.hexsha not in self.stats:
+            self.stats[commit.hexsha] = self._parse_numstat(self._git(
+                'diff', '--numstat', '--no-renames', '--no-color',
+                commit.parents[0], commit.hexsha))
+
+        return self.stats[commit.hexsha]
+
+    def get_diffs(self, commit):
+        """Return the list of Diffs of a commit, compared to its parent."""
+        if self._diff_tree is None:
+            self._diff_tree = self._popen(
+                'diff-tree', '--stdin', '-r', '-M', '-p', '-U0',
+                '--no-color', '--full-index')
+
+        self._diff_tree.stdin.write(
+            '%s\n%s\n' % (commit.hexsha, DIFF_SENTINEL))
+        self._diff_tree.stdin.flush()
+
+        lines = []
+        for line in iter(self._diff_tree.stdout.readline, ''):
+            if line.rstrip('\n') == DIFF_SENTINEL:
+                break
+            lines.append(line)
+
+        return self._parse_patch(lines)
+
+    def _parse_patch(self, lines):
+        diffs = []
+        diff = None
+        patch = []
+        for line in lines:
+            if line.startswith('diff --git '):
+                if diff is not None:
+                    diff.diff = ''.join(patch)
+                    diffs.append(diff)
+                a_path, b_path = _split_diff_header(
+                    line[len('diff --git '):].rstrip('\n'))
+                diff = Diff(a_path, b_path)
+                patch = []
+            elif diff is None:
+                # the commit hexsha
+                continue
+            elif line.startswith('@@') or patch:
+                patch.append(line)
+            elif line.startswith('--- '):
+                # the paths of the header are ambiguous, these are not
+                diff.a_path = _get_path(line[4:].rstrip('\n'))
+            elif line.startswith('+++ '):
+                diff.b_path = _get_path(line[4:].rstrip('\n'))
+            elif line.startswith('new file mode'):
+                diff.new_file = True
+                diff.a_path = None
+            elif line.startswith('deleted file mode'):
+                diff.deleted_file = True
+                diff.b_path = None
+            elif line.startswith('rename from '):
+                diff.renamed = True
+                diff.a_path = _unquote_path(
+                    line[12:].rstrip('\n')).decode('utf-8')
+            elif line.startswith('rename to '):
+                diff.b_path = _unquote_path(
+                    line[10:].rstrip('\n')).decode('utf-8')
+
+        if diff is not None:
+            diff.diff = ''.join(patch)
+            diffs.append(diff)
+
+        return diffs
+
+    def blame(self, hexsha, path):
+        """Return the blame of a file as (hexsha, lines) tuples."""
+        out = self._git(
+            'blame', '--porcelain', hexsha, '--', path.encode('utf-8'))
+
+        blame = []
+        current = None
+        for line in out.splitlines():
+            if line.startswith('\t'):
+                if len(blame) > 0 and blame[-1][0] == current:
+                    blame[-1][1].append(line[1:])
+                else:
+                    blame.append((current, [line[1:]]))
+            else:
+                fields = line.split(' ')
+                if len(fields[0]) == 40 and len(fields) >= 3:
+                    current = fields[0]
+
+        return blame
+
+    def get_tree_files(self, hexsha):
+        """Return the paths of every blob in the tree of a commit.
+
+        Submodule gitlinks are left out, as by GitPythonBackend.
+        """
+        out = self._git('ls-tree', '-r', '-z', hexsha)
+
+        return [path.decode('utf-8') for path, oid in parse_ls_tree(out)]
+
+    def _get_cat_file(self):
+        if self._cat_file is None:
+            self._cat_file = self._popen('cat-file', '--batch')
+
+        return self._cat_file
+
+    def _read_blob(self, name):
+        self._get_cat_file()
+        self._cat_file.stdin.write('%s\n' % (name,))
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().split()
+        if len(header) != 3:
+            raise BackendError('No blob %s' % (name,))
+
+        content = self._cat_file.stdout.read(int(header[2]))
+        # the blob is followed by a newline
+        self._cat_file.stdout.read(1)
+
+        return content
+
+    def get_line_count(self, hexsha, path):
+        """Return the line count of a file at a commit."""
+        return count_lines(self._read_blob('%s:%s' % (hexsha, path)))
+
+    def get_line_counts(self, hexsha, paths):
+        """Return a dict of the line counts of several files at a commit.
+
+        Every blob is requested from the cat-file process at once, by a
+        writer thread, and the newlines are counted while the blobs are
+        streamed back.
+        """
+        cat_file = self._get_cat_file()
+        requests = ''.join(
+            '%s:%s\n' % (hexsha, path.encode('utf-8')) for path in paths)
+
+        def write_requests():
+            cat_file.stdin.write(requests)
+            cat_file.stdin.flush()
+
+        writer = threading.Thread(target=write_requests)
+        writer.start()
+
+        counts = {}
+        try:
+            for path in paths:
+                header = cat_file.stdout.readline().split()
+                if len(header) != 3:
+                    logging.warning('No blob %s:%s' % (hexsha, path))
+                    counts[path] = 0
+                    continue
+                counts[path] = count_stream_lines(
+                    cat_file.stdout, int(header[2]))
+                # the blob is followed by a newline
+                cat_file.stdout.read(1)
+        except BackendError:
+            # the stream is out of sync, restart the process on next use
+            cat_file.kill()
+            self._cat_file = None
+            raise
+        finally:
+            writer.join()
+
+        return counts
+
+    def close(self):
+        """Stop the long-lived git processes."""
+        self._close_pool()
+        for process in (self._diff_tree, self._cat_file):
+            if process is not None:
+                process.stdin.close()
+                process.wait()
+        self._diff_tree = None
+        self._cat_file = None
+
+
+class InMemoryBackend(HistoryBackend):
+    """Backend serving a synthetic history from memory.
+
+    The history is a list of Commit records, oldest first, and a dict of
+    hexsha to changes. The changes of a commit map paths to lists of
+    (old_start, old_len, new_start, new_len) hunks, as in a diff without
+    context. A file left without lines is deleted. The optional renames
+    map hexshas to dicts of new path to old path, the hunks of a renamed
+    file are listed under its new path and apply to its old content.
+
+    File contents are only materialized as line origins, by a cursor moving
+    forward through the history, so asking for blames in history order
+    costs a single pass over the changes.
+    """
+
+    persistent = False
+
+    def __init__(self, commits, changes, renames=None):
+        """Initialization with the synthetic history."""
+        self.commits = list(commits)
+        self.changes = changes
+        self.renames = renames or {}
+        self.order = dict(
+            (c.hexsha, i) for i, c in enumerate(self.commits))
+        self._rewind()
+
+    def _rewind(self):
+        self._cursor = -1
+        self._files = {}
+
+    def _move_to(self, hexsha):
+        """Move the cursor to the state after the given commit."""
+        try:
+            target = self.order[hexsha]
+        except KeyError:
+            raise BackendError('Unknown commit %s' % (hexsha,))
+
+        if target < self._cursor:
+            self._rewind()
+
+        while self._cursor < target:
+            self._cursor += 1
+            commit = self.commits[self._cursor]
+            renames = self.renames.get(commit.hexsha, {})
+            for path, old_path in renames.iteritems():
+                self._files[path] = self._files.pop(old_path, [])
+            for path, hunks in self.changes.get(commit.hexsha, {}).iteritems():
+                self._apply_hunks(path, hunks, self._cursor)
+
+    def _apply_hunks(self, path, hunks, ordinal):
+        origins = self._files.setdefault(path, [])
+        offset = 0
+        for old_start, old_len, new_start, new_len in hunks:
+            if old_len == 0:
+                pos = old_start + offset
+            else:
+                pos = old_start - 1 + offset
+            origins[pos:pos + old_len] = [ordinal] * new_len
+            offset += new_len - old_len
+
+        if len(origins) == 0:
+            del self._files[path]
+
+    def _get_line(self, ordinal):
+        return 'line of %s' % (self.commits[ordinal].hexsha[:8],)
+
+    def iter_commits(self, branch):
+        """Return the commits of the history, the branch is ignored."""
+        return list(self.commits)
+
+    def get_stats(self, commit):
+        """Return the numstat of a commit, computed from its hunks.
+
+        As with git --no-renames, a renamed file is the deletion of its
+        old path and the creation of its new path.
+        """
+        renames = self.renames.get(commit.hexsha, {})
+        if len(renames) > 0:
+            self._move_to(commit.parents[0])
+
+        files = {}
+        for path, hunks in self.changes.get(commit.hexsha, {}).iteritems():
+            insertions = sum(h[3] for h in hunks)
+            deletions = sum(h[1] for h in hunks)
+            if path in renames:
+                line_count = len(self._files.get(renames[path], []))
+                files[renames[path]] = {
+                    'insertions': 0,
+                    'deletions': line_count,
+                    'lines': line_count,
+                }
+                insertions += line_count - deletions
+                deletions = 0
+            files[path] = {
+                'insertions': insertions,
+                'deletions': deletions,
+                'lines': insertions + deletions,
+            }
+
+        return files
+
+    def get_diffs(self, commit):
+        """Return the list of Diffs of a commit, compared to its parent."""
+        self._move_to(commit.parents[0])
+
+        renames = self.renames.get(commit.hexsha, {})
+        diffs = []
+        for path, hunks in self.changes.get(commit.hexsha, {}).iteritems():
+            old_path = renames.get(path, path)
+            origins = self._files.get(old_path, [])
+            patch = []
+            for old_start, old_len, new_start, new_len in hunks:
+                patch.append('@@ -%s,%s +%s,%s @@\n' % (
+                    old_start, old_len, new_start, new_len))
+                for ordinal in origins[old_start - 1:old_start - 1 + old_len]:
+                    patch.append('-%s\n' % (self._get_line(ordinal),))
+                patch += ['+%s\n' % (
+                    self._get_line(self.order[commit.hexsha]),)] * new_len
+
+            new_file = old_path not in self._files
+            deleted_file = (not new_file and
+                            len(origins) + sum(h[3] - h[1] for h in hunks) ==
+                            0)
+            diffs.append(Diff(
+                None if new_file else old_path,
+                None if deleted_file else path,
+                ''.join(patch), new_file, deleted_file, old_path != path))
+
+        return diffs
+
+    def blame(self, hexsha, path):
+        """Return the blame of a file as (hexsha, lines) tuples."""
+        self._move_to(hexsha)
+
+        blame = []
+        for ordinal in self._files.get(path, []):
+            line = self._get_line(ordinal)
+            if len(blame) > 0 and blame[-1][0] == self.commits[ordinal].hexsha:
+                blame[-1][1].append(line)
+            else:
+                blame.append((self.commits[ordinal].hexsha, [line]))
+
+        return blame
+
+    def get_tree_files(self, hexsha):
+        """Return the paths of every file in the tree of a commit."""
+        self._move_to(hexsha)
+
+        return self._files.keys()
+
+    def get_line_count(self, hexsha, path):
+        """Return the line count of a file at a commit."""
+        self._move_to(hexsha)
+
+        return len(self._files.get(path, []))
+
+
+def get_backend(name, path):
+    """Return the backend with the given name on the repository at path."""
+    if name == 'gitpython':
+        return GitPythonBackend(path)
+    elif name == 'subprocess':
+        return SubprocessBackend(path)
+
+    raise BackendError('Unknown backend %s' % (name,))
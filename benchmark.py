@@ -0,0 +1,384 @@
+#! /usr/bin/env python
+"""Benchmark module, measuring the throughput of the fixcache engine.
+
+Every benchmark runs a component of the engine over a synthetic history
+and reports its throughput in units per second:
+
+- history_extraction: commits and numstats read from the backend,
+- diff_parsing: patches parsed into deleted intervals and hunks,
+- blame: files blamed by the backend,
+- distance_update: co-change pairs added to a DistanceSet,
+- closest_files: DistanceSet.get_closest_files() queries,
+- cache: commits of changed files added to a Cache, with evictions,
+- top_elements: items ranked by helper_functions.get_top_elements(),
+- windowed_evaluation: commits replayed by WindowedRepository.evaluate().
+
+The engine benchmarks run on an InMemoryBackend, so they measure the
+engine without git I/O. Extraction, diffs and blame use the selected
+backend, on a git repository generated from the same history. The best of
+several runs is kept, and the results are written as JSON keyed by the git
+revision of the engine.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import timeit
+import backend as backend_module
+import cache
+import constants
+import filemanagement as fm
+import helper_functions
+import parsing
+import synthetic
+from repository import WindowedRepository
+
+
+logger = logging.getLogger('fixcache_logger')
+
+BENCHMARK_CHOICES = [
+    'history_extraction',
+    'diff_parsing',
+    'blame',
+    'distance_update',
+    'closest_files',
+    'cache',
+    'top_elements',
+    'windowed_evaluation']
+
+
+def get_revision():
+    """Return the git revision of the engine, 'unknown' outside of git."""
+    dir_ = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.check_output(
+            ['git', '-C', dir_, 'rev-parse', 'HEAD'],
+            stderr=subprocess.PIPE).strip()
+        status = subprocess.check_output(
+            ['git', '-C', dir_, 'status', '--porcelain', '-uno'],
+            stderr=subprocess.PIPE)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logging.warning(e)
+        return 'unknown'
+
+    if status.strip():
+        revision += '-dirty'
+
+    return revision
+
+
+def measure(function, units, unit, repeat=3, setup=None):
+    """Run function repeat times, return the throughput of the best run.
+
+    The setup is called before every run, outside of the timing.
+    """
+    best = None
+    for _ in xrange(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        function()
+        seconds = timeit.default_timer() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    return {
+        'units': units,
+        'unit': unit,
+        'seconds': best,
+        'per_second': units / best if best > 0 else None,
+    }
+
+
+class BenchmarkSuite(object):
+    """Benchmarks of the engine components over one synthetic history."""
+
+    def __init__(self, history, backend='memory', repeat=3, sample=100,
+                 cache_ratio=0.1):
+        """Initialization, generates the history for the chosen backend.
+
+        With a git backend, a temporary git repository is generated, it is
+        removed by close().
+        """
+        self.history = history
+        self.backend_name = backend
+        self.repeat = repeat
+        self.sample = sample
+        self.cache_ratio = cache_ratio
+        self.repo_path = None
+        self.diffs = None
+
+        self.memory = history.to_backend()
+        self.commits = self.memory.iter_commits('master')
+        if backend == 'memory':
+            self.backend = self.memory
+        else:
+            self.repo_path = os.path.join(tempfile.mkdtemp(), 'synthetic')
+            synthetic.create_repository(history, self.repo_path)
+            self.backend = backend_module.get_backend(backend, self.repo_path)
+
+        self.file_set = fm.FileSet()
+        self.changed_files = []
+        for commit in self.commits:
+            self.changed_files.append([
+                self.file_set.get_or_create_file(path)[1]
+                for path in sorted(self.memory.get_stats(commit))])
+
+    def close(self):
+        """Remove the temporary git repository, if any."""
+        self.backend.close()
+        if self.repo_path is not None:
+            shutil.rmtree(os.path.dirname(self.repo_path))
+            self.repo_path = None
+
+    def _measure(self, function, units, unit, setup=None):
+        return measure(function, units, unit, repeat=self.repeat,
+                       setup=setup)
+
+    def _get_backend(self):
+        if self.backend_name == 'memory':
+            return self.memory
+        return backend_module.get_backend(self.backend_name, self.repo_path)
+
+    def bench_history_extraction(self):
+        """Commits and numstats read from a fresh backend."""
+        def run():
+            history_backend = self._get_backend()
+            try:
+                for commit in history_backend.iter_commits('master'):
+                    if len(commit.parents) == 1:
+                        history_backend.get_stats(commit)
+            finally:
+                if history_backend is not self.memory:
+                    history_backend.close()
+
+        return self._measure(run, len(self.commits), 'commits')
+
+    def _get_diffs(self):
+        """Return the hexsha and diffs of every commit but the first.
+
+        The diffs are read in a single forward pass, the InMemoryBackend
+        rewinds when asked for an older commit.
+        """
+        if self.diffs is None:
+            commits = self.backend.iter_commits('master')
+            self.diffs = [(commit.hexsha, self.backend.get_diffs(commit))
+                          for commit in commits[1:]]
+        return self.diffs
+
+    def bench_diff_parsing(self):
+        """Patches parsed into deleted intervals and hunks."""
+        patches = [diff.diff for hexsha, diffs in self._get_diffs()
+                   for diff in diffs]
+
+        def run():
+            for patch in patches:
+                parsing.get_deleted_intervals_from_diff(patch)
+                list(parsing.get_hunks_from_diff(patch))
+
+        return self._measure(run, len(patches), 'diffs')
+
+    def bench_blame(self):
+        """Files blamed by the backend, on the latest commits."""
+        pairs = []
+        for hexsha, diffs in self._get_diffs():
+            paths = [diff.b_path for diff in diffs if diff.b_path is not None]
+            if len(paths) > 0:
+                pairs.append((hexsha, paths[0]))
+        # blame in history order, as the replay does
+        pairs = pairs[max(0, len(pairs) - self.sample):]
+
+        def run():
+            for hexsha, path in pairs:
+                self.backend.blame(hexsha, path)
+
+        def setup():
+            # the InMemoryBackend rewinds and replays up to the first blame
+            if len(pairs) > 0:
+                self.backend.blame(*pairs[0])
+
+        return self._measure(run, len(pairs), 'blames', setup=setup)
+
+    def _get_pairs(self):
+        pairs = []
+        for ordinal, files in enumerate(self.changed_files):
+            for i, file1 in enumerate(files):
+                for file2 in files[i + 1:]:
+                    pairs.append((file1, file2, ordinal))
+        return pairs
+
+    def _fill_distances(self, pairs):
+        distance_set = fm.DistanceSet()
+        for file1, file2, ordinal in pairs:
+            distance_set.add_occurrence(file1, file2, ordinal)
+        return distance_set
+
+    def bench_distance_update(self):
+        """Co-change pairs added to an empty DistanceSet."""
+        pairs = self._get_pairs()
+
+        return self._measure(
+            lambda: self._fill_distances(pairs), len(pairs), 'pairs')
+
+    def bench_closest_files(self):
+        """Closest files queries on the DistanceSet of the whole history."""
+        distance_set = self._fill_distances(self._get_pairs())
+        rand = random.Random(0)
+        files = list(self.file_set.files.itervalues())
+        queries = [rand.choice(files) for _ in xrange(self.sample)]
+
+        def run():
+            for file_ in queries:
+                distance_set.get_closest_files(file_, 10)
+
+        return self._measure(run, len(queries), 'queries')
+
+    def bench_cache(self):
+        """Changed files of every commit added to a Cache."""
+        size = max(1, int(self.cache_ratio * len(self.file_set.files)))
+
+        def run():
+            file_cache = cache.Cache(size)
+            for ordinal, files in enumerate(self.changed_files):
+                for file_ in files:
+                    file_.last_found = ordinal
+                file_cache.add_multiple(files)
+
+        return self._measure(run, len(self.changed_files), 'commits')
+
+    def bench_top_elements(self):
+        """Items ranked by get_top_elements(), keeping the top 10."""
+        rand = random.Random(0)
+        items = [(rand.random(), i) for i in xrange(100000)]
+
+        return self._measure(
+            lambda: helper_functions.get_top_elements(items, 10),
+            len(items), 'items')
+
+    def bench_windowed_evaluation(self):
+        """Commits replayed by a WindowedRepository on the memory backend."""
+        def run():
+            repo = WindowedRepository(
+                repo_dir='synthetic', cache_ratio=self.cache_ratio,
+                distance_to_fetch=0.3, pre_fetch_size=0.2, window=0.9,
+                backend=self.memory)
+            repo.evaluate()
+
+        return self._measure(run, len(self.commits), 'commits')
+
+    def run(self, names=None):
+        """Run the named benchmarks, all of them by default."""
+        results = {}
+        for name in names or BENCHMARK_CHOICES:
+            logger.info('Running benchmark %s' % (name,))
+            results[name] = getattr(self, 'bench_' + name)()
+            logger.info('%s: %.1f %s/s' % (
+                name, results[name]['per_second'] or 0,
+                results[name]['unit']))
+
+        return results
+
+
+def get_parameters(history):
+    """Return the parameters of a synthetic history as a dict."""
+    return dict(
+        (key, getattr(history, key)) for key in [
+            'commit_count', 'file_count', 'commit_size', 'hunk_size',
+            'file_size', 'fix_ratio', 'clustering', 'cluster_size',
+            'delete_ratio', 'rename_ratio', 'seed'])
+
+
+def save_results(results, parameters, backend, revision=None):
+    """Write the results to BENCHMARK_ROOT/<revision>.json.
+
+    The runs of one revision are kept in the same file, keyed by the
+    backend and all the history parameters, so the latest run of a
+    configuration replaces the previous one.
+    """
+    if revision is None:
+        revision = get_revision()
+
+    if not os.path.exists(constants.BENCHMARK_ROOT):
+        os.makedirs(constants.BENCHMARK_ROOT)
+
+    path = os.path.join(constants.BENCHMARK_ROOT, revision + '.json')
+    data = {'revision': revision, 'runs': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as in_:
+            data = json.load(in_)
+
+    key = '_'.join([backend] + [
+        '%s=%s' % (name, parameters[name]) for name in sorted(parameters)])
+    data['runs'][key] = {
+        'backend': backend,
+        'parameters': parameters,
+        'date': datetime.datetime.now().isoformat(),
+        'results': results}
+
+    with open(path, 'w') as out:
+        json.dump(data, out, indent=2, sort_keys=True)
+
+    return path
+
+
+def main(args):
+    """Run the benchmark suite and save its results."""
+    history = synthetic.SyntheticHistory(
+        commit_count=args.commits, file_count=args.files,
+        fix_ratio=args.fix_ratio, clustering=args.clustering,
+        delete_ratio=args.delete_ratio, rename_ratio=args.rename_ratio,
+        seed=args.seed)
+
+    suite = BenchmarkSuite(
+        history, backend=args.backend, repeat=args.repeat,
+        sample=args.sample)
+    try:
+        results = suite.run(args.only)
+    finally:
+        suite.close()
+
+    path = save_results(results, get_parameters(history), args.backend)
+
+    print 'benchmark : units/s : units : seconds'
+    for name in args.only or BENCHMARK_CHOICES:
+        result = results[name]
+        print name, ':', '%.1f' % (result['per_second'] or 0,), ':', \
+            result['units'], result['unit'], ':', '%.4f' % (result['seconds'],)
+    print '\nResults written to', path
+
+
+parser = argparse.ArgumentParser(
+    description='Benchmark the FixCache engine on a synthetic history')
+parser.add_argument('--commits', type=int, default=2000)
+parser.add_argument('--files', type=int, default=200)
+parser.add_argument('--fix_ratio', type=float, default=0.2)
+parser.add_argument('--clustering', type=float, default=0.8)
+parser.add_argument('--delete_ratio', type=float, default=0.01,
+                    help='probability that a changed file is deleted')
+parser.add_argument('--rename_ratio', type=float, default=0.01,
+                    help='probability that a changed file is renamed')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument(
+    '--backend', choices=['memory'] + backend_module.BACKEND_CHOICES,
+    default='memory')
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--sample', type=int, default=100,
+                    help='number of blames and closest files queries')
+parser.add_argument('--only', choices=BENCHMARK_CHOICES, nargs='+',
+                    default=None)
+parser.add_argument('--logging', default='info')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.logging == 'info':
+        logger.setLevel(logging.INFO)
+    elif args.logging == 'debug':
+        logger.setLevel(logging.DEBUG)
+
+    main(args)
@@ -10,6 +10,10 @@ class AbstractCache(object):
         logging.debug('Cache initialized')
         self.size = size
         self.file_set = set()
+        # membership flags, indexed by File.file_id
+        self.members = bytearray()
+        # files evicted since the last pop_evicted()
+        self.evicted = []
 
     @property
     def hit(self):
@@ -29,6 +33,21 @@ class AbstractCache(object):
             raise ValueError("Cache size cannot be less than 1")
         self._size = value
 
+    def _get_file_id(self, file_):
+        if file_.file_id is None:
+            raise ValueError(
+                "File %s has no file_id, it has to come from a FileSet"
+                % (file_,))
+        return file_.file_id
+
+    def _mark(self, files, flag):
+        members = self.members
+        for file_ in files:
+            file_id = self._get_file_id(file_)
+            if file_id >= len(members):
+                members.extend(bytearray(file_id + 1 - len(members)))
+            members[file_id] = flag
+
     def _filled(self):
         return len(self.file_set) == self.size
 
@@ -41,10 +60,14 @@ class AbstractCache(object):
     def _remove_multiple(self, number=1):
         if number >= self.size:
             # empty the whole file set
+            self.evicted.extend(self.file_set)
+            self._mark(self.file_set, 0)
             self.file_set = set()
         else:
             remove_file_set = set(self._get_files_to_remove(number))
+            self.evicted.extend(remove_file_set)
             self.file_set -= remove_file_set
+            self._mark(remove_file_set, 0)
 
     def _remove(self):
         len_ = len(self.file_set)
@@ -53,10 +76,14 @@ class AbstractCache(object):
             return None
         elif len_ == 1:
             file_ = self.file_set.pop()
+            self._mark([file_], 0)
+            self.evicted.append(file_)
             return file_
         else:
             file_ = self._find_file_to_remove()
             self.file_set -= {file_}
+            self._mark([file_], 0)
+            self.evicted.append(file_)
             return file_
 
     def _get_free_space(self):
@@ -67,11 +94,12 @@ class AbstractCache(object):
         return space
 
     def _preprocess_multiple(self, files):
-        files = filter(lambda x: x not in self.file_set, files)
+        files = filter(lambda x: not self.file_in(x), files)
         return files
 
     def file_in(self, file_):
-        if file_ in self.file_set:
+        file_id = self._get_file_id(file_)
+        if file_id < len(self.members) and self.members[file_id]:
             return self.hit
         else:
             return self.miss
@@ -81,6 +109,7 @@ class AbstractCache(object):
             self._remove()
 
         self.file_set.add(file_)
+        self._mark([file_], 1)
 
     def add_multiple(self, files):
         files = self._preprocess_multiple(files)
@@ -91,24 +120,37 @@ class AbstractCache(object):
             self.add(files[0])
         elif len_ <= self._get_free_space():
             self.file_set = self.file_set | set(files)
+            self._mark(files, 1)
         elif len_ <= self.size:
             to_remove = len_ - self._get_free_space()
             self._remove_multiple(to_remove)
             self.file_set = self.file_set | set(files)
+            self._mark(files, 1)
         else:
             files_to_sort = helper_functions.get_top_elements(
                 [(x.last_found, x) for x in files], self.size)
             files_to_insert = [x[1] for x in files_to_sort]
+            self.evicted.extend(self.file_set - set(files_to_insert))
+            self._mark(self.file_set, 0)
             del self.file_set
             self.file_set = set(files_to_insert)
+            self._mark(files_to_insert, 1)
 
     def remove_files(self, files):
         for file_ in files:
             self.file_set.discard(file_)
+        self._mark(files, 0)
+
+    def pop_evicted(self):
+        evicted = self.evicted
+        self.evicted = []
+        return evicted
 
     def flush(self):
         del self.file_set
         self.file_set = set()
+        self.members = bytearray()
+        self.evicted = []
 
     def reset(self, size=None):
         self.flush()
@@ -123,9 +165,10 @@ class Cache(AbstractCache):
         for file_ in self.file_set:
             if file_to_remove is None:
                 file_to_remove = file_
-            else:
-                if file_to_remove.last_found > file_.last_found:
-                    file_to_remove = file_
+            elif ((file_.last_found, file_.file_id) <
+                  (file_to_remove.last_found, file_to_remove.file_id)):
+                # ties are broken by file_id, not by the set order
+                file_to_remove = file_
 
         return file_to_remove
 
@@ -0,0 +1,198 @@
+"""Classifier module, deciding which commits are fixing commits.
+
+A classifier looks at the hexsha and the message of a commit. The
+VerdictCache classifies a whole history in one batch pass and keeps the
+verdicts by hexsha in a trace file under constants.TRACE_ROOT, so repeated
+runs over the same history never classify a commit twice.
+"""
+import hashlib
+import logging
+import os
+import re
+import constants
+import parsing
+
+
+logger = logging.getLogger('fixcache_logger')
+
+# issue references of the usual trackers, JIRA style keys and GitHub ids
+ISSUE_ID_REGEX = r'[A-Z][A-Z0-9]+-\d+|#\d+'
+
+
+class ClassifierError(Exception):
+    """Classifier Error."""
+
+    def __init__(self, value):
+        """Initalization of the class."""
+        self.value = value
+
+    def __str__(self):
+        """String representation of the class."""
+        return repr(self.value)
+
+
+class AbstractClassifier(object):
+    """Classifier interface."""
+
+    def _get_config(self):
+        """Return a string identifying the configuration."""
+        raise NotImplementedError
+
+    @property
+    def name(self):
+        """Name of the classifier, changes with its configuration."""
+        digest = hashlib.md5(self._get_config()).hexdigest()
+        return '%s_%s' % (self.__class__.__name__.lower(), digest[:8])
+
+    def is_fix(self, hexsha, message):
+        """Return True if the commit is a fixing commit."""
+        raise NotImplementedError
+
+    def classify_multiple(self, commits):
+        """Return the verdicts for a list of commits."""
+        return [self.is_fix(c.hexsha, c.message) for c in commits]
+
+
+class RegexClassifier(AbstractClassifier):
+    """Keyword based classifier, all regexes compiled in one alternation."""
+
+    def __init__(self, regexes=None):
+        """Compile the regexes, parsing.FIX_REGEXES by default."""
+        if regexes is None:
+            regexes = parsing.FIX_REGEXES
+        self.regexes = list(regexes)
+        self.pattern = re.compile(
+            '|'.join('(?:%s)' % (r,) for r in self.regexes))
+
+    def _get_config(self):
+        return self.pattern.pattern
+
+    def is_fix(self, hexsha, message):
+        """Return True if the message matches any of the regexes."""
+        return self.pattern.search(message) is not None
+
+
+class IssueClassifier(AbstractClassifier):
+    """Flags commits referencing a known bug of an issue tracker."""
+
+    def __init__(self, issue_ids, issue_regex=ISSUE_ID_REGEX):
+        """Initialize with the ids of the issues which are bugs."""
+        self.issue_ids = frozenset(issue_ids)
+        self.pattern = re.compile(issue_regex)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load the issue ids from a file, one id per line."""
+        try:
+            with open(path, 'r') as issue_file:
+                issue_ids = [line.strip() for line in issue_file]
+        except IOError as ioe:
+            logging.warning(ioe)
+            raise ClassifierError('Cannot read issue ids from %s' % (path,))
+
+        return cls([x for x in issue_ids if x != ''], **kwargs)
+
+    def _get_config(self):
+        return self.pattern.pattern + '\n' + '\n'.join(sorted(self.issue_ids))
+
+    def is_fix(self, hexsha, message):
+        """Return True if the message references any of the issues."""
+        for issue_id in self.pattern.findall(message):
+            if issue_id in self.issue_ids:
+                return True
+
+        return False
+
+
+class AnyClassifier(AbstractClassifier):
+    """Flags a commit if any of several classifiers flags it."""
+
+    def __init__(self, classifiers):
+        """Initialize with a list of classifiers."""
+        self.classifiers = list(classifiers)
+
+    def _get_config(self):
+        return '\n'.join(c.name for c in self.classifiers)
+
+    def is_fix(self, hexsha, message):
+        """Return True if any of the classifiers returns True."""
+        for classifier in self.classifiers:
+            if classifier.is_fix(hexsha, message):
+                return True
+
+        return False
+
+
+class VerdictCache(object):
+    """Verdicts of a classifier, cached by hexsha.
+
+    When a path is given, the verdicts are loaded from and saved to a
+    trace file with one 'hexsha verdict' line per commit.
+    """
+
+    def __init__(self, classifier, path=None):
+        """Initialization, loads the saved verdicts if present."""
+        self.classifier = classifier
+        self.path = path
+        self.verdicts = {}
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        """Load the verdicts from the trace file."""
+        with open(self.path, 'r') as trace:
+            for line in trace:
+                hexsha, verdict = line.split()
+                self.verdicts[hexsha] = verdict == '1'
+
+    def save(self):
+        """Save the verdicts to the trace file."""
+        dir_ = os.path.dirname(self.path)
+        if not os.path.exists(dir_):
+            os.makedirs(dir_)
+
+        with open(self.path, 'w') as trace:
+            for hexsha, verdict in self.verdicts.iteritems():
+                trace.write('%s %d\n' % (hexsha, verdict))
+
+    def classify_multiple(self, commits):
+        """Classify every commit without a verdict, in one pass."""
+        commits = [c for c in commits if c.hexsha not in self.verdicts]
+        if len(commits) == 0:
+            return
+
+        logger.debug('Classifying %s commits' % (len(commits),))
+        verdicts = self.classifier.classify_multiple(commits)
+        for commit, verdict in zip(commits, verdicts):
+            self.verdicts[commit.hexsha] = verdict
+
+        if self.path is not None:
+            self.save()
+
+    def is_fix(self, commit):
+        """Return the verdict for a commit, classifying it if needed."""
+        try:
+            return self.verdicts[commit.hexsha]
+        except KeyError:
+            verdict = self.classifier.is_fix(commit.hexsha, commit.message)
+            self.verdicts[commit.hexsha] = verdict
+            return verdict
+
+
+def get_classifier(issues=None):
+    """Return the classifier for the command line options.
+
+    By default commit messages are matched by keywords. With a file of
+    issue ids, only commits referencing those issues are fixing commits.
+    """
+    if issues is not None:
+        return IssueClassifier.from_file(issues)
+
+    return RegexClassifier()
+
+
+def get_trace_path(repo_dir, classifier):
+    """Return the verdict trace file of a repository and classifier."""
+    return os.path.join(
+        constants.TRACE_ROOT, repo_dir, 'verdicts_%s.txt' % (classifier.name,))
@@ -0,0 +1,201 @@
+"""Commits module, compact storage of the commits of a history.
+
+The CommitTable keeps a whole history in flat arrays: the binary object
+ids of the commits and of their trees, the index of the first parent, the
+number of parents and the fix flag of every commit, with a single index
+from binary oid to position. Commit messages are not retained, commits
+are classified once while the table is built.
+
+A CommitList is a view of a range of the table. Iterating it hands out
+CommitRecords, created on the fly, which offer the hexsha and parents of
+a backend.Commit together with the position of the commit in history.
+"""
+import array
+import binascii
+import sys
+
+
+OID_SIZE = 20
+NULL_OID = '\0' * OID_SIZE
+
+
+class CommitRecord(object):
+    """A commit of a CommitTable, by its index."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        """Initialization."""
+        self.table = table
+        self.index = index
+
+    @property
+    def hexsha(self):
+        """The hexsha of the commit."""
+        return self.table.get_hexsha(self.index)
+
+    @property
+    def parents(self):
+        """The hexshas of the parents of the commit."""
+        return self.table.get_parents(self.index)
+
+    @property
+    def tree(self):
+        """The hexsha of the tree of the commit, None if unknown."""
+        return self.table.get_tree(self.index)
+
+    @property
+    def fix(self):
+        """True if the commit was classified as a fixing commit."""
+        return self.table.is_fix(self.index)
+
+    def __str__(self):
+        """String representation, the hexsha."""
+        return self.hexsha
+
+
+class CommitTable(object):
+    """Flat arrays of the commits of a history, oldest first."""
+
+    def __init__(self):
+        """Initialization of an empty table."""
+        self.oids = bytearray()
+        self.trees = bytearray()
+        self.first_parents = array.array('i')
+        self.parent_counts = bytearray()
+        self.fix_flags = bytearray()
+        self.index = {}
+        # parents of merges and of commits with parents outside the table
+        self.other_parents = {}
+
+    @classmethod
+    def from_commits(cls, commits, is_fix=None):
+        """Build the table from commits, oldest first.
+
+        The commits need a hexsha and parents, as hexshas, and optionally
+        a tree hexsha. is_fix is called with every commit to set its fix
+        flag.
+        """
+        table = cls()
+        for commit in commits:
+            table.append(
+                commit.hexsha, commit.parents,
+                is_fix(commit) if is_fix is not None else False,
+                getattr(commit, 'tree', None))
+
+        return table
+
+    def append(self, hexsha, parents, fix=False, tree=None):
+        """Append a commit, its parents have to be appended before."""
+        position = len(self.fix_flags)
+        oid = binascii.unhexlify(hexsha)
+        self.oids += oid
+        self.index[oid] = position
+        self.trees += binascii.unhexlify(tree) if tree else NULL_OID
+
+        parent_indexes = [self.index.get(binascii.unhexlify(p), -1)
+                          for p in parents]
+        self.first_parents.append(
+            parent_indexes[0] if len(parent_indexes) > 0 else -1)
+        self.parent_counts.append(min(len(parents), 255))
+        self.fix_flags.append(1 if fix else 0)
+
+        if len(parents) > 1 or -1 in parent_indexes:
+            self.other_parents[position] = tuple(parents)
+
+    def __len__(self):
+        """Number of commits."""
+        return len(self.fix_flags)
+
+    def get_hexsha(self, index):
+        """Return the hexsha of the commit at index."""
+        start = index * OID_SIZE
+        return binascii.hexlify(self.oids[start:start + OID_SIZE])
+
+    def get_tree(self, index):
+        """Return the tree hexsha of the commit at index, None if unknown.
+        """
+        start = index * OID_SIZE
+        tree = self.trees[start:start + OID_SIZE]
+        if tree == NULL_OID:
+            return None
+        return binascii.hexlify(tree)
+
+    def get_index(self, hexsha):
+        """Return the index of a commit, None if not in the table."""
+        return self.index.get(binascii.unhexlify(hexsha))
+
+    def get_parents(self, index):
+        """Return the hexshas of the parents of the commit at index."""
+        if index in self.other_parents:
+            return self.other_parents[index]
+
+        first_parent = self.first_parents[index]
+        if first_parent < 0:
+            return ()
+        return (self.get_hexsha(first_parent),)
+
+    def is_fix(self, index):
+        """Return True if the commit at index is a fixing commit."""
+        return self.fix_flags[index] == 1
+
+    def get_size(self):
+        """Return the estimated size of the table in bytes."""
+        size = (sys.getsizeof(self.oids) + sys.getsizeof(self.trees) +
+                sys.getsizeof(self.first_parents) +
+                sys.getsizeof(self.parent_counts) +
+                sys.getsizeof(self.fix_flags) + sys.getsizeof(self.index) +
+                sys.getsizeof(self.other_parents))
+        # the binary oid keys of the index
+        size += len(self.index) * sys.getsizeof('\0' * OID_SIZE)
+
+        return size
+
+
+class CommitList(object):
+    """Sequence of CommitRecords, a view of a range of a CommitTable."""
+
+    def __init__(self, table, start=0, stop=None):
+        """Initialization, the view covers table[start:stop]."""
+        self.table = table
+        self.start = start
+        self.stop = len(table) if stop is None else stop
+
+    def __len__(self):
+        """Number of commits in the view."""
+        return max(0, self.stop - self.start)
+
+    def __iter__(self):
+        """Iterate the commits of the view, oldest first."""
+        table = self.table
+        for index in xrange(self.start, self.stop):
+            yield CommitRecord(table, index)
+
+    def __getitem__(self, key):
+        """Return a CommitRecord, or a CommitList for a slice."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('CommitList slices cannot have a step')
+            return CommitList(
+                self.table, self.start + start, self.start + max(start, stop))
+
+        length = len(self)
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError('CommitList index out of range')
+
+        return CommitRecord(self.table, self.start + key)
+
+    def __add__(self, other):
+        """Join two adjacent views of the same table."""
+        if isinstance(other, CommitList) and other.table is self.table:
+            if len(other) == 0:
+                return CommitList(self.table, self.start, self.stop)
+            if len(self) == 0:
+                return CommitList(self.table, other.start, other.stop)
+            if other.start == self.stop:
+                return CommitList(self.table, self.start, other.stop)
+
+        return list(self) + list(other)
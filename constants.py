@@ -10,6 +10,9 @@ RASPBERRYIO_REPO = 'raspberryio'
 DJANGO_REPO = 'django'
 AML = 'awesome-machine-learning'
 CSV_ROOT = os.path.join(BASE_DIR, 'fixcache', 'analysis_output')
+RESULTS_DB = os.path.join(CSV_ROOT, 'results.sqlite3')
+TRACE_ROOT = os.path.join(BASE_DIR, 'fixcache', 'traces')
+BENCHMARK_ROOT = os.path.join(BASE_DIR, 'fixcache', 'benchmarks')
 LOGFILE = os.path.join(BASE_DIR, 'fixcache', 'logs', 'fixcache2.log')
 CURRENT_VERSION = 5
 
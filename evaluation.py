@@ -2,27 +2,55 @@
 """Main analysis module."""
 import constants
 import os
-import csv
 import logging
 import datetime
+import json
 import daemon
 import argparse
 import repository
+import results
 from repository import WindowedRepository
+from classifier import get_classifier
+from backend import BACKEND_CHOICES
+from results import DEFAULT_WINDOW
+from timing import COLUMNS as TIMING_COLUMNS
 
 logger = logging.getLogger('fixcache_logger')
 
 
 def evaluate_repository(repo_name, cache_ratio, pre_fetch_size,
                         distance_to_fetch,
-                        version, **kwargs):
-    """Evaluate a repository and save the evaluation results."""
+                        version, window=DEFAULT_WINDOW, store=None,
+                        **kwargs):
+    """Evaluate a repository and save the evaluation results.
+
+    The window can be a list of cut points, in which case every window
+    without stored results is evaluated during a single replay. The rows
+    are streamed to a partial csv file per window while the horizon is
+    scored, an interrupted evaluation resumes it. The results are then
+    kept in the result store, for the head of the branch and the classifier
+    of the fixing commits, and the partial file becomes the csv file.
+    """
+    version = results.get_version_name(version)
+    dir_ = os.path.join(constants.CSV_ROOT, version, repo_name)
+
+    if not os.path.exists(dir_):
+        os.makedirs(dir_)
+
+    store = store or results.ResultStore()
+
+    if isinstance(window, (list, tuple)):
+        windows = window
+    else:
+        windows = [window]
+
     try:
         repo = WindowedRepository(
             repo_dir=constants.REPO_DICT[repo_name],
             cache_ratio=cache_ratio,
             pre_fetch_size=pre_fetch_size,
             distance_to_fetch=distance_to_fetch,
+            window=sorted(windows),
             **kwargs)
     except KeyError:
         print("Error: the requested repository does not exists." +
@@ -32,44 +60,83 @@ def evaluate_repository(repo_name, cache_ratio, pre_fetch_size,
         print(re)
         return
 
-    dir_ = os.path.join(
-        constants.CSV_ROOT, 'version_' + str(version), repo_name)
-
-    if not os.path.exists(dir_):
-        os.makedirs(dir_)
-
-    file_ = os.path.join(dir_, 'evaluate_%s_cr_%s_pfs_%s_dtf_%s.csv' % (
-        repo_name, cache_ratio, pre_fetch_size, distance_to_fetch))
-
-    file_metadata = os.path.join(
-        dir_,
-        'evaluate_%s_cr_%s_pfs_%s_dtf_%s_metadata.csv' % (
-            repo_name, cache_ratio, pre_fetch_size, distance_to_fetch))
-
-    if os.path.exists(file_) and os.path.exists(file_metadata):
+    with repo:
+        return _evaluate_windows(
+            repo, store, repo_name, version, dir_, windows, cache_ratio,
+            pre_fetch_size, distance_to_fetch)
+
+
+def _evaluate_windows(repo, store, repo_name, version, dir_, windows,
+                      cache_ratio, pre_fetch_size, distance_to_fetch):
+    files = {}
+    for w in windows:
+        file_, file_metadata, file_timing = results.get_evaluation_file_names(
+            dir_, repo_name, cache_ratio, pre_fetch_size, distance_to_fetch,
+            w)
+        evaluation = store.get_evaluation(
+            repo_name, version, cache_ratio, distance_to_fetch,
+            pre_fetch_size, w, branch=repo.branch, head=repo.head,
+            classifier=repo.classifier.name)
+        if evaluation is not None:
+            logger.info('Evaluation for window %s exists.' % (w,))
+            if not os.path.exists(file_):
+                store.export_evaluation_csv(evaluation, file_, file_metadata)
+        else:
+            files[w] = (file_, file_metadata, file_timing)
+
+    if len(files) == 0:
         logger.info('Evaluation exists.\nExit\n')
         return True
 
-    cache_size = repo.cache_size
-    commit_num = len(repo.commit_list) + len(repo.horizon_commit_list)
-    file_count = repo.file_count
-
-    values = repo.evaluate()
+    if len(files) < len(set(windows)):
+        repo.reset(window=sorted(files))
 
-    with open(file_metadata, 'wb') as out:
-        csv_out = csv.writer(out)
-        csv_out.writerow(['cache_size', 'commit_num', 'file_count'])
-        csv_out.writerow([cache_size, commit_num, file_count])
-
-    with open(file_, 'wb') as out:
-        csv_out = csv.writer(out)
-        csv_out.writerow(['counter', 'true_positive', 'false_positive',
-                          'true_negative', 'false_negative', 'file_count',
-                          'hexsha'])
-
-        for line in values:
-            csv_out.writerow(line)
+    metadata = {
+        'cache_size': repo.cache_size,
+        'commit_num': len(repo.commit_list) + len(repo.horizon_commit_list),
+        'file_count': repo.file_count,
+    }
 
+    writers = dict(
+        (w, results.EvaluationWriter(
+            file_ + '.partial', repo.head, branch=repo.branch,
+            classifier=repo.classifier.name))
+        for w, (file_, _, _) in files.iteritems())
+    try:
+        repo.evaluate_windows(writers)
+    finally:
+        for writer in writers.itervalues():
+            writer.close()
+
+    metadata.update(zip(TIMING_COLUMNS, repo.timer.get_row()))
+    summary = repo.timer.get_summary()
+    summary['repository'] = repo_name
+    summary['windows'] = sorted(files)
+
+    for w, (file_, file_metadata, file_timing) in files.iteritems():
+        writer = writers[w]
+        store.add_evaluation(
+            repo_name, version, cache_ratio, distance_to_fetch,
+            pre_fetch_size, w, metadata, writer.iter_rows(),
+            branch=repo.branch, head=repo.head,
+            classifier=repo.classifier.name)
+        store.export_evaluation_metadata_csv(
+            store.get_evaluation(
+                repo_name, version, cache_ratio, distance_to_fetch,
+                pre_fetch_size, w, branch=repo.branch,
+                classifier=repo.classifier.name),
+            file_metadata)
+        writer.finish(file_)
+
+        with open(file_timing, 'w') as out:
+            json.dump(summary, out, indent=2, sort_keys=True)
+
+        if repo.profiler is not None:
+            repo.profiler.write_csv(
+                os.path.splitext(file_)[0] + '_memory.csv')
+
+    logger.info("Evaluation timings: %s" % (
+        json.dumps(summary, sort_keys=True),))
     logger.info("Evaluation finished at %s\n" % (
         datetime.datetime.now(),))
 
@@ -78,10 +145,16 @@ def evaluate_repository(repo_name, cache_ratio, pre_fetch_size,
 
 def main(args):
     """Main entry."""
-    evaluate_repository(
-        repo_name=args.repository, pre_fetch_size=args.pfs,
-        distance_to_fetch=args.dtf, cache_ratio=args.cr,
-        version=constants.CURRENT_VERSION, branch=args.b)
+    store = results.ResultStore(args.db)
+    try:
+        evaluate_repository(
+            repo_name=args.repository, pre_fetch_size=args.pfs,
+            distance_to_fetch=args.dtf, cache_ratio=args.cr,
+            version=constants.CURRENT_VERSION, window=args.w, branch=args.b,
+            classifier=get_classifier(args.issues), backend=args.backend,
+            profile_interval=args.profile_memory, store=store)
+    finally:
+        store.close()
 
 
 parser = argparse.ArgumentParser(
@@ -93,6 +166,16 @@ parser.add_argument('--cr', '--cache_ratio', type=float, required=True)
 parser.add_argument('--pfs', '--pre_fetch_size', type=float, required=True)
 parser.add_argument('--dtf', '--distance_to_fetch', type=float, required=True)
 parser.add_argument('--b', '--branch', type=str, default='master')
+parser.add_argument('--w', '--window', type=float, nargs='+',
+                    default=[DEFAULT_WINDOW])
+parser.add_argument('--issues', type=str, default=None,
+                    help='file of bug issue ids, one per line')
+parser.add_argument('--backend', choices=BACKEND_CHOICES,
+                    default='gitpython')
+parser.add_argument('--profile_memory', type=int, default=None, metavar='N',
+                    help='sample the memory every N commits')
+parser.add_argument('--db', type=str, default=None,
+                    help='path of the result store, constants.RESULTS_DB')
 parser.add_argument('--logging', default='info')
 
 
@@ -0,0 +1,137 @@
+"""Events module, the typed events of a fixcache replay.
+
+Repository.iter_fixcache() replays the history as a stream of events,
+commit by commit, in the order they happen:
+
+    FileCreated, FileDeleted    a file appears in or leaves the FileSet
+    Hit, Miss                   a file changed by a fixing commit was, or
+                                was not, in the cache, a missed file is
+                                then brought into it
+    Prefetch                    files were brought into the cache
+    Eviction                    files were evicted to make room
+
+Every event carries the ordinal of its commit. Consumers fold the stream
+as it is produced, so a replay can be scored, written or stopped early
+without keeping per-run lists; the hit and miss counters of a Repository
+are an EventCounter.
+"""
+
+
+class Event(object):
+    """An event of a replay, at the commit with ordinal commit."""
+
+    __slots__ = ('commit',)
+
+    kind = 'event'
+
+    def __init__(self, commit):
+        """Initialization."""
+        self.commit = commit
+
+    def get_paths(self):
+        """Return the paths of the files of the event."""
+        return []
+
+    def __str__(self):
+        """String representation, the commit, kind and paths."""
+        return '%s %s %s' % (self.commit, self.kind,
+                             ' '.join(self.get_paths()))
+
+
+class FileEvent(Event):
+    """An event of a single file."""
+
+    __slots__ = ('file_',)
+
+    def __init__(self, commit, file_):
+        """Initialization."""
+        super(FileEvent, self).__init__(commit)
+        self.file_ = file_
+
+    def get_paths(self):
+        """Return the paths of the files of the event."""
+        return [self.file_.path]
+
+
+class CacheEvent(Event):
+    """An event of the cache, for several files at once."""
+
+    __slots__ = ('files',)
+
+    def __init__(self, commit, files):
+        """Initialization."""
+        super(CacheEvent, self).__init__(commit)
+        self.files = files
+
+    def get_paths(self):
+        """Return the paths of the files of the event."""
+        return [file_.path for file_ in self.files]
+
+
+class Hit(FileEvent):
+    """A file changed by a fixing commit was in the cache."""
+
+    __slots__ = ()
+
+    kind = 'hit'
+
+
+class Miss(FileEvent):
+    """A file changed by a fixing commit was not in the cache."""
+
+    __slots__ = ()
+
+    kind = 'miss'
+
+
+class FileCreated(FileEvent):
+    """A file was added to the FileSet."""
+
+    __slots__ = ()
+
+    kind = 'created'
+
+
+class FileDeleted(FileEvent):
+    """A file was removed from the FileSet."""
+
+    __slots__ = ()
+
+    kind = 'deleted'
+
+
+class Prefetch(CacheEvent):
+    """Files which were not in the cache were brought into it."""
+
+    __slots__ = ()
+
+    kind = 'prefetch'
+
+
+class Eviction(CacheEvent):
+    """Files were evicted from the cache."""
+
+    __slots__ = ()
+
+    kind = 'eviction'
+
+
+class EventCounter(object):
+    """Consumer counting the hits and misses of a replay."""
+
+    def __init__(self):
+        """Initialization."""
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def add(self, event):
+        """Count an event."""
+        if isinstance(event, Hit):
+            self.hit_count += 1
+        elif isinstance(event, Miss):
+            self.miss_count += 1
+
+    def add_multiple(self, events):
+        """Count several events."""
+        for event in events:
+            self.add(event)
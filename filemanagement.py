@@ -8,6 +8,7 @@ import logging
 import helper_functions
 from helper_functions import DeprecatedError
 import random
+import sys
 
 
 class IFilemanagementError(Exception):
@@ -49,12 +50,16 @@ class DistanceSetError(IFilemanagementError):
 class File(object):
     """File object used by the FileSet class.
 
-    Represents a file in the fixcache algorithms backend.
+    Represents a file in the fixcache algorithms backend. The file_id is a
+    small integer, assigned densely by the owning FileSet, used to index
+    the membership flags of caches. A File created outside of a FileSet
+    has no file_id, and cannot be added to a cache.
     """
 
-    def __init__(self, path, commit=0, line_count=0):
+    def __init__(self, path, commit=0, line_count=0, file_id=None):
         """File initialization."""
         try:
+            self.file_id = file_id
             self.path = path
             self.faults = 0
             self.changes = 0
@@ -68,6 +73,14 @@ class File(object):
         """File string representation."""
         return self.path
 
+    def __lt__(self, other):
+        """Files rank by file_id, when their ranking keys are equal.
+
+        Equality stays the identity, the order only breaks the ties of
+        ranked files the same way in every process.
+        """
+        return (self.file_id, self.path) < (other.file_id, other.path)
+
     @property
     def path(self):
         """The absolute path to a File in the repository."""
@@ -154,13 +167,16 @@ class FileSet:
     def __init__(self):
         """Initialization of the class."""
         self.files = {}
+        self.next_file_id = 0
 
     def get_or_create_file(self, file_path, commit_num=0, line_count=0):
         """Return the file by file path. If not present, create one."""
         created = True
         if file_path not in self.files:
             try:
-                f = File(file_path, commit=commit_num, line_count=line_count)
+                f = File(file_path, commit=commit_num, line_count=line_count,
+                         file_id=self.next_file_id)
+                self.next_file_id += 1
             except FileError as fe:
                 logging.warning(fe)
                 raise FileSetError("Error during calling get_file()")
@@ -179,9 +195,10 @@ class FileSet:
         return return_list
 
     def reset(self):
-        """Reset all the files in the set."""
-        for file_ in self.files:
-            file_.reset()
+        """Reset the set, files are recreated by the next analysis."""
+        del self.files
+        self.files = {}
+        self.next_file_id = 0
 
     def file_in(self, file_):
         """Check whether a file is present in the set."""
@@ -397,6 +414,14 @@ class DistanceSet(object):
             logging.warning(de)
             raise DistanceSetError("Error during add_occurrence()")
 
+    def iter_occurrences(self):
+        """Iterate (file, other file, occurrence), in both directions."""
+        for distance in self.distance_set:
+            occurrence = distance.get_occurrence()
+            file1, file2 = distance.files['file1'], distance.files['file2']
+            yield (file1, file2, occurrence)
+            yield (file2, file1, occurrence)
+
     def get_closest_files(self, file_, number, commit=None):
         """Given a file returns the closest files."""
         ds = self._get_distances_for_files(file_)
@@ -407,10 +432,34 @@ class DistanceSet(object):
 
         return [x[1] for x in closest_files]
 
+    def get_footprint(self):
+        """Return the number of distances, occurrences and their bytes.
+
+        The bytes are shallow sys.getsizeof() estimates.
+        """
+        occurrences = 0
+        size = (sys.getsizeof(self.distance_set) +
+                sys.getsizeof(self.distance_dict))
+        for key, distance in self.distance_dict.iteritems():
+            occurrences += len(distance.occurrence_list)
+            size += (
+                sys.getsizeof(key) + sys.getsizeof(distance) +
+                sys.getsizeof(distance.__dict__) +
+                sys.getsizeof(distance.files) +
+                sys.getsizeof(distance.occurrence_list))
+
+        return (len(self.distance_set), occurrences, size)
+
     def reset(self):
-        """Reset the distance set object."""
-        for distance in self.distance_set:
-            distance.reset()
+        """Reset the distance set object.
+
+        Distances point to File objects, which are recreated after a reset
+        of the FileSet, so every distance is dropped.
+        """
+        del self.distance_set
+        del self.distance_dict
+        self.distance_set = set()
+        self.distance_dict = {}
 
     def remove_files(self, files):
         """Remove distances associated with a file."""
@@ -422,3 +471,276 @@ class DistanceSet(object):
                 self.distance_set.discard(distance)
                 del self.distance_dict[distance_key]
                 del distance
+
+
+# counters kept per file by an ApproximateDistanceSet
+DEFAULT_CAPACITY = 32
+
+
+class ApproximateDistanceSet(object):
+    """A bounded memory approximation of the DistanceSet.
+
+    Every file keeps at most capacity counters of the files it changed
+    with, maintained by the space-saving algorithm: a file without a
+    counter replaces the file with the lowest count, and inherits that
+    count as its error. The frequent co-changes are kept, the memory is
+    bounded by capacity counters per file.
+
+    A counter keeps its count and the commits of its first and last
+    occurrence instead of every commit, so the occurrence up to a commit
+    is interpolated between them. The files holding a counter of a file
+    are indexed, so a deleted file only visits the sketches it is in.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """Initialization."""
+        if capacity < 1:
+            raise DistanceSetError('The capacity has to be positive')
+
+        self.capacity = capacity
+        # file -> {other file: [count, error, first commit, last commit]}
+        self.sketches = {}
+        # other file -> set of the files with a counter of it
+        self.owners = {}
+
+    def _add(self, file_, other, commit):
+        sketch = self.sketches.get(file_)
+        if sketch is None:
+            sketch = self.sketches[file_] = {}
+
+        counter = sketch.get(other)
+        if counter is not None:
+            if commit > counter[3]:
+                counter[0] += 1
+                counter[3] = commit
+            return
+
+        self.owners.setdefault(other, set()).add(file_)
+        if len(sketch) < self.capacity:
+            sketch[other] = [1, 0, commit, commit]
+            return
+
+        evicted = min(sketch, key=lambda f: sketch[f][0])
+        count = sketch.pop(evicted)[0]
+        self._discard_owner(evicted, file_)
+        sketch[other] = [count + 1, count, commit, commit]
+
+    def _discard_owner(self, other, file_):
+        owners = self.owners[other]
+        owners.discard(file_)
+        if len(owners) == 0:
+            del self.owners[other]
+
+    def add_occurrence(self, file1, file2, commit):
+        """Add occurrence between two files."""
+        if file1 is file2:
+            raise DistanceSetError(
+                "add_occurrence() arguments should be distinct files")
+        if commit < 0:
+            raise DistanceSetError("commit cannot be negative")
+
+        self._add(file1, file2, commit)
+        self._add(file2, file1, commit)
+
+    def _get_occurrence(self, counter, commit=None):
+        count, _, first, last = counter
+        if commit is None or commit >= last:
+            return count
+        elif commit < first:
+            return 0
+
+        return 1 + (count - 1) * (commit - first) // (last - first)
+
+    def get_occurrence(self, file1, file2, commit=None):
+        """Return the estimated occurrence between two files."""
+        counter = self.sketches.get(file1, {}).get(file2)
+        if counter is None:
+            return 0
+
+        return self._get_occurrence(counter, commit)
+
+    def iter_occurrences(self):
+        """Iterate (file, other file, estimated occurrence) of counters."""
+        for file_, sketch in self.sketches.iteritems():
+            for other, counter in sketch.iteritems():
+                yield (file_, other, counter[0])
+
+    def get_closest_files(self, file_, number, commit=None):
+        """Given a file returns the closest files."""
+        sketch = self.sketches.get(file_, {})
+
+        closest_files = helper_functions.get_top_elements(
+            [(self._get_occurrence(counter, commit), other)
+             for other, counter in sketch.iteritems()],
+            number)
+
+        return [x[1] for x in closest_files]
+
+    def get_counter_count(self):
+        """Return the number of counters kept."""
+        return sum(len(sketch) for sketch in self.sketches.itervalues())
+
+    def get_footprint(self):
+        """Return the number of counters, twice, and their bytes.
+
+        A counter stands for its occurrences. The bytes are shallow
+        sys.getsizeof() estimates.
+        """
+        count = self.get_counter_count()
+        size = sys.getsizeof(self.sketches) + sys.getsizeof(self.owners)
+        for sketch in self.sketches.itervalues():
+            size += sys.getsizeof(sketch)
+        for owners in self.owners.itervalues():
+            size += sys.getsizeof(owners)
+        # the counter lists, with four small integers
+        size += count * sys.getsizeof([0, 0, 0, 0])
+
+        return (count, count, size)
+
+    def reset(self):
+        """Reset the distance set object, dropping every counter."""
+        del self.sketches
+        del self.owners
+        self.sketches = {}
+        self.owners = {}
+
+    def remove_files(self, files):
+        """Remove the counters associated with files."""
+        for file_ in files:
+            for other in self.sketches.pop(file_, {}):
+                self._discard_owner(other, file_)
+            for owner in self.owners.pop(file_, ()):
+                del self.sketches[owner][file_]
+
+
+# commits after which a co-change weighs half in a DecayedDistanceSet
+DEFAULT_HALF_LIFE = 100
+
+
+class DecayedDistanceSet(object):
+    """A DistanceSet of exponentially decayed co-change weights.
+
+    Every pair of files keeps a single weight and the commit of its last
+    update instead of the list of its occurrences. A co-change at commit c
+    decays the weight to c and adds 1, so the weight halves every
+    half_life commits without a co-change. Updates and lookups are O(1),
+    and ranking the neighbours of a file scans only those neighbours.
+
+    Without the history, the weight before the last update of a pair is
+    unknown: the closest files are ranked by the weights as of the latest
+    commit added, whatever the commit asked for.
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE):
+        """Initialization."""
+        if half_life <= 0:
+            raise DistanceSetError('The half life has to be positive')
+
+        self.half_life = half_life
+        self.decay = 0.5 ** (1.0 / half_life)
+        # file -> {other file: [weight, last commit]}, the lists are
+        # shared by both files of a pair
+        self.weights = {}
+        self.commit = 0
+
+    def _decayed(self, weight, last, commit):
+        if commit is None or commit <= last:
+            return weight
+        return weight * self.decay ** (commit - last)
+
+    def add_occurrence(self, file1, file2, commit):
+        """Add occurrence between two files."""
+        if file1 is file2:
+            raise DistanceSetError(
+                "add_occurrence() arguments should be distinct files")
+        if commit < 0:
+            raise DistanceSetError("commit cannot be negative")
+
+        neighbours = self.weights.get(file1)
+        if neighbours is None:
+            neighbours = self.weights[file1] = {}
+
+        pair = neighbours.get(file2)
+        if pair is None:
+            pair = neighbours[file2] = [1.0, commit]
+            self.weights.setdefault(file2, {})[file1] = pair
+        else:
+            pair[0] = self._decayed(pair[0], pair[1], commit) + 1
+            pair[1] = max(pair[1], commit)
+
+        if commit > self.commit:
+            self.commit = commit
+
+    def get_occurrence(self, file1, file2, commit=None):
+        """Return the weight between two files, decayed to commit."""
+        pair = self.weights.get(file1, {}).get(file2)
+        if pair is None:
+            return 0
+
+        return self._decayed(pair[0], pair[1], commit)
+
+    def iter_occurrences(self):
+        """Iterate (file, other file, weight), in both directions."""
+        for file_, neighbours in self.weights.iteritems():
+            for other, pair in neighbours.iteritems():
+                yield (file_, other, self._decayed(
+                    pair[0], pair[1], self.commit))
+
+    def get_closest_files(self, file_, number, commit=None):
+        """Given a file returns the closest files."""
+        neighbours = self.weights.get(file_, {})
+
+        closest_files = helper_functions.get_top_elements(
+            [(self._decayed(pair[0], pair[1], self.commit), other)
+             for other, pair in neighbours.iteritems()],
+            number)
+
+        return [x[1] for x in closest_files]
+
+    def get_pair_count(self):
+        """Return the number of pairs of files with a weight."""
+        return sum(len(x) for x in self.weights.itervalues()) // 2
+
+    def get_footprint(self):
+        """Return the number of pairs, twice, and their bytes.
+
+        A weight stands for the occurrences of a pair. The bytes are
+        shallow sys.getsizeof() estimates.
+        """
+        count = self.get_pair_count()
+        size = sys.getsizeof(self.weights)
+        for neighbours in self.weights.itervalues():
+            size += sys.getsizeof(neighbours)
+        # the [weight, last commit] lists, shared by both files of a pair
+        size += count * (sys.getsizeof([0.0, 0]) + sys.getsizeof(0.0))
+
+        return (count, count, size)
+
+    def reset(self):
+        """Reset the distance set object, dropping every weight."""
+        del self.weights
+        self.weights = {}
+        self.commit = 0
+
+    def remove_files(self, files):
+        """Remove the weights associated with files."""
+        for file_ in files:
+            for other in self.weights.pop(file_, {}):
+                neighbours = self.weights.get(other)
+                if neighbours is not None:
+                    neighbours.pop(file_, None)
+
+
+DISTANCE_CHOICES = ['exact', 'approximate', 'decayed']
+
+
+def get_distance_set(name='exact', **kwargs):
+    """Return an empty distance set of the named kind."""
+    if name == 'exact':
+        return DistanceSet()
+    elif name == 'approximate':
+        return ApproximateDistanceSet(**kwargs)
+    elif name == 'decayed':
+        return DecayedDistanceSet(**kwargs)
+
+    raise DistanceSetError('Unknown distance set %s' % (name,))
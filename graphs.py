@@ -10,6 +10,8 @@ from evaluation import evaluate_repository
 
 import constants
 
+import results
+
 from constants import REPO_DATA, version_color, CURRENT_VERSION
 # from graph_data import plot_1_data
 
@@ -42,8 +44,27 @@ def _file_to_csv_by_name(version, repo_name, file_):
         pass
 
 
+def _store_to_csv(version, repo_name, analysis, branch='master', **kwargs):
+    """Get the stored rows of the last head of an analysis, None if none."""
+    store = results.ResultStore()
+    try:
+        rows = store.get_analysis(
+            repo_name, version, analysis, branch=branch, latest=True,
+            **kwargs)
+    finally:
+        store.close()
+
+    return rows or None
+
+
 def _file_to_csv(version, repo_name, pre_fetch_size, distance_to_fetch):
-    """Read file into csv type python object."""
+    """Read the rows of an analysis, from the store or its csv file."""
+    rows = _store_to_csv(
+        version, repo_name, 'cache_ratio_progressive',
+        distance_to_fetch=distance_to_fetch, pre_fetch_size=pre_fetch_size)
+    if rows is not None:
+        return rows
+
     file_ = ('analyse_by_cache_ratio_progressive_dtf_' +
              str(distance_to_fetch) + '_pfs_' + str(pre_fetch_size) + '.csv')
 
@@ -53,8 +74,8 @@ def _file_to_csv(version, repo_name, pre_fetch_size, distance_to_fetch):
 
 def calc_hit_rate(x, y):
     """Calculate hit rate based on hit and miss value."""
-    lookups = int(x) + int(y)
-    hit_rate = float(x) / float(lookups)
+    lookups = float(x) + float(y)
+    hit_rate = float(x) / lookups
     return hit_rate
 
 
@@ -122,10 +143,19 @@ def plot_one(repo_name, pre_fetch_size,
     csv_reader = _file_to_csv(version=version, repo_name=repo_name,
                               pre_fetch_size=pre_fetch_size,
                               distance_to_fetch=distance_to_fetch)
-    csv_random_file = _file_to_csv_by_name(
-        'random',
-        repo_name,
-        'analyse_by_random_cache.csv')
+    csv_random_file = (
+        _store_to_csv('random', repo_name, 'random_cache_analytic') or
+        _store_to_csv('random', repo_name, 'random_cache'))
+    if csv_random_file is None:
+        csv_random_file = _file_to_csv_by_name(
+            'random',
+            repo_name,
+            'analyse_by_random_cache_analytic.csv')
+    if csv_random_file is None:
+        csv_random_file = _file_to_csv_by_name(
+            'random',
+            repo_name,
+            'analyse_by_random_cache.csv')
 
     if csv_reader is None:
         return
@@ -151,6 +181,15 @@ def plot_one(repo_name, pre_fetch_size,
         random_hit_rate = get_column(csv_random_file, 'hit_rate')
         ax.plot(x, random_hit_rate, color='blue', linewidth=2)
 
+        if csv_random_file[0].get('hits_low') not in (None, ''):
+            lookups = [float(r['hits']) + float(r['misses'])
+                       for r in csv_random_file]
+            low = [float(r['hits_low']) / l
+                   for r, l in zip(csv_random_file, lookups)]
+            high = [float(r['hits_high']) / l
+                    for r, l in zip(csv_random_file, lookups)]
+            ax.fill_between(x, low, high, color='blue', alpha=0.2)
+
     plt.show()
 
 
@@ -205,10 +244,13 @@ def plot_all(repo_name, version):
 
 def plot_fixed_cache_ratio(repo_name, cache_ratio, version, fig_name=None):
     """Fixed cache rate plot, variable pfs and dtf."""
-    csv_reader = csv_reader = _file_to_csv_by_name(
-        version,
-        repo_name,
-        'analyse_by_fixed_cache_%s.csv' % (cache_ratio,))
+    csv_reader = _store_to_csv(
+        version, repo_name, 'fixed_cache_ratio', cache_ratio=cache_ratio)
+    if csv_reader is None:
+        csv_reader = _file_to_csv_by_name(
+            version,
+            repo_name,
+            'analyse_by_fixed_cache_%s.csv' % (cache_ratio,))
 
     if csv_reader is None:
         return
@@ -356,10 +398,24 @@ def _get_statistics(repo_name, cache_ratio, pre_fetch_size, distance_to_fetch,
                            float(pre_fetch_size), float(distance_to_fetch),
                            version, branch=branch, **kwargs):
 
-        csv_reader = _file_to_csv_by_name(
-            version=version, repo_name=repo_name,
-            file_='evaluate_%s_cr_%s_pfs_%s_dtf_%s.csv' % (
-                repo_name, cache_ratio, pre_fetch_size, distance_to_fetch))
+        store = results.ResultStore()
+        try:
+            evaluation = store.get_evaluation(
+                repo_name, version, cache_ratio, distance_to_fetch,
+                pre_fetch_size, branch=branch)
+            csv_reader = None
+            if evaluation is not None:
+                csv_reader = store.get_evaluation_rows(evaluation['id'])
+        finally:
+            store.close()
+
+        if csv_reader is None:
+            csv_reader = _file_to_csv_by_name(
+                version=version, repo_name=repo_name,
+                file_='evaluate_%s_cr_%s_pfs_%s_dtf_%s.csv' % (
+                    repo_name, cache_ratio, pre_fetch_size,
+                    distance_to_fetch))
+
         true_positive = get_column(csv_reader, 'true_positive')[:n]
         false_positive = get_column(csv_reader, 'false_positive')[:n]
         true_negative = get_column(csv_reader, 'true_negative')[:n]
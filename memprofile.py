@@ -0,0 +1,180 @@
+"""Memprofile module, opt-in memory profiling of the fixcache replay.
+
+A MemoryProfiler samples the memory of the process every interval
+commits of a replay: the resident set size, its peak, and the traced
+allocations when tracemalloc is available. With every sample the
+footprint of the main structures of the repository is estimated, so the
+growth of the process can be attributed to the DistanceSet, the FileSet,
+the retained commits, the cache or the line index.
+
+Sizes are shallow sys.getsizeof() estimates, extrapolated from a sample
+of the objects for the FileSet.
+"""
+import csv
+import itertools
+import logging
+import resource
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+logger = logging.getLogger('fixcache_logger')
+
+COLUMNS = [
+    'run',
+    'commits',
+    'rss',
+    'peak_rss',
+    'traced',
+    'traced_peak',
+    'files',
+    'file_bytes',
+    'distances',
+    'occurrences',
+    'distance_bytes',
+    'retained_commits',
+    'commit_bytes',
+    'cache_files',
+    'line_origin_bytes']
+
+# objects measured to extrapolate the size of large collections
+SAMPLE_SIZE = 100
+
+
+def get_rss():
+    """Return the resident set size in bytes, None if unknown."""
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            pages = int(statm.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+
+    return pages * resource.getpagesize()
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    # kilobytes everywhere else
+    return peak * 1024
+
+
+def _estimate(objects, count, size_of):
+    """Extrapolate the total size of count objects from the first ones."""
+    sample = list(itertools.islice(objects, SAMPLE_SIZE))
+    if len(sample) == 0:
+        return 0
+
+    return sum(size_of(x) for x in sample) * count // len(sample)
+
+
+def _file_size(file_):
+    return (sys.getsizeof(file_) + sys.getsizeof(file_.__dict__) +
+            sys.getsizeof(file_.path))
+
+
+def get_footprint(repo):
+    """Return the estimated footprint of the structures of a repository."""
+    files = repo.file_set.files
+    footprint = {
+        'files': len(files),
+        'file_bytes': sys.getsizeof(files) + _estimate(
+            files.itervalues(), len(files), _file_size),
+    }
+
+    distances = getattr(repo, 'file_distances', None)
+    distance_count, occurrences, distance_bytes = 0, 0, 0
+    if distances is not None:
+        distance_count, occurrences, distance_bytes = \
+            distances.get_footprint()
+    footprint['distances'] = distance_count
+    footprint['occurrences'] = occurrences
+    footprint['distance_bytes'] = distance_bytes
+
+    footprint['retained_commits'] = len(repo.commit_table)
+    footprint['commit_bytes'] = repo.commit_table.get_size()
+
+    cache = getattr(repo, 'cache', None)
+    footprint['cache_files'] = len(cache.file_set) if cache else 0
+
+    line_origins = getattr(repo, 'line_origins', None)
+    line_origin_bytes = 0
+    if line_origins is not None:
+        for origins in line_origins.origins.itervalues():
+            line_origin_bytes += sys.getsizeof(origins)
+    footprint['line_origin_bytes'] = line_origin_bytes
+
+    return footprint
+
+
+class MemoryProfiler(object):
+    """Time series of the memory of a repository replay."""
+
+    def __init__(self, interval=1000):
+        """Initialization, a sample is taken every interval commits."""
+        if interval < 1:
+            raise ValueError('The profiling interval has to be positive')
+
+        self.interval = interval
+        self.samples = []
+        self.run = 0
+        self.commits = 0
+
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def new_run(self):
+        """Start the samples of a new replay, after a reset."""
+        if self.commits > 0:
+            self.run += 1
+        self.commits = 0
+
+    def commit(self, repo):
+        """Count a replayed commit, sampling every interval commits."""
+        self.commits += 1
+        if self.commits % self.interval == 0:
+            self.sample(repo)
+
+    def finish(self, repo):
+        """Take the last sample of a replay, unless just taken."""
+        if len(self.samples) > 0:
+            last = self.samples[-1]
+            if (last['run'], last['commits']) == (self.run, self.commits):
+                return last
+
+        return self.sample(repo)
+
+    def sample(self, repo):
+        """Record the memory of the process and footprint of repo."""
+        traced, traced_peak = None, None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            traced, traced_peak = tracemalloc.get_traced_memory()
+
+        row = {
+            'run': self.run,
+            'commits': self.commits,
+            'rss': get_rss(),
+            'peak_rss': get_peak_rss(),
+            'traced': traced,
+            'traced_peak': traced_peak,
+        }
+        row.update(get_footprint(repo))
+        self.samples.append(row)
+
+        logger.debug('Memory after %s commits: %s' % (self.commits, row))
+
+        return row
+
+    def write_csv(self, path):
+        """Write the samples as a csv file."""
+        with open(path, 'wb') as out:
+            csv_out = csv.writer(out)
+            csv_out.writerow(COLUMNS)
+            for row in self.samples:
+                csv_out.writerow([row[column] for column in COLUMNS])
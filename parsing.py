@@ -11,83 +11,117 @@ def important_line(line):
     return True
 
 
-def _get_diff_deleted_line_counter(line):
-        """Parse a diff line, to get the deleted lines in that diff.
-
-        If the line parsed isn't a delete line, returns None.
-        """
-        regex1 = r'@@\s-(?P<start_line>\d+),(?P<line_num>\d+)'
-        regex2 = r'@@\s-(?P<start_line>\d+),'
-        regex3 = r'@@\s-(?P<start_line>\d+) +'
-        pattern1 = re.compile(regex1)
-        pattern2 = re.compile(regex2)
-        pattern3 = re.compile(regex3)
-
-        # check first for pattern with line number, then without it
-        match1 = pattern1.match(line)
-        match2 = pattern2.match(line)
-        match3 = pattern3.match(line)
-        ret_lines = (None, None)
-        if match1 is not None:
-            start_line = int(match1.group("start_line"))
-            line_num = int(match1.group("line_num"))
+# old start, old length, new start, new length; a missing length means 1
+_HUNK_HEADER = re.compile(
+    r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', re.M)
+
+
+def get_hunks_from_diff(patch):
+    """Yield (old_start, old_len, new_start, new_len) of every hunk.
+
+    The patch is the raw text of a unified diff, only the hunk headers are
+    read.
+    """
+    for match in _HUNK_HEADER.finditer(patch):
+        old_start, old_len, new_start, new_len = match.groups()
+        yield (int(old_start),
+               1 if old_len is None else int(old_len),
+               int(new_start),
+               1 if new_len is None else int(new_len))
+
+
+def _merge_interval(intervals, start, length):
+    """Append a (start, length) interval, merging it with the last one."""
+    if len(intervals) > 0:
+        last_start, last_length = intervals[-1]
+        if last_start + last_length == start:
+            intervals[-1] = (last_start, last_length + length)
+            return
+
+    intervals.append((start, length))
+
+
+def _get_hunk_deleted_intervals(patch, pos, end, counter, intervals):
+    """Scan the body of a hunk with context lines for deleted lines."""
+    while pos < end:
+        line_end = patch.find('\n', pos, end)
+        if line_end == -1:
+            line_end = end
+        marker = patch[pos:pos + 1]
+        if marker == '-':
+            _merge_interval(intervals, counter, 1)
+            counter += 1
+        elif marker == ' ':
+            counter += 1
+        pos = line_end + 1
+
+
+def get_deleted_intervals_from_diff(patch, unified=0):
+    """Return the deleted lines of a diff as merged (start, length) tuples.
+
+    Line numbers are 0-indexed lines of the old file. The patch is the raw
+    text of a unified diff, with unified lines of context, None if unknown.
+    Without context every hunk header holds its deleted lines, so the hunk
+    bodies are not read at all.
+    """
+    intervals = []
+    if unified == 0:
+        for old_start, old_len, new_start, new_len in \
+                get_hunks_from_diff(patch):
+            if old_len > 0:
+                _merge_interval(intervals, old_start - 1, old_len)
+
+        return intervals
+
+    matches = list(_HUNK_HEADER.finditer(patch))
+    for i, match in enumerate(matches):
+        if i + 1 < len(matches):
+            end = matches[i + 1].start()
+        else:
+            end = len(patch)
+        _get_hunk_deleted_intervals(
+            patch, patch.find('\n', match.end()) + 1, end,
+            int(match.group(1)) - 1, intervals)
 
-            ret_lines = (start_line, line_num,)
+    return intervals
 
-        elif match2 is not None:
-            start_line = int(match2.group("start_line"))
 
-            ret_lines = (start_line, 0)
+_DELETED_LINE = re.compile(r'^-(.*)$', re.M)
 
-        elif match3 is not None:
-            start_line = int(match3.group("start_line"))
 
-            ret_lines = (start_line, 0)
+def get_deleted_line_text(patch):
+    """Return the text of the deleted lines of a diff, in file order.
 
-        return ret_lines
+    The patch is the raw text of a unified diff without file headers.
+    """
+    return _DELETED_LINE.findall(patch)
 
 
 def get_deleted_lines_from_diff(diff_lines):
     """Return deleted line numbers from a diff list."""
-    if len(diff_lines) < 3:
-        return []
-    counter, _ = _get_diff_deleted_line_counter(diff_lines[2])
-    if counter is None:
-        return []
-    counter -= 1
+    intervals = get_deleted_intervals_from_diff(
+        '\n'.join(diff_lines), unified=None)
     line_list = []
-    for line in diff_lines[3:]:
-        if line.startswith('-'):
-            line_list.append(counter)
-            counter += 1
-        elif line.startswith('+'):
-            pass
-        elif line.startswith("@@"):
-            counter, _ = _get_diff_deleted_line_counter(line)
-            counter -= 1
-        else:
-            counter += 1
-
-        # print counter, ' ', line
+    for start, length in intervals:
+        line_list += range(start, start + length)
 
     return line_list
 
 
-def is_fix_commit(message):
-        """Return True if commit object is flagged as fixing."""
-        m = message
-        regexes = [
-            r'defect(s)?',
-            r'patch(ing|es|ed)?',
-            r'bug(s|fix(es)?)?',
-            r'(re)?fix(es|ed|ing|age\s?up(s)?)?',
-            r'debug(ged)?',
-            r'\#\d+',
-            r'back\s?out',
-            r'revert(ing|ed)?'
-        ]
-        for r in regexes:
-            if re.search(r, m) is not None:
-                return True
+FIX_REGEXES = [
+    r'defect(s)?',
+    r'patch(ing|es|ed)?',
+    r'bug(s|fix(es)?)?',
+    r'(re)?fix(es|ed|ing|age\s?up(s)?)?',
+    r'debug(ged)?',
+    r'\#\d+',
+    r'back\s?out',
+    r'revert(ing|ed)?'
+]
 
-        return False
+_FIX_COMMIT = re.compile('|'.join('(?:%s)' % (r,) for r in FIX_REGEXES))
+
+
+def is_fix_commit(message):
+    """Return True if commit object is flagged as fixing."""
+    return _FIX_COMMIT.search(message) is not None
@@ -0,0 +1,90 @@
+"""Provenance module, tracking the introducing commit of every line.
+
+The LineOriginIndex keeps, for every file, a compact array holding the
+ordinal of the commit which introduced each of its lines. Applying the hunks
+of every diff in history order keeps it up to date, so the introducing
+commits of deleted lines are read from the index instead of running git
+blame on the whole file.
+
+The replay skips merge commits, the lines of both branches are spliced in
+history order, so after conflicting merges the index is approximate.
+
+The index is not persisted: it is rebuilt by every replay, alongside the
+cache and the distances it is read with.
+"""
+import array
+import logging
+
+
+class LineOriginIndex(object):
+    """Per file arrays of line introducing commit ordinals."""
+
+    typecode = 'i'
+
+    def __init__(self):
+        """Initialization."""
+        self.origins = {}
+
+    def _new_lines(self, ordinal, line_count):
+        return array.array(self.typecode, [ordinal]) * line_count
+
+    def add_file(self, path, line_count, ordinal):
+        """Add a file whose lines were all introduced by one commit."""
+        self.origins[path] = self._new_lines(ordinal, line_count)
+
+    def remove_file(self, path):
+        """Remove a file from the index."""
+        self.origins.pop(path, None)
+
+    def rename_file(self, old_path, new_path):
+        """Move the lines of a file to its new path."""
+        if old_path in self.origins:
+            self.origins[new_path] = self.origins.pop(old_path)
+
+    def apply_hunks(self, path, hunks, ordinal):
+        """Splice the hunks of a diff into the lines of a file.
+
+        The hunks are (old_start, old_len, new_start, new_len) tuples, as
+        given by parsing.get_hunks_from_diff(), in file order. Added lines
+        are attributed to the commit with the given ordinal.
+        """
+        origins = self.origins.get(path)
+        if origins is None:
+            origins = self._new_lines(ordinal, 0)
+            self.origins[path] = origins
+
+        offset = 0
+        for old_start, old_len, new_start, new_len in hunks:
+            if old_len == 0:
+                # pure insertion after old_start
+                pos = old_start + offset
+            else:
+                pos = old_start - 1 + offset
+
+            if pos > len(origins):
+                logging.debug('Line index of %s is out of date' % (path,))
+                pos = len(origins)
+
+            origins[pos:pos + old_len] = self._new_lines(ordinal, new_len)
+            offset += new_len - old_len
+
+    def get_origins(self, path, intervals):
+        """Return the introducing commit ordinals of (start, length) lines.
+
+        Lines unknown to the index are None.
+        """
+        origins = self.origins.get(path)
+        if origins is None:
+            origins = self._new_lines(0, 0)
+
+        ordinals = []
+        for start, length in intervals:
+            known = origins[start:start + length].tolist()
+            ordinals += known + [None] * (length - len(known))
+
+        return ordinals
+
+    def reset(self):
+        """Reset the index, dropping every file."""
+        del self.origins
+        self.origins = {}
@@ -5,15 +5,23 @@ This class is responsible for running the fixcache algorithm
 for a given git repository, which was cloned form GitHub.
 """
 import parsing
+import backend as backend_module
 import cache
+import classifier as classifier_module
+import commits as commits_module
 import filemanagement as fm
-import git
 import logging
 import itertools
+import math
 import os
 import argparse
 import constants
+import events as events_module
 import helper_functions
+import memprofile
+import provenance
+import snapshot
+import timing
 
 
 logger = logging.getLogger('fixcache_logger')
@@ -32,79 +40,192 @@ class RepositoryError(Exception):
 
 
 class RepositoryMixin(object):
-    """Repository mixin."""
+    """Repository mixin.
+
+    The history is read through a HistoryBackend. The backend is either
+    given, or named and opened on the clone of repo_dir under
+    constants.REPO_DIR, GitPython by default. The fixing commits are
+    those of the classifier, a RegexClassifier by default. With a
+    profile_interval, the memory is sampled every profile_interval commits
+    of a replay.
+
+    A backend opened by the repository is closed by close(), or when
+    leaving the repository used as a context manager. A given backend is
+    left to its owner.
+    """
 
-    def __init__(self, repo_dir, cache_ratio=0.1, branch='master'):
+    def __init__(self, repo_dir, cache_ratio=0.1, branch='master',
+                 classifier=None, backend=None, profile_interval=None):
         """Init."""
         self.file_set = fm.FileSet()
         self.cache_ratio = cache_ratio
         self.hit_count = 0
         self.miss_count = 0
         self.repo_dir = repo_dir
+        self.branch = branch
+        self.timer = timing.PhaseTimer()
+        self.profiler = None
+        if profile_interval is not None:
+            self.profiler = memprofile.MemoryProfiler(profile_interval)
+
+        self._owns_backend = backend is None or isinstance(
+            backend, basestring)
+        if self._owns_backend:
+            backend = backend_module.get_backend(
+                backend or 'gitpython',
+                os.path.join(constants.REPO_DIR, repo_dir))
+        self.backend = backend
+        if classifier is None:
+            classifier = classifier_module.RegexClassifier()
+        self.classifier = classifier
+
+        # tree listings and line counts by tree oid, the hexsha for trees
+        # of unknown oid
+        self.tree_files = {}
+        self.line_counts = {}
 
-        repo_full_path = os.path.join(constants.REPO_DIR, repo_dir)
-        self.repo = git.Repo(repo_full_path)
-        assert not self.repo.bare
-        self.commit_list = list(reversed(
-            list(self.repo.iter_commits(branch))))
-
-        self.file_count = self._get_file_count(self.commit_list[-1])
+        try:
+            self._init_commit_table(branch, classifier)
+            self.file_count = self._get_file_count(self.commit_list[-1])
+        except:
+            self.close()
+            raise
         self.cache_size = int(self.cache_ratio * float(self.file_count))
 
-        # initializing commit hash to order mapping
-        self.commit_order = {}
-        self._init_commit_order()
+    def close(self):
+        """Close the backend, if opened by the repository."""
+        if self._owns_backend:
+            self.backend.close()
 
-    def _init_commit_order(self):
-        commit_counter = 0
-        for commit in self.commit_list:
-            logger.debug('Initializing commit %s' % (commit))
-            self.commit_order[commit.hexsha] = commit_counter
-            commit_counter += 1
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _init_commit_table(self, branch, classifier):
+        """Classify the history once and keep it as a CommitTable.
+
+        The verdicts are cached by hexsha in a trace, only the fix flags
+        are kept in the table.
+        """
+        history = self.backend.iter_commits(branch)
+
+        trace_path = None
+        if self.backend.persistent:
+            trace_path = classifier_module.get_trace_path(
+                self.repo_dir, classifier)
+        fix_verdicts = classifier_module.VerdictCache(classifier, trace_path)
+        fix_verdicts.classify_multiple(history)
+
+        self.commit_table = commits_module.CommitTable.from_commits(
+            history, fix_verdicts.is_fix)
+        self.commit_list = commits_module.CommitList(self.commit_table)
+
+    @property
+    def head(self):
+        """The hexsha of the newest commit of the branch."""
+        return self.commit_table.get_hexsha(len(self.commit_table) - 1)
+
+    def _is_fix_commit(self, commit):
+        return self.commit_table.is_fix(commit.index)
 
     def _get_file_count(self, commit):
         return len(self._get_commit_tree_files(commit))
 
     def _get_commit_tree_files(self, commit):
-        """Retrn a list of blobs for a given commit.
+        """Return the list of blobs of a commit, listed once per tree.
         """
-        file_list = []
-        for item in commit.tree.traverse():
-            if item.type == 'blob':
-                # probably not the best way, as O(n^2) for the function
-                file_list.append(item.path)
+        key = commit.tree or commit.hexsha
+        try:
+            return self.tree_files[key]
+        except KeyError:
+            files = tuple(self.backend.get_tree_files(commit.hexsha))
+            self.tree_files[key] = files
+            return files
 
-        return file_list
+    def _get_line_counts(self, commit):
+        """Return the line counts of every file of a commit.
 
-    def _get_line_count(self, file_, commit):
-        line_count = 0
-        for commit, lines in self.repo.blame(commit, file_):
-            line_count += len(lines)
+        The blobs are counted in bulk once per tree, the counts of the tree
+        are kept in a trace file of persistent backends.
+        """
+        key = commit.tree or commit.hexsha
+        if key in self.line_counts:
+            return self.line_counts[key]
+
+        files = self._get_commit_tree_files(commit)
+        trace_path = None
+        counts = None
+        if self.backend.persistent:
+            trace_path = os.path.join(
+                constants.TRACE_ROOT, self.repo_dir,
+                'line_counts_%s.txt' % (key,))
+            if os.path.exists(trace_path):
+                counts = backend_module.load_line_counts(trace_path)
+                if not set(files) <= set(counts):
+                    counts = None
+
+        if counts is None:
+            logger.debug('Counting lines of %s files' % (len(files),))
+            counts = self.backend.get_line_counts(commit.hexsha, files)
+            if trace_path is not None:
+                backend_module.save_line_counts(trace_path, counts)
+
+        self.line_counts[key] = counts
+        return counts
+
+    def cache_traces(self):
+        """Write the trace caches of persistent backends.
+
+        The verdicts are cached when the repository is opened, the line
+        counts of the root commits here. The commits and their numstats are
+        not cached, they are read from the backend by every run. Returns
+        the number of root commits.
+        """
+        roots = [c for c in self.commit_list if len(c.parents) == 0]
+        for commit in roots:
+            self._get_line_counts(commit)
 
-        return line_count
+        return len(roots)
 
 
 class RandomRepository(RepositoryMixin):
-    """Repository implementing random behavior."""
+    """Repository implementing random behavior.
+
+    Every replay also records the number of existing files and the number
+    of changed files at each fix commit, in fix_events. These are enough to
+    compute the expected hit count of a random cache of any size
+    analytically, see get_expected_hits().
+    """
 
     def __init__(self, *args, **kwargs):
         """Init."""
         super(RandomRepository, self).__init__(*args, **kwargs)
         self.distance_to_fetch = None
         self.pre_fetch_size = None
+        self.fix_events = []
 
-    def run_fixcache(self):
-        commit_num = float(len(self.commit_order))
-        """Run fixcache for RandomRepository."""
+    def run_fixcache(self, sampled=True):
+        """Run fixcache for RandomRepository.
+
+        Without sampled, only fix_events are recorded: no random cache is
+        drawn, and the hits and misses are left to get_expected_hits().
+        """
+        commit_num = float(len(self.commit_table))
+        timer = self.timer
+        timer.start()
         for commit in self.commit_list:
-            percentage = 100 * self.commit_order[commit.hexsha] / commit_num
-            logger.debug('[%s%]Currently at %s' % (percentage, commit))
+            percentage = 100 * commit.index / commit_num
+            logger.debug('[%s]Currently at %s' % (int(percentage), commit))
             parents = commit.parents
+            fix = False
             if len(parents) == 1:
                 # return the list of tuples by file info
+                start = timer.clock()
                 f_info = self.file_set.get_and_update_multiple(
-                    git_stat=commit.stats.files,
-                    commit_num=self.commit_order[commit.hexsha])
+                    git_stat=self.backend.get_stats(commit),
+                    commit_num=commit.index)
                 files = [
                     x[1] for x in filter(
                         lambda x: x[0] == 'changed' or x[0] == 'created',
@@ -116,32 +237,81 @@ class RandomRepository(RepositoryMixin):
                 ]
 
                 self.file_set.remove_files(deleted_files)
-
-                if parsing.is_fix_commit(commit.message):
-                    random_file_set = self.file_set.get_random(self.cache_size)
-                    for file_ in files:
-                        if file_.path in random_file_set:
-                            self.hit_count += 1
-                        else:
-                            self.miss_count += 1
+                timer.add('stats', start)
+
+                fix = self._is_fix_commit(commit)
+                if fix:
+                    start = timer.clock()
+                    self.fix_events.append(
+                        (len(self.file_set.files), len(files)))
+                    if sampled:
+                        random_file_set = self.file_set.get_random(
+                            self.cache_size)
+                        for file_ in files:
+                            if file_.path in random_file_set:
+                                self.hit_count += 1
+                            else:
+                                self.miss_count += 1
+                    timer.add('cache', start)
 
             elif len(parents) == 0:
                 # initial commit
+                start = timer.clock()
                 files = self._get_commit_tree_files(commit)
+                line_counts = self._get_line_counts(commit)
                 files_to_add = []
                 for path in files:
-                    line_count = self._get_line_count(path, commit)
+                    line_count = line_counts[path]
                     created, file_ = self.file_set.get_or_create_file(
                         file_path=path, line_count=line_count)
                     files_to_add.append(file_)
+                timer.add('stats', start)
             else:
                 pass
 
+            timer.commit(fix)
+            if self.profiler is not None:
+                self.profiler.commit(self)
+        timer.stop()
+
+        if self.profiler is not None:
+            self.profiler.finish(self)
+
+    def get_expected_hits(self, cache_size):
+        """Return the expected hits, misses and the standard deviation.
+
+        At each fix commit the random cache is a uniform sample of the
+        existing files, so the number of hits is hypergeometric, and the
+        fix commits are independent of each other. Needs fix_events from a
+        previous run_fixcache().
+        """
+        hits = 0.0
+        lookups = 0
+        variance = 0.0
+        for live_count, changed_count in self.fix_events:
+            lookups += changed_count
+            if live_count == 0:
+                continue
+
+            size = min(cache_size, live_count)
+            p = size / float(live_count)
+            hits += changed_count * p
+            if live_count > 1:
+                variance += (changed_count * p * (1 - p) *
+                             (live_count - changed_count) /
+                             float(live_count - 1))
+
+        return (hits, lookups - hits, math.sqrt(variance))
+
     def reset(self, cache_ratio=None, **kwargs):
         """Reset the cache after each analysis."""
         self.hit_count = 0
         self.miss_count = 0
+        self.fix_events = []
         self.file_set.reset()
+        self.timer.reset()
+        if self.profiler is not None:
+            self.profiler.new_run()
 
         if cache_ratio is not None:
             self.cache_ratio = cache_ratio
@@ -156,20 +326,29 @@ class Repository(RepositoryMixin):
 
     def __init__(self, repo_dir, cache_ratio=0.1,
                  distance_to_fetch=0.1, branch='master',
-                 pre_fetch_size=0.1):
-        """Initalization the Repository variables."""
+                 pre_fetch_size=0.1, classifier=None,
+                 line_provenance=False, backend=None, profile_interval=None,
+                 distance=None):
+        """Initalization the Repository variables.
+
+        With line_provenance the introducing commits of deleted lines are
+        read from an incrementally maintained LineOriginIndex instead of
+        git blame. The distance is a distance set, or the name of one in
+        filemanagement.DISTANCE_CHOICES, the exact DistanceSet by default.
+        """
         try:
             super(Repository, self).__init__(
-                repo_dir, cache_ratio=cache_ratio, branch=branch)
-            self.file_distances = fm.DistanceSet()
-
-            # initializing commit hash to order mapping
-            self.cache = cache.Cache(self.cache_size)
-            self.distance_to_fetch = self._get_distance_to_fetch(
-                distance_to_fetch)
-            self.pre_fetch_size = self._get_pre_fetch_size(pre_fetch_size)
-            self._init_commit_order()
-        except git.exc.NoSuchPathError:
+                repo_dir, cache_ratio=cache_ratio, branch=branch,
+                classifier=classifier, backend=backend,
+                profile_interval=profile_interval)
+            try:
+                self._init_replay(distance, line_provenance,
+                                  distance_to_fetch, pre_fetch_size)
+            except:
+                self.close()
+                raise
+        except backend_module.BackendError as be:
+            logging.warning(be)
             raise RepositoryError(
                 "The path %s is not a valid repository" % (repo_dir))
         except ValueError as ve:
@@ -177,6 +356,21 @@ class Repository(RepositoryMixin):
             raise RepositoryError(
                 "Error occurred during Repository initalization")
 
+    def _init_replay(self, distance, line_provenance, distance_to_fetch,
+                     pre_fetch_size):
+        if distance is None or isinstance(distance, basestring):
+            distance = fm.get_distance_set(distance or 'exact')
+        self.file_distances = distance
+        if line_provenance:
+            self.line_origins = provenance.LineOriginIndex()
+        else:
+            self.line_origins = None
+
+        self.cache = cache.Cache(self.cache_size)
+        self.distance_to_fetch = self._get_distance_to_fetch(
+            distance_to_fetch)
+        self.pre_fetch_size = self._get_pre_fetch_size(pre_fetch_size)
+
     @property
     def cache_ratio(self):
         """Cache ratio controls the persentage of files to be in the cache."""
@@ -219,6 +413,11 @@ class Repository(RepositoryMixin):
         self.miss_count = 0
         self.file_distances.reset()
         self.file_set.reset()
+        self.timer.reset()
+        if self.profiler is not None:
+            self.profiler.new_run()
+        if self.line_origins is not None:
+            self.line_origins.reset()
 
         if cache_ratio is not None:
             self.cache_ratio = cache_ratio
@@ -237,91 +436,205 @@ class Repository(RepositoryMixin):
         self.cache.reset(self.cache_size)
 
     def run_fixcache(self):
-        """Run fixcache with the given variables."""
-        commit_num = float(len(self.commit_order))
-        for commit in self.commit_list:
-            percentage = 100 * self.commit_order[commit.hexsha] / commit_num
-            logger.debug('[%s]Currently at %s' % (int(percentage), commit))
-            parents = commit.parents
+        """Run fixcache with the given variables.
 
-            if len(parents) == 1:
-                # return the list of tuples by file info
-                f_info = self.file_set.get_and_update_multiple(
-                    git_stat=commit.stats.files,
-                    commit_num=self.commit_order[commit.hexsha])
-                changed_files = [
-                    x[1] for x in filter(lambda x: x[0] == 'changed', f_info)
-                ]
+        The hits and misses of the replay are counted by an EventCounter
+        consuming iter_fixcache().
+        """
+        counter = events_module.EventCounter()
+        for event in self.iter_fixcache():
+            counter.add(event)
 
-                deleted_files = [
-                    x[1] for x in filter(lambda x: x[0] == 'deleted', f_info)
-                ]
+        self.hit_count += counter.hit_count
+        self.miss_count += counter.miss_count
 
-                created_files = [
-                    x[1] for x in filter(lambda x: x[0] == 'created', f_info)
-                ]
+    def iter_fixcache(self):
+        """Run fixcache, yielding the events of every commit.
 
-                self._cleanup_files(deleted_files)
-
-                self._update_distance_set(
-                    created_files + changed_files, commit)
-
-                if parsing.is_fix_commit(commit.message):
-                    for file_ in changed_files:
-                        file_.fault(self.commit_order[commit.hexsha])
-                        if self.cache.file_in(file_):
-                            self.hit_count += 1
-                        else:
-                            deleted_line_dict = self._get_diff_deleted_lines(
-                                commit, parents[0])
-                            # print deleted_line_dict
-                            del_lines = deleted_line_dict[file_.path]
-                            self.miss_count += 1
-                            self.cache.add(file_)
-
-                            line_intr_c = self._get_line_introducing_commits(
-                                del_lines, file_.path, commit.parents[0])
-
-                            closest_file_set = []
-                            for c in line_intr_c:
-                                # get closest files is nlogk, so optimal
-                                cf = self.file_distances.get_closest_files(
-                                    file_,
-                                    self.distance_to_fetch,
-                                    self.commit_order[c.hexsha])
-                                closest_file_set += cf
-
-                            closest_file_set = list(set(closest_file_set))
-                            # there is no need for pre sorting, as already
-                            # fetchiing closest files
-                            self.cache.add_multiple(
-                                closest_file_set)
-
-                new_entity_pre_fetch = self._get_per_rev_pre_fetch(
-                    created_files, commit)
-
-                changed_entity_pre_fetch = self._get_per_rev_pre_fetch(
-                    changed_files, commit)
-
-                self.cache.add_multiple(new_entity_pre_fetch)
-                self.cache.add_multiple(changed_entity_pre_fetch)
-            elif len(parents) == 0:
-                # initial commit
-                files = self._get_commit_tree_files(commit)
-                files_to_add = []
-                for path in files:
-                    line_count = self._get_line_count(path, commit)
-                    created, file_ = self.file_set.get_or_create_file(
-                        file_path=path, line_count=line_count)
-                    if not created:
-                        file_.line_count = line_count
-                    files_to_add.append(file_)
-                self.cache.add_multiple(files_to_add)
+        The events of a commit are yielded once the commit is processed,
+        see the events module. The replay stops when the consumer stops
+        iterating.
+        """
+        self.timer.start()
+        try:
+            for commit in self.commit_list:
+                for event in self._process_commit(commit):
+                    yield event
+        finally:
+            self.timer.stop()
+
+        if self.profiler is not None:
+            self.profiler.finish(self)
+
+    def _process_commit(self, commit):
+        """Run fixcache for a single commit, in history order.
+
+        Returns the list of events of the commit.
+        """
+        commit_num = float(len(self.commit_table))
+        percentage = 100 * commit.index / commit_num
+        logger.debug('[%s]Currently at %s' % (int(percentage), commit))
+        parents = commit.parents
+        timer = self.timer
+        fix = False
+        events = []
+
+        if len(parents) == 1:
+            diffs = None
+            if self.line_origins is not None:
+                start = timer.clock()
+                diffs = self.backend.get_diffs(commit)
+                timer.add('diff', start)
+
+            # return the list of tuples by file info
+            start = timer.clock()
+            f_info = self.file_set.get_and_update_multiple(
+                git_stat=self.backend.get_stats(commit),
+                commit_num=commit.index)
+            changed_files = [
+                x[1] for x in filter(lambda x: x[0] == 'changed', f_info)
+            ]
+
+            deleted_files = [
+                x[1] for x in filter(lambda x: x[0] == 'deleted', f_info)
+            ]
+
+            created_files = [
+                x[1] for x in filter(lambda x: x[0] == 'created', f_info)
+            ]
+            timer.add('stats', start)
+
+            events += [events_module.FileCreated(commit.index, x)
+                       for x in created_files]
+            events += [events_module.FileDeleted(commit.index, x)
+                       for x in deleted_files]
+
+            self._cleanup_files(deleted_files)
+
+            start = timer.clock()
+            self._update_distance_set(
+                created_files + changed_files, commit)
+            timer.add('distance', start)
+
+            fix = self._is_fix_commit(commit)
+            if fix:
+                blames = {}
+                if self.line_origins is None:
+                    diffs, blames = self._blame_missing(
+                        commit, changed_files, diffs)
+                for file_ in changed_files:
+                    file_.fault(commit.index)
+                    if self.cache.file_in(file_):
+                        events.append(events_module.Hit(commit.index, file_))
+                    else:
+                        start = timer.clock()
+                        if diffs is None:
+                            diffs = self.backend.get_diffs(commit)
+                        diff = self._get_diffs_by_path(diffs)[file_.path]
+                        timer.add('diff', start)
+
+                        events.append(events_module.Miss(commit.index, file_))
+                        start = timer.clock()
+                        self.cache.add(file_)
+                        self._add_eviction(events, commit)
+                        timer.add('cache', start)
+
+                        line_intr_c = self._get_line_introducing_commits(
+                            diff, file_.path, commit.parents[0],
+                            blames.get(file_.path))
+
+                        start = timer.clock()
+                        closest_file_set = []
+                        for c in line_intr_c:
+                            # get closest files is nlogk, so optimal
+                            cf = self.file_distances.get_closest_files(
+                                file_,
+                                self.distance_to_fetch,
+                                c)
+                            closest_file_set += cf
+
+                        closest_file_set = list(set(closest_file_set))
+                        timer.add('closest_files', start)
+
+                        # there is no need for pre sorting, as already
+                        # fetchiing closest files
+                        start = timer.clock()
+                        self._prefetch(events, commit, closest_file_set)
+                        timer.add('cache', start)
+
+            start = timer.clock()
+            new_entity_pre_fetch = self._get_per_rev_pre_fetch(
+                created_files, commit)
+
+            changed_entity_pre_fetch = self._get_per_rev_pre_fetch(
+                changed_files, commit)
+
+            self._prefetch(events, commit, new_entity_pre_fetch)
+            self._prefetch(events, commit, changed_entity_pre_fetch)
+            timer.add('cache', start)
+
+            if self.line_origins is not None:
+                start = timer.clock()
+                self._update_line_origins(
+                    diffs, commit.index)
+                timer.add('blame', start)
+        elif len(parents) == 0:
+            # initial commit
+            start = timer.clock()
+            files = self._get_commit_tree_files(commit)
+            line_counts = self._get_line_counts(commit)
+            files_to_add = []
+            for path in files:
+                line_count = line_counts[path]
+                created, file_ = self.file_set.get_or_create_file(
+                    file_path=path, line_count=line_count)
+                if created:
+                    events.append(
+                        events_module.FileCreated(commit.index, file_))
+                else:
+                    file_.line_count = line_count
+                files_to_add.append(file_)
+                if self.line_origins is not None:
+                    self.line_origins.add_file(
+                        path, line_count, commit.index)
+            timer.add('stats', start)
+
+            start = timer.clock()
+            self._prefetch(events, commit, files_to_add)
+            timer.add('cache', start)
+
+        timer.commit(fix)
+        if self.profiler is not None:
+            self.profiler.commit(self)
+
+        return events
+
+    def _add_eviction(self, events, commit):
+        """Add an Eviction event of the files the cache evicted."""
+        evicted = self.cache.pop_evicted()
+        if len(evicted) > 0:
+            events.append(events_module.Eviction(commit.index, evicted))
+
+    def _prefetch(self, events, commit, files):
+        """Add files to the cache, with the Eviction and Prefetch events."""
+        cache = self.cache
+        missing = [x for x in files if not cache.file_in(x)]
+        cache.add_multiple(files)
+        self._add_eviction(events, commit)
+
+        fetched = [x for x in missing if cache.file_in(x)]
+        if len(fetched) > 0:
+            events.append(events_module.Prefetch(commit.index, fetched))
 
     def _cleanup_files(self, files):
+        start = self.timer.clock()
         self.file_set.remove_files(files)
         self.file_distances.remove_files(files=files)
+        self.timer.add('distance', start)
+
+        start = self.timer.clock()
         self.cache.remove_files(files=files)
+        self.timer.add('cache', start)
 
     def _get_per_rev_pre_fetch(self, file_list, commit):
         if len(file_list) <= self.pre_fetch_size:
@@ -365,49 +678,123 @@ class Repository(RepositoryMixin):
 
         for pair in file_pairs:
             self.file_distances.add_occurrence(
-                *pair, commit=self.commit_order[commit.hexsha])
+                *pair, commit=commit.index)
 
-    def _get_line_introducing_commits(self, line_list, file_path, commit):
-        """Return the set of commits which introduced lines in a file.
+    def _blame_missing(self, commit, files, diffs=None):
+        """Blame the files of a fixing commit missing the cache, at once.
+
+        The files which are not in the cache when the commit is found to
+        be a fix, and which lost lines, are blamed concurrently by the
+        backend. A file an earlier miss of the commit brings into the cache
+        is blamed for nothing, a file it evicts is blamed on its own miss.
+        Returns the diffs of the commit and a dict of path to blame.
+        """
+        missing = [x for x in files if not self.cache.file_in(x)]
+        if len(missing) < 2 or self.backend.blame_workers < 2:
+            return diffs, {}
+
+        timer = self.timer
+        start = timer.clock()
+        if diffs is None:
+            diffs = self.backend.get_diffs(commit)
+        diffs_by_path = self._get_diffs_by_path(diffs)
+        paths = [
+            x.path for x in missing if x.path in diffs_by_path and
+            parsing.get_deleted_intervals_from_diff(
+                diffs_by_path[x.path].diff, unified=0)]
+        timer.add('diff', start)
+
+        start = timer.clock()
+        blames = self.backend.blame_multiple(commit.parents[0], paths)
+        timer.add('blame', start)
+
+        return diffs, blames
+
+    def _get_line_introducing_commits(self, diff, file_path, commit,
+                                      blame=None):
+        """Return the set of commits which introduced the deleted lines.
+
+        The commits are returned as commit ordinals. The deleted lines are
+        read from the diff of the file, their introducing commits from the
+        line index if present, from the blame on the parent otherwise: the
+        given blame, as by blame_multiple(), or git blame.
         """
+        timer = self.timer
+        start = timer.clock()
+        intervals = parsing.get_deleted_intervals_from_diff(
+            diff.diff, unified=0)
+        timer.add('diff', start)
+
+        start = timer.clock()
+        ordinals = self._get_interval_origins(
+            intervals, diff, file_path, commit, blame)
+        timer.add('blame', start)
+
+        return ordinals
+
+    def _get_interval_origins(self, intervals, diff, file_path, commit,
+                              blame=None):
+        """Return the introducing commit ordinals of the deleted intervals.
+        """
+        if self.line_origins is not None:
+            ordinals = self.line_origins.get_origins(file_path, intervals)
+            lines = parsing.get_deleted_line_text(diff.diff)
+            return set(
+                ordinal for ordinal, line in zip(ordinals, lines)
+                if ordinal is not None and parsing.important_line(line))
+
+        if len(intervals) == 0:
+            # nothing deleted, nothing to blame
+            return set()
 
         commit_list = []
         commit_set = []
         try:
-            for line_intr_c, lines in self.repo.blame(commit, file_path):
+            if blame is None:
+                blame = self.backend.blame(commit, file_path)
+            elif isinstance(blame, backend_module.BackendError):
+                raise blame
+            for line_intr_c, lines in blame:
                 commit_list += [(line_intr_c, x) for x in lines]
 
-        except git.exc.GitCommandError as gce:
-            logging.warning(gce)
+        except backend_module.BackendError as be:
+            logging.warning(be)
             raise RepositoryError(
                 "Error occured during getting line introducing commits")
 
         if len(commit_list) == 0:
             return set()
-        for line_num in line_list:
-            introducing_commit, line = commit_list[line_num]
-            if parsing.important_line(line):
-                commit_set.append(introducing_commit)
+        for start, length in intervals:
+            for introducing_commit, line in \
+                    commit_list[start:start + length]:
+                if parsing.important_line(line):
+                    commit_set.append(
+                        self.commit_table.get_index(introducing_commit))
 
-        return set(commit_set)
+        return set(commit_set) - set([None])
 
-    def _get_diff_deleted_lines(self, commit1, commit2):
-        """Return a list of blobs which changed from commit1 to commit2.
+    def _get_diffs_by_path(self, diffs):
+        """Return the diffs of changed or deleted blobs by their old path.
         """
+        diff_dict = {}
+        for diff in diffs:
+            if diff.a_path is not None:
+                diff_dict[diff.a_path] = diff
+
+        return diff_dict
 
-        diffs = commit2.diff(commit1, create_patch=True, unified=0)
-        file_dict = {}
+    def _update_line_origins(self, diffs, ordinal):
+        """Splice the diffs of a commit into the line index."""
         for diff in diffs:
-            deleted_lines = parsing.get_deleted_lines_from_diff(
-                diff.diff.splitlines())
-            if diff.b_path is not None:
-                file_dict[diff.a_path] = deleted_lines
-            elif diff.a_path is not None:
-                file_dict[diff.a_path] = deleted_lines
-            else:
-                pass
+            if diff.deleted_file:
+                self.line_origins.remove_file(diff.a_path)
+                continue
 
-        return file_dict
+            if diff.renamed:
+                self.line_origins.rename_file(diff.a_path, diff.b_path)
+
+            self.line_origins.apply_hunks(
+                diff.b_path, parsing.get_hunks_from_diff(diff.diff), ordinal)
 
     def _get_number_of_files(self):
         """Return the number of files and head.
@@ -420,25 +807,31 @@ class Repository(RepositoryMixin):
         return len(file_list)
 
 
-class WindowedRepository(Repository):
-    """WindowedRepository class, used for alternativy evaluation.
+class Horizon(object):
+    """Evaluation state of a single window of a WindowedRepository.
 
-    True positive: in cache, and in horizon
-    False positive: in the cache, but not in the horizon
-    True negative: not in the cache, and not in the horizon
-    False negative: not in the cache, but in the horizon.
+    The cache and the set of existing files are frozen at the window cut,
+    the TP/TN/FP/FN counters are updated as each file of the horizon enters
+    the faulty or the normal set. The cache, faulty and normal sets are
+    flag arrays indexed by File.file_id.
+
+    The evaluation rows are kept in output, or added to a writer, as by
+    results.EvaluationWriter, as soon as they are scored.
     """
 
-    def __init__(self, window=0.9, *args, **kwargs):
-        """Initalization of Repository variables, with window variables."""
-        super(WindowedRepository, self).__init__(*args, **kwargs)
+    def __init__(self, window, cache_members, files, writer=None):
+        """Freeze the cache and the existing files at the window cut."""
         self.window = window
-        commit_list_len = len(self.commit_list)
-        new_len = int(self.window * float(commit_list_len))
-        self.horizon_commit_list = self.commit_list[new_len:]
-        self.commit_list = self.commit_list[:new_len]
-        self.horizon_faulty_file_set = set()
-        self.horizon_normal_file_set = set()
+        self.files = files
+        self.writer = writer
+        # the frozen files all have ids below size
+        size = max([x.file_id + 1 for x in files.itervalues()] or [0])
+        self.cache_members = bytearray(cache_members[:size])
+        self.cache_members.extend(bytearray(size - len(self.cache_members)))
+        self.faulty_members = bytearray(size)
+        self.normal_members = bytearray(size)
+        self.counter = 1
+        self.output = []
         self.evaluation_data = {
             'true_positive': 0,
             'true_negative': 0,
@@ -446,84 +839,192 @@ class WindowedRepository(Repository):
             'false_negative': 0
         }
 
-    def reset(self, window=None, *args, **kwargs):
-        """Reset the WindowedRepository."""
-        super(WindowedRepository, self).reset(*args, **kwargs)
-        if window is not None:
-            self.window = window
-            c_list = self.commit_list + self.horizon_commit_list
+    def _faulty(self, file_):
+        """Move a file into the faulty part of the horizon."""
+        file_id = file_.file_id
+        if self.faulty_members[file_id]:
+            return
+
+        self.faulty_members[file_id] = 1
+        in_cache = self.cache_members[file_id]
+        data = self.evaluation_data
+        if self.normal_members[file_id]:
+            # the file stops counting as normal
+            if in_cache:
+                data['false_positive'] -= 1
+            else:
+                data['true_negative'] -= 1
+
+        if in_cache:
+            data['true_positive'] += 1
+        else:
+            data['false_negative'] += 1
+
+    def _normal(self, file_):
+        """Add a file to the normal part of the horizon."""
+        file_id = file_.file_id
+        if self.normal_members[file_id]:
+            return
+
+        self.normal_members[file_id] = 1
+        if self.faulty_members[file_id]:
+            # faulty files never count as normal
+            return
+
+        if self.cache_members[file_id]:
+            self.evaluation_data['false_positive'] += 1
+        else:
+            self.evaluation_data['true_negative'] += 1
+
+    def add_commit(self, commit, git_stat, fix):
+        """Score a single horizon commit."""
+        files = [self.files[path] for path in git_stat if path in self.files]
+        data = self.evaluation_data
+
+        if fix:
+            for file_ in files:
+                self._faulty(file_)
+
+            file_count = (
+                data['true_positive'] + data['false_positive'] +
+                data['true_negative'] + data['false_negative'])
+
+            row = (self.counter, data['true_positive'],
+                   data['false_positive'], data['true_negative'],
+                   data['false_negative'], file_count, commit.hexsha)
+            if self.writer is not None:
+                self.writer.add(row)
+            else:
+                self.output.append(row)
+        else:
+            for file_ in files:
+                self._normal(file_)
 
-            commit_list_len = len(c_list)
-            new_len = int(self.window * float(commit_list_len))
+        self.counter += 1
 
-            del self.horizon_commit_list
-            del self.commit_list
 
-            self.commit_list = c_list[:new_len]
-            self.horizon_commit_list = c_list[new_len:]
-        self.evaluation_data = {
-            'true_positive': 0,
-            'true_negative': 0,
-            'false_positive': 0,
-            'false_negative': 0
-        }
+class WindowedRepository(Repository):
+    """WindowedRepository class, used for alternativy evaluation.
 
-        self.reset_horizon()
+    True positive: in cache, and in horizon
+    False positive: in the cache, but not in the horizon
+    True negative: not in the cache, and not in the horizon
+    False negative: not in the cache, but in the horizon.
 
-    def reset_horizon(self):
-        """Reset horizon of WindowedRepository."""
-        del self.horizon_faulty_file_set
-        self.horizon_faulty_file_set = set()
+    The window can be a single cut point or a list of them. Every window is
+    evaluated during the same forward replay: the cache is frozen at each
+    cut, and the commits after it are scored against that frozen cache.
+    """
 
-        del self.horizon_normal_file_set
-        self.horizon_normal_file_set = set()
+    def __init__(self, window=0.9, *args, **kwargs):
+        """Initalization of Repository variables, with window variables."""
+        super(WindowedRepository, self).__init__(*args, **kwargs)
+        self._split_commit_list(window)
+        self.horizons = []
 
-    def evaluate(self):
-        """Run fixcache, then calculate TP/TN/FP/FN."""
-        self.run_fixcache()
-        print self.hit_count
-        print self.miss_count
+    @property
+    def windows(self):
+        """The sorted list of window cut points."""
+        if isinstance(self.window, (list, tuple)):
+            return sorted(set(self.window))
 
-        cache_set = self.cache.file_set
+        return [self.window]
 
-        output = []
+    def _split_commit_list(self, window):
+        """Split the history at the last cut, keep the cut indexes."""
+        self.window = window
+        c_list = commits_module.CommitList(self.commit_table)
+        commit_list_len = len(c_list)
 
-        counter = 1
+        self.window_cuts = dict(
+            (w, int(w * float(commit_list_len))) for w in self.windows)
+        new_len = max(self.window_cuts.values())
 
-        for commit in self.horizon_commit_list:
-            if len(commit.parents) == 1:
-                files = self.file_set.get_existing_multiple(commit.stats.files)
+        self.commit_list = c_list[:new_len]
+        self.horizon_commit_list = c_list[new_len:]
 
-                if parsing.is_fix_commit(commit.message):
-                    # add files to horizon_faulty."""
-                    map(lambda x: self.horizon_faulty_file_set.add(x),
-                        files)
+    def reset(self, window=None, *args, **kwargs):
+        """Reset the WindowedRepository."""
+        super(WindowedRepository, self).reset(*args, **kwargs)
+        if window is not None:
+            self._split_commit_list(window)
 
-                    normal_set = self.horizon_normal_file_set \
-                        - self.horizon_faulty_file_set
+        self.reset_horizon()
 
-                    faulty_set = self.horizon_faulty_file_set
+    def reset_horizon(self):
+        """Reset horizon of WindowedRepository."""
+        del self.horizons
+        self.horizons = []
 
-                    true_positive = len(cache_set & faulty_set)
-                    false_positive = len(cache_set & normal_set)
-                    true_negative = len(normal_set - cache_set)
-                    false_negative = len(faulty_set - cache_set)
-                    file_count = len(normal_set | faulty_set)
+    def _open_horizon(self, window, writer=None):
+        horizon = Horizon(
+            window, self.cache.members, dict(self.file_set.files), writer)
+        self.horizons.append(horizon)
 
-                    out = (counter, true_positive, false_positive,
-                           true_negative, false_negative,
-                           file_count, commit.hexsha)
+        return horizon
 
-                    output.append(out)
+    def evaluate_windows(self, writers=None):
+        """Run fixcache once, evaluating every window.
 
-                else:
-                    # add files to horizon normal
-                    map(lambda x: self.horizon_normal_file_set.add(x),
-                        files)
+        Returns a dict of window to the list of evaluation rows. The rows of
+        the windows with a writer in the writers dict are added to their
+        writer instead, and their lists are left empty.
+        """
+        writers = writers or {}
+        cuts = {}
+        for window, cut in self.window_cuts.iteritems():
+            cuts.setdefault(cut, []).append(window)
+
+        active = []
+        counter = events_module.EventCounter()
+        training_len = len(self.commit_list)
+        c_list = self.commit_list + self.horizon_commit_list
+        timer = self.timer
+
+        timer.start()
+        for index, commit in enumerate(c_list):
+            for window in cuts.get(index, []):
+                active.append(
+                    self._open_horizon(window, writers.get(window)))
+
+            if index < training_len:
+                counter.add_multiple(self._process_commit(commit))
+
+            if len(active) > 0 and len(commit.parents) == 1:
+                start = timer.clock()
+                git_stat = self.backend.get_stats(commit)
+                fix = self._is_fix_commit(commit)
+                for horizon in active:
+                    horizon.add_commit(commit, git_stat, fix)
+                timer.add('evaluate', start)
+        timer.stop()
+        self.hit_count += counter.hit_count
+        self.miss_count += counter.miss_count
+
+        if self.profiler is not None:
+            self.profiler.finish(self)
+
+        # a window of 1.0 has an empty horizon
+        for window in cuts.get(len(c_list), []):
+            self._open_horizon(window, writers.get(window))
+
+        logger.debug('Hits: %s, misses: %s' % (
+            self.hit_count, self.miss_count))
+
+        return dict((h.window, h.output) for h in self.horizons)
+
+    def evaluate(self):
+        """Run fixcache, then calculate TP/TN/FP/FN.
 
-                counter += 1
+        With a single window the list of evaluation rows is returned,
+        otherwise a dict of window to rows, as by evaluate_windows().
+        """
+        outputs = self.evaluate_windows()
 
-        return output
+        if isinstance(self.window, (list, tuple)):
+            return outputs
+
+        return outputs[self.window]
 
 
 def main(args):
@@ -532,9 +1033,17 @@ def main(args):
         cache_ratio=args.cr,
         distance_to_fetch=args.dtf,
         pre_fetch_size=args.pfs,
-        branch=args.b)
-
-    repo.run_fixcache()
+        branch=args.b,
+        classifier=classifier_module.get_classifier(args.issues),
+        line_provenance=args.provenance,
+        backend=args.backend)
+
+    with repo:
+        if args.events:
+            for event in repo.iter_fixcache():
+                print event
+        else:
+            repo.run_fixcache()
     cache = [(x.line_count, x) for x in repo.cache.file_set]
     cache.sort(reverse=True)
 
@@ -543,6 +1052,9 @@ def main(args):
     for line_count, f in cache:
         print line_count, ':', f.path
 
+    if args.snapshot is not None:
+        snapshot.save_snapshot(repo, args.snapshot)
+
 
 parser = argparse.ArgumentParser(
     description='Show results of FixCache analysis')
@@ -551,6 +1063,16 @@ parser.add_argument('--cr', '--cache_ratio', type=float, required=True)
 parser.add_argument('--pfs', '--pre_fetch_size', type=float, required=True)
 parser.add_argument('--dtf', '--distance_to_fetch', type=float, required=True)
 parser.add_argument('--b', '--branch', type=str, default='master')
+parser.add_argument('--snapshot', type=str, default=None,
+                    help='persist the final state to a snapshot file')
+parser.add_argument('--issues', type=str, default=None,
+                    help='file of bug issue ids, one per line')
+parser.add_argument('--provenance', action='store_true',
+                    help='track line origins instead of running git blame')
+parser.add_argument('--events', action='store_true',
+                    help='print the events of the replay as they happen')
+parser.add_argument('--backend', choices=backend_module.BACKEND_CHOICES,
+                    default='gitpython')
 parser.add_argument('--logging', default='info')
 
 if __name__ == "__main__":
@@ -0,0 +1,697 @@
+#! /usr/bin/env python
+"""Results module, the SQLite store of analysis and evaluation results.
+
+Every analysis row and evaluation is kept in one local SQLite database,
+keyed by (repo, version, branch, classifier, cr, dtf, pfs, window),
+instead of a tree of parameter-encoded csv files. The classifier is the
+name of the classifier of the fixing commits, results of another
+classifier are not reused. Analysis rows are buffered and inserted in
+batched transactions, evaluations in one transaction each, so an
+interrupted run keeps every completed row and can be resumed.
+
+Every result also records the head of the branch it was computed on. A
+result of another head is stale: it is not found by has_analysis() or
+get_evaluation() with the current head, and it is replaced once
+recomputed, so sweeps resume where they stopped and redo their points
+when the repository moves.
+
+The csv files of the previous layout can still be exported, under the
+same names, for the tools that read them.
+
+An EvaluationWriter streams the rows of an evaluation to a .partial csv
+file as the horizon is scored, in batches. An interrupted evaluation
+keeps its flushed rows, and a rerun at the same head appends to them.
+"""
+import argparse
+import csv
+import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import constants
+from timing import COLUMNS as TIMING_COLUMNS
+
+
+logger = logging.getLogger('fixcache_logger')
+
+# csv columns of an analysis row, followed by the timing.COLUMNS
+ANALYSIS_COLUMNS = [
+    'repo_dir', 'hits', 'misses', 'cache_size', 'dtf', 'pfs', 'ttr']
+RANDOM_COLUMNS = ['hits_low', 'hits_high']
+EVALUATION_COLUMNS = [
+    'counter', 'true_positive', 'false_positive', 'true_negative',
+    'false_negative', 'file_count', 'hexsha']
+METADATA_COLUMNS = ['cache_size', 'commit_num', 'file_count', 'window']
+
+ANALYSIS_CHOICES = [
+    'cache_ratio_progressive',
+    'cache_ratio',
+    'fixed_cache_ratio',
+    'fixed_cache_ratio_search',
+    'random_cache',
+    'random_cache_analytic']
+
+DEFAULT_WINDOW = 0.9
+BATCH_SIZE = 20
+
+# PRAGMA user_version of the SCHEMA
+SCHEMA_VERSION = 2
+
+# parameters are rounded, so recomputed floats find their rows
+PRECISION = 6
+
+_TIMING_SCHEMA = ''.join(',\n    %s REAL' % (c,) for c in TIMING_COLUMNS)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analysis (
+    repo TEXT NOT NULL,
+    version TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    classifier TEXT NOT NULL DEFAULT '',
+    head TEXT,
+    analysis TEXT NOT NULL,
+    cr REAL NOT NULL,
+    dtf REAL,
+    pfs REAL,
+    hits INTEGER,
+    misses INTEGER,
+    hit_rate REAL,
+    cache_size INTEGER,
+    distance_to_fetch INTEGER,
+    pre_fetch_size INTEGER,
+    ttr REAL,
+    hits_low REAL,
+    hits_high REAL%(timing)s,
+    created TEXT,
+    UNIQUE (repo, version, branch, classifier, cr, dtf, pfs, analysis)
+);
+CREATE INDEX IF NOT EXISTS analysis_hit_rate
+    ON analysis (version, repo, hit_rate);
+CREATE INDEX IF NOT EXISTS analysis_latest
+    ON analysis (repo, branch, version, classifier, created);
+CREATE TABLE IF NOT EXISTS evaluation (
+    id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    version TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    classifier TEXT NOT NULL DEFAULT '',
+    head TEXT,
+    cr REAL NOT NULL,
+    dtf REAL NOT NULL,
+    pfs REAL NOT NULL,
+    window REAL NOT NULL,
+    cache_size INTEGER,
+    commit_num INTEGER,
+    file_count INTEGER%(timing)s,
+    created TEXT,
+    UNIQUE (repo, version, branch, classifier, cr, dtf, pfs, window)
+);
+CREATE TABLE IF NOT EXISTS evaluation_row (
+    evaluation_id INTEGER NOT NULL REFERENCES evaluation (id),
+    counter INTEGER,
+    true_positive INTEGER,
+    false_positive INTEGER,
+    true_negative INTEGER,
+    false_negative INTEGER,
+    file_count INTEGER,
+    hexsha TEXT
+);
+CREATE INDEX IF NOT EXISTS evaluation_row_evaluation
+    ON evaluation_row (evaluation_id);
+''' % {'timing': _TIMING_SCHEMA}
+
+
+class ResultStoreError(Exception):
+    """ResultStore Error."""
+
+    def __init__(self, value):
+        """Initalization of the class."""
+        self.value = value
+
+    def __str__(self):
+        """String representation of the class."""
+        return repr(self.value)
+
+
+def get_version_name(version):
+    """Return the name of a version, 'version_5' for 5 or '5'."""
+    if isinstance(version, (int, long)) or str(version).isdigit():
+        return 'version_%s' % (version,)
+    return str(version)
+
+
+def _round(value):
+    if value is None:
+        return None
+    return round(float(value), PRECISION)
+
+
+def get_analysis_file_name(analysis, cache_ratio=None,
+                           distance_to_fetch=None, pre_fetch_size=None):
+    """Return the csv file name of the previous layout for an analysis."""
+    if analysis == 'cache_ratio_progressive':
+        return 'analyse_by_cache_ratio_progressive_dtf_%s_pfs_%s.csv' % (
+            distance_to_fetch, pre_fetch_size)
+    elif analysis == 'cache_ratio':
+        return 'analyse_by_cache_ratio_%s_pfs_%s.csv' % (
+            distance_to_fetch, pre_fetch_size)
+    elif analysis == 'fixed_cache_ratio':
+        return 'analyse_by_fixed_cache_%s.csv' % (cache_ratio,)
+    elif analysis == 'fixed_cache_ratio_search':
+        return 'analyse_by_fixed_cache_search_%s.csv' % (cache_ratio,)
+    elif analysis == 'random_cache':
+        return 'analyse_by_random_cache.csv'
+    elif analysis == 'random_cache_analytic':
+        return 'analyse_by_random_cache_analytic.csv'
+
+    raise ResultStoreError('Unknown analysis %s' % (analysis,))
+
+
+def get_evaluation_file_names(dir_, repo_name, cache_ratio, pre_fetch_size,
+                              distance_to_fetch, window):
+    """Return the result, metadata and timing file paths of a window."""
+    name = 'evaluate_%s_cr_%s_pfs_%s_dtf_%s' % (
+        repo_name, cache_ratio, pre_fetch_size, distance_to_fetch)
+    if window != DEFAULT_WINDOW:
+        name += '_w_%s' % (window,)
+
+    return (os.path.join(dir_, name + '.csv'),
+            os.path.join(dir_, name + '_metadata.csv'),
+            os.path.join(dir_, name + '_timing.json'))
+
+
+class ResultStore(object):
+    """SQLite database of analysis and evaluation results."""
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE):
+        """Initialization, creates the database and its tables if needed.
+        """
+        self.path = path or constants.RESULTS_DB
+        self.batch_size = batch_size
+        self.pending = []
+
+        dir_ = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(dir_):
+            os.makedirs(dir_)
+
+        try:
+            # analyses of several repositories may share the database
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self._create_schema()
+        except sqlite3.Error as e:
+            logging.warning(e)
+            raise ResultStoreError(
+                'Cannot open the result store %s' % (self.path,))
+
+    def _create_schema(self):
+        """Create the tables, migrating those of an older SCHEMA_VERSION.
+
+        The rows of older stores are kept, on the master branch if they
+        lack one. They lack the classifier or the head they were computed
+        with, they are stale.
+        """
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        tables = [row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")]
+        migrated = []
+        if version < SCHEMA_VERSION:
+            # the UNIQUE constraints gain columns, the tables are copied
+            self.connection.execute('PRAGMA legacy_alter_table = ON')
+            for table in ['analysis', 'evaluation']:
+                if table in tables:
+                    self.connection.execute(
+                        'ALTER TABLE %s RENAME TO %s_old' % (table, table))
+                    migrated.append(table)
+            self.connection.execute('PRAGMA legacy_alter_table = OFF')
+
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            for table in migrated:
+                logger.warning('Migrating the %s results of the older '
+                               'store %s' % (table, self.path))
+                self._copy_table(table + '_old', table)
+                self.connection.execute('DROP TABLE %s_old' % (table,))
+        if len(migrated) > 0:
+            # the indexes were kept by the dropped tables
+            self.connection.executescript(SCHEMA)
+        self.connection.execute('PRAGMA user_version = %d' % (SCHEMA_VERSION,))
+
+    def _copy_table(self, old, new):
+        """Copy the rows of table old to table new.
+
+        The missing columns take their default, the branch is master.
+        """
+        old_columns = [row[1] for row in self.connection.execute(
+            'PRAGMA table_info(%s)' % (old,))]
+        columns = [row[1] for row in self.connection.execute(
+            'PRAGMA table_info(%s)' % (new,)) if row[1] in old_columns]
+        values = list(columns)
+        if 'branch' not in old_columns:
+            columns.append('branch')
+            values.append("'master'")
+        self.connection.execute(
+            'INSERT INTO %s (%s) SELECT %s FROM %s' % (
+                new, ', '.join(columns), ', '.join(values), old))
+
+    def close(self):
+        """Flush the pending rows and close the database."""
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+    def _query(self, sql, parameters=()):
+        return [dict(row) for row in
+                self.connection.execute(sql, parameters).fetchall()]
+
+    def add_analysis(self, version, analysis, cache_ratio,
+                     distance_to_fetch, pre_fetch_size, row, hits_low=None,
+                     hits_high=None, branch='master', head=None,
+                     classifier=''):
+        """Buffer an analysis row, ANALYSIS_COLUMNS then timing.COLUMNS.
+
+        The row is keyed by the ratios of the analysis and the name of the
+        classifier, its dtf and pfs columns hold the sizes of the
+        repository. It replaces the row of another head. The buffer is
+        inserted every batch_size rows, and by flush().
+        """
+        repo_dir, hits, misses, cache_size, dtf_size, pfs_size, ttr = row[:7]
+        lookups = hits + misses
+        hit_rate = float(hits) / lookups if lookups > 0 else None
+
+        self.pending.append(
+            [repo_dir, get_version_name(version), branch, classifier, head,
+             analysis, _round(cache_ratio), _round(distance_to_fetch),
+             _round(pre_fetch_size), hits, misses, hit_rate, cache_size,
+             dtf_size, pfs_size, ttr, hits_low, hits_high] +
+            list(row[7:7 + len(TIMING_COLUMNS)]) +
+            [datetime.datetime.now().isoformat()])
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered analysis rows in one transaction."""
+        if len(self.pending) == 0:
+            return
+
+        columns = (
+            ['repo', 'version', 'branch', 'classifier', 'head', 'analysis',
+             'cr', 'dtf', 'pfs', 'hits', 'misses', 'hit_rate', 'cache_size',
+             'distance_to_fetch', 'pre_fetch_size', 'ttr', 'hits_low',
+             'hits_high'] +
+            TIMING_COLUMNS + ['created'])
+        insert = 'INSERT OR REPLACE INTO analysis (%s) VALUES (%s)' % (
+            ', '.join(columns), ', '.join('?' * len(columns)))
+        with self.connection:
+            for row in self.pending:
+                # the dtf and pfs of the random analyses are NULL, UNIQUE
+                # does not find their row of another head
+                self.connection.execute(
+                    'DELETE FROM analysis WHERE repo = ? AND version = ? '
+                    'AND branch = ? AND classifier = ? AND analysis = ? AND '
+                    'cr = ? AND dtf IS ? AND pfs IS ?', row[:4] + row[5:9])
+                self.connection.execute(insert, row)
+
+        logger.debug('%s analysis rows stored' % (len(self.pending),))
+        self.pending = []
+
+    def has_analysis(self, repo, version, analysis, cache_ratio,
+                     distance_to_fetch=None, pre_fetch_size=None,
+                     branch='master', head=None, classifier=''):
+        """Return True if the row of the head and classifier is stored."""
+        self.flush()
+        return self.connection.execute(
+            'SELECT 1 FROM analysis WHERE repo = ? AND version = ? AND '
+            'branch = ? AND classifier = ? AND cr = ? AND dtf IS ? AND '
+            'pfs IS ? AND analysis = ? AND head IS ?',
+            (repo, get_version_name(version), branch, classifier,
+             _round(cache_ratio), _round(distance_to_fetch),
+             _round(pre_fetch_size), analysis, head)).fetchone() is not None
+
+    def get_analysis(self, repo, version, analysis, distance_to_fetch=None,
+                     pre_fetch_size=None, cache_ratio=None, branch=None,
+                     head=None, classifier=None, latest=False):
+        """Return the stored rows of an analysis as dicts.
+
+        The parameters left to None are not filtered, rows are ordered by
+        cache ratio, pfs and dtf, as the analyses produce them. With
+        latest, only the rows of the head stored last are returned.
+        """
+        self.flush()
+        conditions = 'repo = ? AND version = ? AND analysis = ?'
+        parameters = [repo, get_version_name(version), analysis]
+        for column, value in [('dtf', _round(distance_to_fetch)),
+                              ('pfs', _round(pre_fetch_size)),
+                              ('cr', _round(cache_ratio)),
+                              ('branch', branch),
+                              ('classifier', classifier),
+                              ('head', head)]:
+            if value is not None:
+                conditions += ' AND %s = ?' % (column,)
+                parameters.append(value)
+
+        sql = 'SELECT * FROM analysis WHERE ' + conditions
+        if latest:
+            sql += (' AND head IS (SELECT head FROM analysis WHERE %s '
+                    'ORDER BY created DESC LIMIT 1)' % (conditions,))
+            parameters += parameters
+
+        return self._query(sql + ' ORDER BY cr, pfs, dtf', parameters)
+
+    def get_best_hit_rates(self, version=None, analysis=None):
+        """Return the row with the best hit rate of every repository.
+
+        Only the rows of the head stored last of every branch and
+        classifier are ranked.
+        """
+        self.flush()
+        # the latest head of every group is found once, by analysis_latest
+        sql = ('WITH latest AS (SELECT repo, branch, version, classifier, '
+               'head, MAX(created) FROM analysis '
+               'GROUP BY repo, branch, version, classifier) '
+               'SELECT analysis.repo AS repo, analysis.version AS version, '
+               'analysis.classifier AS classifier, analysis, cr, dtf, pfs, '
+               'MAX(hit_rate) AS hit_rate '
+               'FROM analysis JOIN latest ON latest.repo = analysis.repo '
+               'AND latest.branch = analysis.branch AND latest.version = '
+               'analysis.version AND latest.classifier = '
+               'analysis.classifier AND latest.head IS analysis.head')
+        conditions = []
+        parameters = []
+        if version is not None:
+            conditions.append('analysis.version = ?')
+            parameters.append(get_version_name(version))
+        if analysis is not None:
+            conditions.append('analysis.analysis = ?')
+            parameters.append(analysis)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        return self._query(
+            sql + ' GROUP BY analysis.version, analysis.repo '
+            'ORDER BY analysis.version, analysis.repo', parameters)
+
+    def add_evaluation(self, repo, version, cache_ratio, distance_to_fetch,
+                       pre_fetch_size, window, metadata, rows,
+                       branch='master', head=None, classifier=''):
+        """Store an evaluation and its rows, in one transaction.
+
+        The metadata holds the cache_size, commit_num and file_count, and
+        the timing.COLUMNS. The evaluation of another head is replaced.
+        """
+        columns = (['cache_size', 'commit_num', 'file_count'] +
+                   TIMING_COLUMNS)
+        key = (repo, get_version_name(version), branch, classifier,
+               _round(cache_ratio), _round(distance_to_fetch),
+               _round(pre_fetch_size), _round(window))
+
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM evaluation_row WHERE evaluation_id IN ('
+                'SELECT id FROM evaluation WHERE repo = ? AND version = ? '
+                'AND branch = ? AND classifier = ? AND cr = ? AND dtf = ? '
+                'AND pfs = ? AND window = ?)', key)
+            cursor = self.connection.execute(
+                'INSERT OR REPLACE INTO evaluation (repo, version, branch, '
+                'classifier, cr, dtf, pfs, window, head, %s, created) '
+                'VALUES (%s)' % (
+                    ', '.join(columns), ', '.join('?' * (len(columns) + 10))),
+                key + (head,) + tuple(metadata.get(c) for c in columns) +
+                (datetime.datetime.now().isoformat(),))
+            evaluation_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO evaluation_row (evaluation_id, %s) '
+                'VALUES (%s)' % (', '.join(EVALUATION_COLUMNS),
+                                 ', '.join('?' * (len(EVALUATION_COLUMNS) +
+                                                  1))),
+                ([evaluation_id] + list(row) for row in rows))
+
+        return evaluation_id
+
+    def get_evaluation(self, repo, version, cache_ratio, distance_to_fetch,
+                       pre_fetch_size, window=DEFAULT_WINDOW,
+                       branch='master', head=None, classifier=None):
+        """Return the metadata dict of an evaluation, None if not stored.
+
+        With a head, the evaluation of another head is not returned. Without
+        a classifier, the evaluation stored last is returned.
+        """
+        sql = ('SELECT * FROM evaluation WHERE repo = ? AND version = ? AND '
+               'branch = ? AND cr = ? AND dtf = ? AND pfs = ? AND window = ?')
+        parameters = [repo, get_version_name(version), branch,
+                      _round(cache_ratio), _round(distance_to_fetch),
+                      _round(pre_fetch_size), _round(window)]
+        if classifier is not None:
+            sql += ' AND classifier = ?'
+            parameters.append(classifier)
+        rows = self._query(sql + ' ORDER BY created DESC LIMIT 1', parameters)
+
+        if len(rows) == 0 or head is not None and rows[0]['head'] != head:
+            return None
+        return rows[0]
+
+    def has_evaluation(self, *args, **kwargs):
+        """Return True if the evaluation is stored, see get_evaluation()."""
+        return self.get_evaluation(*args, **kwargs) is not None
+
+    def get_evaluation_rows(self, evaluation_id):
+        """Return the rows of an evaluation as dicts, in order."""
+        return self._query(
+            'SELECT %s FROM evaluation_row WHERE evaluation_id = ? '
+            'ORDER BY rowid' % (', '.join(EVALUATION_COLUMNS),),
+            (evaluation_id,))
+
+    def export_analysis_csv(self, path, rows):
+        """Write analysis rows, as by get_analysis(), as a csv file."""
+        random_columns = []
+        if len(rows) > 0 and rows[0]['analysis'] == 'random_cache_analytic':
+            random_columns = RANDOM_COLUMNS
+
+        with open(path, 'wb') as out:
+            csv_out = csv.writer(out)
+            csv_out.writerow(
+                ANALYSIS_COLUMNS + random_columns + TIMING_COLUMNS)
+            for row in rows:
+                csv_out.writerow(
+                    [row['repo'], row['hits'], row['misses'],
+                     row['cache_size'], row['distance_to_fetch'],
+                     row['pre_fetch_size'], row['ttr']] +
+                    [row[c] for c in random_columns + TIMING_COLUMNS])
+
+    def iter_evaluation_rows(self, evaluation_id):
+        """Iterate the rows of an evaluation as tuples, in order."""
+        cursor = self.connection.execute(
+            'SELECT %s FROM evaluation_row WHERE evaluation_id = ? '
+            'ORDER BY rowid' % (', '.join(EVALUATION_COLUMNS),),
+            (evaluation_id,))
+        for row in cursor:
+            yield tuple(row)
+
+    def export_evaluation_metadata_csv(self, evaluation, file_metadata):
+        """Write the metadata of an evaluation as a csv file."""
+        with open(file_metadata, 'wb') as out:
+            csv_out = csv.writer(out)
+            csv_out.writerow(METADATA_COLUMNS + TIMING_COLUMNS)
+            csv_out.writerow(
+                [evaluation[c] for c in METADATA_COLUMNS + TIMING_COLUMNS])
+
+    def export_evaluation_csv(self, evaluation, file_, file_metadata):
+        """Write an evaluation, as by get_evaluation(), as csv files."""
+        self.export_evaluation_metadata_csv(evaluation, file_metadata)
+
+        with open(file_, 'wb') as out:
+            csv_out = csv.writer(out)
+            csv_out.writerow(EVALUATION_COLUMNS)
+            csv_out.writerows(self.iter_evaluation_rows(evaluation['id']))
+
+    def export_csv(self, version, root=None, branch='master'):
+        """Export the results of a version and branch to the csv layout.
+
+        The files are written under root, the number of files written is
+        returned.
+        """
+        root = root or constants.CSV_ROOT
+        version = get_version_name(version)
+        files = {}
+        for row in self._query(
+                'SELECT * FROM analysis WHERE version = ? AND branch = ? '
+                'ORDER BY repo, analysis, cr, pfs, dtf', (version, branch)):
+            path = os.path.join(
+                root, version, row['repo'], get_analysis_file_name(
+                    row['analysis'], row['cr'], row['dtf'], row['pfs']))
+            files.setdefault(path, []).append(row)
+
+        for path, rows in files.iteritems():
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            self.export_analysis_csv(path, rows)
+
+        evaluations = self._query(
+            'SELECT * FROM evaluation WHERE version = ? AND branch = ?',
+            (version, branch))
+        for evaluation in evaluations:
+            dir_ = os.path.join(root, version, evaluation['repo'])
+            if not os.path.exists(dir_):
+                os.makedirs(dir_)
+            file_, file_metadata, _ = get_evaluation_file_names(
+                dir_, evaluation['repo'], evaluation['cr'],
+                evaluation['pfs'], evaluation['dtf'], evaluation['window'])
+            self.export_evaluation_csv(evaluation, file_, file_metadata)
+
+        return len(files) + 2 * len(evaluations)
+
+
+class EvaluationWriter(object):
+    """Writer streaming the rows of an evaluation to a partial csv file.
+
+    The partial file starts with the head, branch and classifier the
+    evaluation is computed with, then the EVALUATION_COLUMNS and the rows,
+    written every batch_size rows. While it exists the evaluation is
+    unfinished: opening a writer on the partial file of the same head,
+    branch and classifier resumes it, the rows up to the counter of the
+    last one written are skipped when the replay produces them again. The
+    partial file of any other evaluation is started over.
+    """
+
+    def __init__(self, path, head=None, batch_size=BATCH_SIZE,
+                 branch='master', classifier=''):
+        """Open the partial file at path, resuming it if possible."""
+        self.path = path
+        self.head = head
+        self.header = '#head %s branch %s classifier %s\n' % (
+            head, branch, classifier)
+        self.batch_size = batch_size
+        self.pending = []
+        self.rows = 0
+        # counter of the last row of a resumed partial file
+        self.resumed = self._resume()
+
+        if self.resumed is None:
+            self.out = open(self.path, 'wb')
+            self.out.write(self.header)
+            csv.writer(self.out).writerow(EVALUATION_COLUMNS)
+            self.out.flush()
+        else:
+            logger.info('Resuming %s after %s rows' % (
+                self.path, self.rows))
+            self.out = open(self.path, 'ab')
+        self.csv_out = csv.writer(self.out)
+
+    def _resume(self):
+        """Count the rows of the partial file, return the last counter.
+
+        None is returned if the partial file is missing or of another
+        evaluation. A row cut by an interruption is truncated.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r+b') as partial:
+            if partial.readline() != self.header:
+                return None
+            partial.readline()
+
+            counter = 0
+            end = partial.tell()
+            for line in iter(partial.readline, ''):
+                if not line.endswith('\n'):
+                    break
+                counter = int(line.split(',', 1)[0])
+                self.rows += 1
+                end = partial.tell()
+            partial.truncate(end)
+
+        return counter
+
+    def add(self, row):
+        """Add a row, buffered until batch_size rows are pending."""
+        if self.resumed is not None and row[0] <= self.resumed:
+            return
+
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows to the partial file."""
+        if len(self.pending) == 0:
+            return
+
+        self.csv_out.writerows(self.pending)
+        self.out.flush()
+        self.rows += len(self.pending)
+        self.pending = []
+        logger.debug('%s rows written to %s' % (self.rows, self.path))
+
+    def close(self):
+        """Flush the pending rows and close the partial file."""
+        if self.out is not None:
+            self.flush()
+            self.out.close()
+            self.out = None
+
+    def iter_rows(self):
+        """Iterate the written rows as tuples, in order."""
+        with open(self.path, 'rb') as partial:
+            partial.readline()
+            partial.readline()
+            for row in csv.reader(partial):
+                yield tuple(int(x) for x in row[:-1]) + (row[-1],)
+
+    def finish(self, file_):
+        """Close the writer, and move its rows to the csv file file_."""
+        self.close()
+        with open(self.path, 'rb') as partial:
+            partial.readline()
+            with open(file_, 'wb') as out:
+                shutil.copyfileobj(partial, out)
+        os.remove(self.path)
+
+
+def main(args):
+    """Main entry."""
+    store = ResultStore(args.db)
+    try:
+        if args.function == 'best_hit_rates':
+            print 'version : repo : hit_rate : cr : dtf : pfs : analysis'
+            for row in store.get_best_hit_rates(args.v, args.analysis):
+                print row['version'], ':', row['repo'], ':', \
+                    '%.4f' % (row['hit_rate'] or 0,), ':', row['cr'], ':', \
+                    row['dtf'], ':', row['pfs'], ':', row['analysis']
+        elif args.function == 'export':
+            if args.v is None:
+                parser.error('--v has to be set')
+            count = store.export_csv(args.v, args.root, args.b)
+            print count, 'files written'
+    finally:
+        store.close()
+
+
+RESULT_CHOICES = ['best_hit_rates', 'export']
+
+parser = argparse.ArgumentParser(
+    description='Query and export the FixCache result store')
+parser.add_argument('function', metavar='fun', choices=RESULT_CHOICES)
+parser.add_argument('--v', '--version', type=str, default=None,
+                    help='version number, or random')
+parser.add_argument('--analysis', choices=ANALYSIS_CHOICES, default=None)
+parser.add_argument('--db', type=str, default=None,
+                    help='path of the database, constants.RESULTS_DB')
+parser.add_argument('--root', type=str, default=None,
+                    help='root of the csv export, constants.CSV_ROOT')
+parser.add_argument('--b', '--branch', type=str, default='master')
+parser.add_argument('--logging', default='info')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.logging == 'info':
+        logger.setLevel(logging.INFO)
+    elif args.logging == 'debug':
+        logger.setLevel(logging.DEBUG)
+
+    main(args)
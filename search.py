@@ -0,0 +1,118 @@
+"""Search module, maximising a score over a grid of parameters.
+
+Instead of scoring every point of a grid, the coordinate search moves one
+parameter at a time, with a golden-section search over the sorted values
+of that parameter while the others are fixed. The score of every point
+is memoised, so the points shared by the successive line searches are
+scored once. On a unimodal score the best point is found with a number
+of evaluations logarithmic in the number of values of each parameter.
+"""
+import logging
+
+
+logger = logging.getLogger('fixcache_logger')
+
+# 1 / golden ratio
+INV_PHI = (5 ** 0.5 - 1) / 2
+
+MAX_ROUNDS = 5
+
+
+class MemoisedScore(object):
+    """A score function, evaluated once per point."""
+
+    def __init__(self, function):
+        """Initialization, function is called with the point values."""
+        self.function = function
+        self.scores = {}
+        self.points = []
+
+    def __call__(self, *point):
+        """Return the score of a point."""
+        try:
+            return self.scores[point]
+        except KeyError:
+            score = self.function(*point)
+            self.scores[point] = score
+            self.points.append(point)
+            logger.debug('Score of %s: %s' % (point, score))
+            return score
+
+    def get_best(self):
+        """Return the scored point with the best score, and its score."""
+        point = max(self.points, key=lambda p: self.scores[p])
+        return point, self.scores[point]
+
+
+def golden_section_search(function, values):
+    """Return the value maximising function over values.
+
+    The values are sorted, and the function is assumed to be unimodal
+    over them. Of equal scores, the lower value is kept.
+    """
+    low, high = 0, len(values) - 1
+    while high - low > 2:
+        middle1 = low + int(round((high - low) * (1 - INV_PHI)))
+        middle2 = low + int(round((high - low) * INV_PHI))
+        if middle1 == middle2:
+            middle2 += 1
+
+        if function(values[middle1]) < function(values[middle2]):
+            low = middle1 + 1
+        else:
+            high = middle2 - 1
+
+    return max(values[low:high + 1], key=lambda v: (function(v), -v))
+
+
+def _get_neighbours(point, axes):
+    """Return the grid points one step away from point on every axis."""
+    neighbours = []
+    for i, axis in enumerate(axes):
+        index = axis.index(point[i])
+        for step in (-1, 1):
+            if 0 <= index + step < len(axis):
+                neighbours.append(
+                    point[:i] + (axis[index + step],) + point[i + 1:])
+
+    return neighbours
+
+
+def coordinate_search(function, axes, start=None, max_rounds=MAX_ROUNDS):
+    """Return the point maximising function over the grid of axes.
+
+    The axes are lists of the values of every parameter, function is
+    called with one value per axis. Starting from start, the middle of
+    every axis by default, every parameter is optimised in turn by a
+    golden_section_search, until a round leaves the point unchanged. The
+    best point is then moved to its best neighbour while that improves it,
+    as plateaus of the score can mislead the line searches.
+    Returns the best point, its score, and the number of points scored.
+    """
+    axes = [sorted(axis) for axis in axes]
+    score = MemoisedScore(function)
+    if start is None:
+        start = [axis[(len(axis) - 1) // 2] for axis in axes]
+    point = list(start)
+    score(*point)
+
+    for round_ in xrange(max_rounds):
+        previous = list(point)
+        for i, axis in enumerate(axes):
+            def line(value):
+                return score(*(point[:i] + [value] + point[i + 1:]))
+            point[i] = golden_section_search(line, axis)
+
+        logger.debug('Search round %s ends at %s' % (round_, point))
+        if point == previous:
+            break
+
+    best, best_score = score.get_best()
+    while True:
+        for neighbour in _get_neighbours(best, axes):
+            score(*neighbour)
+        if score.get_best()[0] == best:
+            break
+        best, best_score = score.get_best()
+
+    return best, best_score, len(score.points)
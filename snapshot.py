@@ -0,0 +1,227 @@
+#! /usr/bin/env python
+"""Snapshot module, persisting the state of a finished fixcache run.
+
+A snapshot is a single SQLite database holding the FileSet, the Cache
+membership and the DistanceSet of a Repository. The database is opened
+memory-mapped and queried through its indexes, so scoring a handful of
+changed files only pages in the entries it touches, and does not require
+replaying the history of the repository.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+
+logger = logging.getLogger('fixcache_logger')
+
+SNAPSHOT_VERSION = 1
+MMAP_SIZE = 256 * 1024 * 1024
+
+_SCHEMA = [
+    'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE commits (ordinal INTEGER PRIMARY KEY, hexsha TEXT)',
+    ('CREATE TABLE files (path TEXT PRIMARY KEY, faults INTEGER, '
+     'changes INTEGER, last_found INTEGER, line_count INTEGER, '
+     'in_cache INTEGER) WITHOUT ROWID'),
+    ('CREATE TABLE distances (path TEXT, other TEXT, occurrence INTEGER, '
+     'PRIMARY KEY (path, other)) WITHOUT ROWID'),
+]
+
+_INDEXES = [
+    'CREATE INDEX distances_by_occurrence ON distances (path, occurrence)',
+]
+
+
+class SnapshotError(Exception):
+    """Snapshot Error."""
+
+    def __init__(self, value):
+        """Initalization of the class."""
+        self.value = value
+
+    def __str__(self):
+        """String representation of the class."""
+        return repr(self.value)
+
+
+def _iter_distance_rows(file_distances):
+    for file1, file2, occurrence in file_distances.iter_occurrences():
+        if occurrence > 0:
+            yield (file1.path, file2.path, occurrence)
+
+
+def save_snapshot(repo, path):
+    """Persist the FileSet, Cache and DistanceSet of a Repository.
+
+    The repository is expected to have finished run_fixcache(). An existing
+    snapshot at the given path is overwritten.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    cache_set = repo.cache.file_set
+    meta = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'repo_dir': repo.repo_dir,
+        'head': repo.commit_list[-1].hexsha,
+        'commit_num': len(repo.commit_list),
+        'cache_size': repo.cache_size,
+        'distance_to_fetch': repo.distance_to_fetch,
+        'pre_fetch_size': repo.pre_fetch_size,
+    }
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.executemany(
+                'INSERT INTO meta VALUES (?, ?)',
+                [(key, str(value)) for key, value in meta.iteritems()])
+            conn.executemany(
+                'INSERT INTO commits VALUES (?, ?)',
+                enumerate(commit.hexsha for commit in repo.commit_list))
+            conn.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                ((f.path, f.faults, f.changes, f.last_found, f.line_count,
+                  int(f in cache_set))
+                 for f in repo.file_set.files.itervalues()))
+            conn.executemany(
+                'INSERT OR REPLACE INTO distances VALUES (?, ?, ?)',
+                _iter_distance_rows(repo.file_distances))
+            for statement in _INDEXES:
+                conn.execute(statement)
+    finally:
+        conn.close()
+
+    logger.info('Snapshot of %s written to %s' % (repo.repo_dir, path))
+
+
+class Snapshot(object):
+    """Read-only view of a persisted fixcache run."""
+
+    def __init__(self, path):
+        """Open the snapshot, without loading any of its tables."""
+        if not os.path.exists(path):
+            raise SnapshotError('No snapshot found at %s' % (path,))
+
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA query_only = ON')
+        self.conn.execute('PRAGMA mmap_size = %d' % (MMAP_SIZE,))
+
+        try:
+            self.meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError as de:
+            logging.warning(de)
+            raise SnapshotError('%s is not a fixcache snapshot' % (path,))
+
+        if int(self.meta['snapshot_version']) != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                'Snapshot version has to be %s' % (SNAPSHOT_VERSION,))
+
+    def close(self):
+        """Close the underlying database."""
+        self.conn.close()
+
+    def get_hexsha(self, ordinal):
+        """Return the hexsha of the commit with the given ordinal."""
+        row = self.conn.execute(
+            'SELECT hexsha FROM commits WHERE ordinal = ?',
+            (ordinal,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def get_closest_files(self, path, number):
+        """Return the most co-changed files with their occurrences."""
+        return self.conn.execute(
+            'SELECT other, occurrence FROM distances WHERE path = ? '
+            'ORDER BY occurrence DESC LIMIT ?', (path, number)).fetchall()
+
+    def score(self, path, neighbours=5):
+        """Return the risk information of a single file as a dict."""
+        row = self.conn.execute(
+            'SELECT faults, changes, last_found, line_count, in_cache '
+            'FROM files WHERE path = ?', (path,)).fetchone()
+
+        if row is None:
+            return {'path': path, 'known': False, 'in_cache': False}
+
+        faults, changes, last_found, line_count, in_cache = row
+        return {
+            'path': path,
+            'known': True,
+            'in_cache': bool(in_cache),
+            'faults': faults,
+            'changes': changes,
+            'line_count': line_count,
+            'last_found': last_found,
+            'last_found_hexsha': self.get_hexsha(last_found),
+            'closest_files': self.get_closest_files(path, neighbours),
+        }
+
+    def score_multiple(self, paths, neighbours=5):
+        """Return the risk information of several files."""
+        return [self.score(path, neighbours) for path in paths]
+
+
+def _print_text(scores):
+    print 'cache : faults : last_found : file-path : closest files'
+    for s in scores:
+        if not s['known']:
+            print '-', ':', '-', ':', '-', ':', s['path'], ':', '-'
+            continue
+        closest = ', '.join(
+            '%s (%s)' % (other, occ) for other, occ in s['closest_files'])
+        print ('hit' if s['in_cache'] else 'miss'), ':', s['faults'], ':', \
+            s['last_found'], ':', s['path'], ':', closest
+
+
+def main(args):
+    """Score the changed files given on the command line or stdin."""
+    paths = args.paths
+    if paths == ['-']:
+        paths = [line.strip() for line in sys.stdin if line.strip()]
+
+    snapshot = Snapshot(args.snapshot)
+    try:
+        scores = snapshot.score_multiple(paths, neighbours=args.n)
+    finally:
+        snapshot.close()
+
+    if args.format == 'json':
+        print json.dumps(scores, indent=2)
+    else:
+        _print_text(scores)
+
+    if args.fail_on_hit and any(s['in_cache'] for s in scores):
+        return 1
+    return 0
+
+
+parser = argparse.ArgumentParser(
+    description='Score changed files against a persisted FixCache snapshot')
+parser.add_argument('snapshot', metavar='snapshot')
+parser.add_argument(
+    'paths', metavar='path', nargs='+',
+    help="changed file paths, or '-' to read them from stdin")
+parser.add_argument('--n', '--neighbours', type=int, default=5)
+parser.add_argument('--format', choices=['text', 'json'], default='text')
+parser.add_argument('--fail_on_hit', action='store_true')
+parser.add_argument('--logging', default='info')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.logging == 'info':
+        logger.setLevel(logging.INFO)
+    elif args.logging == 'debug':
+        logger.setLevel(logging.DEBUG)
+
+    sys.exit(main(args))
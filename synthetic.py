@@ -0,0 +1,389 @@
+#! /usr/bin/env python
+"""Synthetic module, generating histories for scale benchmarks.
+
+A SyntheticHistory draws a linear history from a handful of parameters:
+the number of commits and files, the mean number of files and lines
+changed by a commit, the ratio of fixing commits and how strongly the
+files of a commit cluster together. Files are grouped into clusters of
+cluster_size, one directory per cluster, and every file of a commit is
+taken from the cluster of its first file with probability clustering.
+A changed file is deleted with probability delete_ratio, or renamed
+within its directory with probability rename_ratio.
+
+The history is generated lazily and deterministically from the seed. It
+is served either as an InMemoryBackend, pickled as a backend trace, or
+streamed into a real git repository through git fast-import. Only line
+counts are kept while generating, the git output keeps the lines of every
+file as integer ids, so both scale to millions of commits.
+"""
+import argparse
+import array
+import cPickle as pickle
+import logging
+import os
+import random
+import subprocess
+import backend
+
+
+logger = logging.getLogger('fixcache_logger')
+
+COMMITTER = 'Synthetic <synthetic@example.com>'
+BASE_TIMESTAMP = 1000000000
+
+
+class SyntheticError(Exception):
+    """Synthetic Error."""
+
+    def __init__(self, value):
+        """Initalization of the class."""
+        self.value = value
+
+    def __str__(self):
+        """String representation of the class."""
+        return repr(self.value)
+
+
+def get_hexsha(ordinal):
+    """Return the synthetic hexsha of the commit with the given ordinal."""
+    return '%040x' % (ordinal + 1,)
+
+
+class SyntheticHistory(object):
+    """Parameters and generator of a synthetic linear history."""
+
+    def __init__(self, commit_count=1000, file_count=100, commit_size=3.0,
+                 hunk_size=5.0, file_size=50, fix_ratio=0.2,
+                 clustering=0.8, cluster_size=10, delete_ratio=0.0,
+                 rename_ratio=0.0, seed=0):
+        """Initialization, the sizes are means of geometric distributions.
+        """
+        if commit_count < 1 or file_count < 1:
+            raise SyntheticError('At least one commit and file is required')
+        if not all(0.0 <= x <= 1.0 for x in (
+                fix_ratio, clustering, delete_ratio, rename_ratio)):
+            raise SyntheticError('Ratios have to be between 0.0 and 1.0')
+        if commit_size < 1.0 or hunk_size < 1.0 or file_size < 1:
+            raise SyntheticError('Sizes have to be at least 1')
+
+        self.commit_count = commit_count
+        self.file_count = file_count
+        self.commit_size = commit_size
+        self.hunk_size = hunk_size
+        self.file_size = file_size
+        self.fix_ratio = fix_ratio
+        self.clustering = clustering
+        self.cluster_size = cluster_size
+        self.delete_ratio = delete_ratio
+        self.rename_ratio = rename_ratio
+        self.seed = seed
+
+    def get_path(self, file_id, renames=0):
+        """Return the path of a file, in the directory of its cluster.
+
+        A file renamed renames times gets the number as a suffix.
+        """
+        if renames > 0:
+            return 'cluster%05d/file%07d_%d.py' % (
+                file_id // self.cluster_size, file_id, renames)
+        return 'cluster%05d/file%07d.py' % (
+            file_id // self.cluster_size, file_id)
+
+    def _geometric(self, rand, mean):
+        """Draw from a geometric distribution on 1, 2, .. with given mean."""
+        count = 1
+        p = 1.0 / mean
+        while rand.random() > p:
+            count += 1
+        return count
+
+    def _get_hunk(self, rand, line_count):
+        """Return a (old_start, old_len, new_start, new_len) hunk.
+
+        The file is never left empty, files are only deleted explicitly.
+        """
+        old_len = min(rand.randint(0, self._geometric(rand, self.hunk_size)),
+                      line_count)
+        new_len = rand.randint(0, self._geometric(rand, self.hunk_size))
+        if new_len == 0 and old_len in (0, line_count):
+            new_len = 1
+
+        if old_len == 0:
+            # insertion after old_start
+            old_start = rand.randint(0, line_count)
+            return (old_start, 0, old_start + 1, new_len)
+
+        old_start = rand.randint(1, line_count - old_len + 1)
+        if new_len == 0:
+            return (old_start, old_len, old_start - 1, 0)
+        return (old_start, old_len, old_start, new_len)
+
+    def _pick_files(self, rand, line_counts, size):
+        """Pick the ids of at most size distinct existing files.
+
+        Deleted files have no lines, picks of deleted files are dropped.
+        """
+        created = len(line_counts)
+        anchor = rand.randrange(created)
+        while line_counts[anchor] == 0:
+            anchor = rand.randrange(created)
+        cluster_start = anchor - anchor % self.cluster_size
+        cluster_end = min(cluster_start + self.cluster_size, created)
+
+        file_ids = set([anchor])
+        for _ in xrange(4 * size):
+            if len(file_ids) >= size:
+                break
+            if rand.random() < self.clustering:
+                file_id = rand.randrange(cluster_start, cluster_end)
+            else:
+                file_id = rand.randrange(created)
+            if line_counts[file_id] > 0:
+                file_ids.add(file_id)
+
+        return sorted(file_ids)
+
+    def _change_file(self, rand, file_id, line_counts, renames,
+                     live_count):
+        """Return the path, old path and hunks of a changed file.
+
+        The last existing file is never deleted.
+        """
+        path = self.get_path(file_id, renames[file_id])
+        if (self.delete_ratio > 0.0 and live_count > 1 and
+                rand.random() < self.delete_ratio):
+            hunk = (1, line_counts[file_id], 0, 0)
+            line_counts[file_id] = 0
+            return path, path, [hunk]
+
+        if self.rename_ratio > 0.0 and rand.random() < self.rename_ratio:
+            # a pure rename, so that git detects it whatever the file size
+            renames[file_id] += 1
+            return self.get_path(file_id, renames[file_id]), path, []
+
+        hunk = self._get_hunk(rand, line_counts[file_id])
+        line_counts[file_id] += hunk[3] - hunk[1]
+        return path, path, [hunk]
+
+    def iter_changes(self):
+        """Generate (ordinal, is_fix, changes, renames) for every commit.
+
+        The commits are generated in order. The changes map paths to lists
+        of hunks, the renames new paths to old paths, as used by the
+        InMemoryBackend. New files are spread evenly over the history,
+        until file_count files were created.
+        """
+        rand = random.Random(self.seed)
+        line_counts = array.array('i')
+        renames = array.array('i')
+        live_count = 0
+
+        for ordinal in xrange(self.commit_count):
+            created = len(line_counts)
+            remaining = self.commit_count - ordinal
+            new_files = 0
+            if created < self.file_count:
+                # at least one new file per commit while files are missing
+                new_files = max(
+                    (self.file_count - created) // remaining,
+                    int(created == 0 or
+                        rand.random() < float(
+                            self.file_count - created) / remaining))
+
+            is_fix = ordinal > 0 and rand.random() < self.fix_ratio
+            size = self._geometric(rand, self.commit_size)
+
+            changes = {}
+            commit_renames = {}
+            if live_count > 0 and size > new_files:
+                for file_id in self._pick_files(
+                        rand, line_counts, size - new_files):
+                    path, old_path, hunks = self._change_file(
+                        rand, file_id, line_counts, renames, live_count)
+                    changes[path] = hunks
+                    if path != old_path:
+                        commit_renames[path] = old_path
+                    elif line_counts[file_id] == 0:
+                        live_count -= 1
+
+            for file_id in xrange(created, created + new_files):
+                lines = self._geometric(rand, self.file_size)
+                line_counts.append(lines)
+                renames.append(0)
+                changes[self.get_path(file_id)] = [(0, 0, 1, lines)]
+            live_count += new_files
+
+            yield ordinal, is_fix, changes, commit_renames
+
+    def get_message(self, ordinal, is_fix):
+        """Return the commit message of a synthetic commit."""
+        if is_fix:
+            return 'Fix defect number %s\n' % (ordinal,)
+        return 'Change number %s\n' % (ordinal,)
+
+    def to_backend(self):
+        """Return an InMemoryBackend serving the whole history."""
+        commits, changes, renames = [], {}, {}
+        for ordinal, is_fix, commit_changes, commit_renames in \
+                self.iter_changes():
+            hexsha = get_hexsha(ordinal)
+            parents = [get_hexsha(ordinal - 1)] if ordinal > 0 else []
+            commits.append(backend.Commit(
+                hexsha, parents, self.get_message(ordinal, is_fix)))
+            changes[hexsha] = commit_changes
+            if len(commit_renames) > 0:
+                renames[hexsha] = commit_renames
+
+        return backend.InMemoryBackend(commits, changes, renames)
+
+    def save_trace(self, path):
+        """Persist the history as a backend trace, see load_trace()."""
+        with open(path, 'wb') as out:
+            pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+            pickler.dump(self.commit_count)
+            for ordinal, is_fix, changes, renames in self.iter_changes():
+                pickler.dump(
+                    (self.get_message(ordinal, is_fix), changes, renames))
+                # the memo would keep every change alive
+                pickler.clear_memo()
+
+    def write_fast_import(self, out, branch='master'):
+        """Stream the history as a git fast-import stream.
+
+        Every line is unique, so git diffs the files into exactly the
+        generated hunks. Renames are pure, so git detects them whatever
+        the size of the file.
+        """
+        contents = {}
+        next_line = 0
+        for ordinal, is_fix, changes, renames in self.iter_changes():
+            message = self.get_message(ordinal, is_fix)
+            out.write('commit refs/heads/%s\n' % (branch,))
+            out.write('mark :%d\n' % (ordinal + 1,))
+            out.write('committer %s %d +0000\n' % (
+                COMMITTER, BASE_TIMESTAMP + ordinal))
+            out.write('data %d\n%s\n' % (len(message), message))
+
+            for path in sorted(renames):
+                out.write('R %s %s\n' % (renames[path], path))
+                contents[path] = contents.pop(renames[path])
+
+            for path in sorted(changes):
+                if path in renames and len(changes[path]) == 0:
+                    continue
+
+                lines = contents.setdefault(path, array.array('l'))
+                offset = 0
+                for old_start, old_len, new_start, new_len in changes[path]:
+                    pos = old_start + offset
+                    if old_len > 0:
+                        pos -= 1
+                    lines[pos:pos + old_len] = array.array(
+                        'l', xrange(next_line, next_line + new_len))
+                    next_line += new_len
+                    offset += new_len - old_len
+
+                if len(lines) == 0:
+                    del contents[path]
+                    out.write('D %s\n' % (path,))
+                    continue
+
+                data = ''.join('line %d\n' % (x,) for x in lines)
+                out.write('M 100644 inline %s\ndata %d\n%s\n' % (
+                    path, len(data), data))
+
+
+def load_trace(path):
+    """Return an InMemoryBackend serving a trace saved by save_trace()."""
+    commits, changes, renames = [], {}, {}
+    try:
+        with open(path, 'rb') as in_:
+            unpickler = pickle.Unpickler(in_)
+            commit_count = unpickler.load()
+            for ordinal in xrange(commit_count):
+                message, commit_changes, commit_renames = unpickler.load()
+                hexsha = get_hexsha(ordinal)
+                parents = [get_hexsha(ordinal - 1)] if ordinal > 0 else []
+                commits.append(backend.Commit(hexsha, parents, message))
+                changes[hexsha] = commit_changes
+                if len(commit_renames) > 0:
+                    renames[hexsha] = commit_renames
+    except (IOError, EOFError, ValueError, pickle.UnpicklingError) as e:
+        logging.warning(e)
+        raise SyntheticError('Cannot load trace from %s' % (path,))
+
+    return backend.InMemoryBackend(commits, changes, renames)
+
+
+def create_repository(history, path, branch='master'):
+    """Create a git repository at path holding the synthetic history."""
+    if os.path.exists(path):
+        raise SyntheticError('The path %s already exists' % (path,))
+
+    try:
+        subprocess.check_call(['git', 'init', '-q', path])
+        fast_import = subprocess.Popen(
+            ['git', '-C', path, 'fast-import', '--quiet'],
+            stdin=subprocess.PIPE)
+        history.write_fast_import(fast_import.stdin, branch=branch)
+        fast_import.stdin.close()
+        if fast_import.wait() != 0:
+            raise SyntheticError('git fast-import failed for %s' % (path,))
+        subprocess.check_call(
+            ['git', '-C', path, 'checkout', '-q', '-f', branch])
+    except (subprocess.CalledProcessError, OSError) as e:
+        logging.warning(e)
+        raise SyntheticError('Cannot create repository at %s' % (path,))
+
+    logger.info('Synthetic repository written to %s' % (path,))
+
+
+def main(args):
+    """Generate a synthetic repository or trace."""
+    history = SyntheticHistory(
+        commit_count=args.commits, file_count=args.files,
+        commit_size=args.commit_size, hunk_size=args.hunk_size,
+        file_size=args.file_size, fix_ratio=args.fix_ratio,
+        clustering=args.clustering, cluster_size=args.cluster_size,
+        delete_ratio=args.delete_ratio, rename_ratio=args.rename_ratio,
+        seed=args.seed)
+
+    if args.format == 'git':
+        create_repository(history, args.output, branch=args.b)
+    else:
+        history.save_trace(args.output)
+
+
+parser = argparse.ArgumentParser(
+    description='Generate a synthetic history for benchmarks')
+parser.add_argument('output', metavar='output',
+                    help='path of the repository or trace to create')
+parser.add_argument('--format', choices=['git', 'trace'], default='git')
+parser.add_argument('--commits', type=int, default=1000)
+parser.add_argument('--files', type=int, default=100)
+parser.add_argument('--commit_size', type=float, default=3.0,
+                    help='mean number of files changed by a commit')
+parser.add_argument('--hunk_size', type=float, default=5.0,
+                    help='mean number of lines changed in a file')
+parser.add_argument('--file_size', type=int, default=50,
+                    help='mean number of lines of a new file')
+parser.add_argument('--fix_ratio', type=float, default=0.2)
+parser.add_argument('--clustering', type=float, default=0.8)
+parser.add_argument('--cluster_size', type=int, default=10)
+parser.add_argument('--delete_ratio', type=float, default=0.0,
+                    help='probability that a changed file is deleted')
+parser.add_argument('--rename_ratio', type=float, default=0.0,
+                    help='probability that a changed file is renamed')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--b', '--branch', type=str, default='master')
+parser.add_argument('--logging', default='info')
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.logging == 'info':
+        logger.setLevel(logging.INFO)
+    elif args.logging == 'debug':
+        logger.setLevel(logging.DEBUG)
+
+    main(args)
@@ -2,10 +2,34 @@
 import unittest
 import sys
 import os
+import json
+import shutil
+import tempfile
+import StringIO
+import sqlite3
+from fixcache import constants
 from fixcache import filemanagement
 from fixcache import cache
 from fixcache import parsing
 from fixcache import helper_functions
+from fixcache import snapshot
+from fixcache import classifier
+from fixcache import provenance
+from fixcache import backend
+from fixcache import repository
+from fixcache import synthetic
+from fixcache import benchmark
+from fixcache import timing
+from fixcache import commits
+from fixcache import results
+from fixcache import search
+from fixcache import events
+from fixcache import tracecache
+
+
+class FailingBackend(backend.InMemoryBackend):
+    def get_line_counts(self, hexsha, paths):
+        raise ValueError('cannot count the lines of %s' % (hexsha,))
 
 
 class FilemanagementTestCase(unittest.TestCase):
@@ -63,6 +87,20 @@ class FilemanagementTestCase(unittest.TestCase):
         self.assertEqual(self.distance.occurrence_list[1], 13)
         self.assertEqual(self.distance.occurrence_list, [0, 13, 15, 54])
 
+    def test_file_set_ids(self):
+        fs = filemanagement.FileSet()
+        _, f1 = fs.get_or_create_file('patha')
+        _, f2 = fs.get_or_create_file('pathb')
+        _, f3 = fs.get_or_create_file('patha')
+
+        self.assertEqual((f1.file_id, f2.file_id), (0, 1))
+        self.assertEqual(f3, f1)
+
+        fs.reset()
+
+        self.assertEqual(len(fs.files), 0)
+        self.assertEqual(fs.get_or_create_file('pathb')[1].file_id, 0)
+
     def test_distance_set(self):
         ds = filemanagement.DistanceSet()
         ds.add_occurrence(self.file1, self.file2, 0)
@@ -89,24 +127,105 @@ class FilemanagementTestCase(unittest.TestCase):
         self.assertEqual(ds.get_closest_files(self.file1, 1)[0], self.file2)
         self.assertEqual(set(ds.get_closest_files(self.file1, 8)),
                          set([self.file2, self.file3, self.file4]))
+        self.assertEqual(ds.get_footprint()[:2], (3, 9))
+
+    def test_approximate_distance_set(self):
+        ds = filemanagement.ApproximateDistanceSet(capacity=2)
+        for commit in (1, 5, 9):
+            ds.add_occurrence(self.file1, self.file2, commit)
+        ds.add_occurrence(self.file1, self.file3, 2)
+        # replaces file3, the counter with the lowest count
+        ds.add_occurrence(self.file1, self.file4, 3)
+
+        self.assertEqual(ds.get_occurrence(self.file1, self.file2), 3)
+        self.assertEqual(ds.get_occurrence(self.file2, self.file1, 5), 2)
+        self.assertEqual(ds.get_occurrence(self.file1, self.file2, 0), 0)
+        self.assertEqual(ds.get_occurrence(self.file1, self.file3), 0)
+        self.assertEqual(ds.get_occurrence(self.file1, self.file4), 2)
+        self.assertEqual(ds.get_closest_files(self.file1, 1), [self.file2])
+        self.assertEqual(ds.get_counter_count(), 5)
+        self.assertEqual(ds.get_footprint()[:2], (5, 5))
+
+        ds.remove_files([self.file2])
+
+        self.assertEqual(ds.get_closest_files(self.file1, 8), [self.file4])
+        self.assertEqual(ds.get_occurrence(self.file2, self.file1), 0)
+
+        with self.assertRaises(filemanagement.DistanceSetError):
+            ds.add_occurrence(self.file1, self.file1, 0)
+        with self.assertRaises(filemanagement.DistanceSetError):
+            filemanagement.get_distance_set('unknown')
+        self.assertIsInstance(
+            filemanagement.get_distance_set('approximate', capacity=4),
+            filemanagement.ApproximateDistanceSet)
+
+    def test_approximate_distance_set_owners(self):
+        ds = filemanagement.ApproximateDistanceSet(capacity=2)
+        files = [filemanagement.File('path%s' % i) for i in range(8)]
+        for commit in range(40):
+            ds.add_occurrence(
+                files[commit % 8], files[(commit * 3 + 1) % 8], commit)
+            if commit % 10 == 9:
+                ds.remove_files([files[commit % 5]])
+
+            owners = {}
+            for file_, sketch in ds.sketches.iteritems():
+                for other in sketch:
+                    owners.setdefault(other, set()).add(file_)
+            self.assertEqual(ds.owners, owners)
+
+        ds.remove_files(files)
+        self.assertEqual((ds.sketches, ds.owners), ({}, {}))
+
+    def test_decayed_distance_set(self):
+        ds = filemanagement.DecayedDistanceSet(half_life=10)
+        ds.add_occurrence(self.file1, self.file2, 0)
+        ds.add_occurrence(self.file1, self.file2, 0)
+        ds.add_occurrence(self.file1, self.file3, 10)
+
+        self.assertAlmostEqual(
+            ds.get_occurrence(self.file2, self.file1), 2.0)
+        self.assertAlmostEqual(
+            ds.get_occurrence(self.file1, self.file2, 10), 1.0)
+        self.assertEqual(ds.get_occurrence(self.file2, self.file3), 0)
+
+        # the old co-changes have decayed below the recent one
+        ds.add_occurrence(self.file1, self.file3, 11)
+        self.assertEqual(ds.get_closest_files(self.file1, 1), [self.file3])
+        self.assertAlmostEqual(
+            ds.get_occurrence(self.file1, self.file2, 20), 0.5)
+        self.assertEqual(ds.get_pair_count(), 2)
+        self.assertEqual(ds.get_footprint()[:2], (2, 2))
+
+        ds.remove_files([self.file3])
+
+        self.assertEqual(ds.get_closest_files(self.file1, 8), [self.file2])
+        self.assertEqual(ds.get_pair_count(), 1)
+
+        with self.assertRaises(filemanagement.DistanceSetError):
+            filemanagement.DecayedDistanceSet(half_life=0)
 
 
 class CacheTestCase(unittest.TestCase):
     def setUp(self):
-        self.file1 = filemanagement.File('patha')
-        self.file2 = filemanagement.File('pathb')
-        self.file3 = filemanagement.File('pathc')
-        self.file4 = filemanagement.File('pathd')
-        self.file5 = filemanagement.File('pathe')
-        self.cache = cache.SimpleCache(4)
+        self.file_set = filemanagement.FileSet()
+        self.file1 = self._get_file('patha')
+        self.file2 = self._get_file('pathb')
+        self.file3 = self._get_file('pathc')
+        self.file4 = self._get_file('pathd')
+        self.file5 = self._get_file('pathe')
+        self.cache = cache.Cache(4)
         self.cache.add(self.file1)
         self.cache.add(self.file2)
 
+    def _get_file(self, path):
+        return self.file_set.get_or_create_file(path)[1]
+
     def test_cache_init(self):
         with self.assertRaises(ValueError):
-            cache.SimpleCache(0)
+            cache.Cache(0)
         with self.assertRaises(ValueError):
-            cache.SimpleCache(-1)
+            cache.Cache(-1)
 
         self.assertEqual(self.cache.hit, True)
         self.assertEqual(self.cache.miss, False)
@@ -132,10 +251,10 @@ class CacheTestCase(unittest.TestCase):
         self.assertEqual(self.cache.file_in(self.file1), self.cache.miss)
 
         new_files = [
-            filemanagement.File('a'),
-            filemanagement.File('b'),
-            filemanagement.File('c'),
-            filemanagement.File('d')
+            self._get_file('a'),
+            self._get_file('b'),
+            self._get_file('c'),
+            self._get_file('d')
         ]
 
         self.cache.add_multiple(new_files)
@@ -143,6 +262,40 @@ class CacheTestCase(unittest.TestCase):
         for file_ in new_files:
             self.assertEqual(self.cache.file_in(file_), self.cache.hit)
 
+    def test_cache_evicted(self):
+        for commit, file_ in enumerate(
+                [self.file1, self.file2, self.file3, self.file4]):
+            file_.changed(commit + 1)
+        self.cache.add_multiple([self.file3, self.file4])
+        self.assertEqual(self.cache.pop_evicted(), [])
+
+        self.cache.add(self.file5)
+        self.assertEqual(self.cache.pop_evicted(), [self.file1])
+
+        new_files = [self._get_file(x) for x in 'abcde']
+        self.cache.add_multiple(new_files)
+        self.assertEqual(
+            set(self.cache.pop_evicted()),
+            set([self.file2, self.file3, self.file4, self.file5]))
+        self.assertEqual(self.cache.evicted, [])
+
+    def test_cache_members(self):
+        self.assertEqual(list(self.cache.members), [1, 1])
+
+        self.cache.remove_files([self.file1])
+
+        self.assertEqual(self.cache.file_in(self.file1), self.cache.miss)
+        self.assertEqual(self.cache.file_in(self.file2), self.cache.hit)
+        self.assertEqual(list(self.cache.members), [0, 1])
+
+        self.cache.flush()
+
+        self.assertEqual(len(self.cache.members), 0)
+
+        # a file outside of a FileSet could share the id of another file
+        with self.assertRaises(ValueError):
+            self.cache.add(filemanagement.File('pathf'))
+
     def _add_files(self):
         self.file1.changed(50)
         self.file2.changed(30)
@@ -197,6 +350,23 @@ class ParsingTestCase(unittest.TestCase):
         self.assertEqual(parsing.is_fix_commit('fixes'), True)
         self.assertEqual(parsing.is_fix_commit('patched'), True)
 
+    def test_get_deleted_intervals_from_diff(self):
+        patch = ('@@ -5 +4,0 @@ def a():\n-x\n'
+                 '@@ -6,2 +5,3 @@\n-y\n-z\n+a\n+b\n+c\n'
+                 '@@ -20,0 +21 @@\n+d\n')
+
+        self.assertEqual(
+            parsing.get_deleted_intervals_from_diff(patch), [(4, 3)])
+        self.assertEqual(
+            parsing.get_deleted_lines_from_diff(patch.splitlines()),
+            [4, 5, 6])
+
+        patch = '@@ -3,4 +3,3 @@\n a\n-b\n c\n-d\n+e\n'
+
+        self.assertEqual(
+            parsing.get_deleted_intervals_from_diff(patch, unified=1),
+            [(3, 1), (5, 1)])
+
     def test_get_top_elements(self):
         a = [54, 1, 23, 11]
 
@@ -206,9 +376,1010 @@ class ParsingTestCase(unittest.TestCase):
         self.assertFalse(1 in b)
 
 
+class _ClassifierCommit(object):
+    def __init__(self, hexsha, message):
+        self.hexsha = hexsha
+        self.message = message
+
+
+class ClassifierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.commits = [
+            _ClassifierCommit('a', 'normal, commit'),
+            _ClassifierCommit('b', 'fixes crash'),
+            _ClassifierCommit('c', 'PROJ-12: handle empty input'),
+            _ClassifierCommit('d', 'PROJ-13: new feature')]
+
+    def test_regex_classifier(self):
+        regex = classifier.RegexClassifier()
+
+        self.assertEqual(regex.classify_multiple(self.commits),
+                         [False, True, False, False])
+        for message in ['normal, commit', 'fixes', 'patched', 'see #12']:
+            self.assertEqual(regex.is_fix('x', message),
+                             parsing.is_fix_commit(message))
+
+    def test_issue_classifier(self):
+        issues = classifier.IssueClassifier(['PROJ-12'])
+        any_ = classifier.AnyClassifier(
+            [classifier.RegexClassifier(), issues])
+
+        self.assertEqual(issues.classify_multiple(self.commits),
+                         [False, False, True, False])
+        self.assertEqual(any_.classify_multiple(self.commits),
+                         [False, True, True, False])
+        self.assertNotEqual(
+            issues.name, classifier.IssueClassifier(['PROJ-13']).name)
+
+    def test_verdict_cache(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            verdicts = classifier.VerdictCache(
+                classifier.RegexClassifier(), path)
+            verdicts.classify_multiple(self.commits)
+
+            loaded = classifier.VerdictCache(None, path)
+
+            self.assertEqual(loaded.verdicts, verdicts.verdicts)
+            self.assertEqual(loaded.is_fix(self.commits[1]), True)
+        finally:
+            os.remove(path)
+
+
+class ProvenanceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = provenance.LineOriginIndex()
+        self.index.add_file('patha', 5, 0)
+
+    def test_apply_hunks(self):
+        # replace line 2, insert two lines after line 4, delete line 5
+        patch = ('@@ -2 +2 @@\n-b\n+B\n@@ -4,0 +5,2 @@\n+x\n+y\n'
+                 '@@ -5 +6,0 @@\n-e\n')
+        self.index.apply_hunks(
+            'patha', parsing.get_hunks_from_diff(patch), 3)
+
+        self.assertEqual(self.index.origins['patha'].tolist(),
+                         [0, 3, 0, 0, 3, 3])
+        self.assertEqual(
+            self.index.get_origins('patha', [(0, 2), (5, 3)]),
+            [0, 3, 3, None, None])
+
+    def test_new_and_renamed_file(self):
+        self.index.apply_hunks('pathb', [(0, 0, 1, 3)], 2)
+        self.index.rename_file('pathb', 'pathc')
+
+        self.assertEqual(self.index.get_origins('pathc', [(0, 3)]),
+                         [2, 2, 2])
+        self.assertEqual(self.index.get_origins('pathb', [(0, 1)]), [None])
+
+
+class BackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.commits = [
+            backend.Commit('a' * 40, [], 'initial commit'),
+            backend.Commit('b' * 40, ['a' * 40], 'add feature'),
+            backend.Commit('c' * 40, ['b' * 40], 'fix bug in patha'),
+        ]
+        changes = {
+            'a' * 40: {'patha': [(0, 0, 1, 4)], 'pathb': [(0, 0, 1, 2)]},
+            'b' * 40: {'patha': [(2, 1, 2, 2)], 'pathb': [(1, 2, 0, 0)]},
+            'c' * 40: {'patha': [(3, 1, 3, 1)]},
+        }
+        self.backend = backend.InMemoryBackend(self.commits, changes)
+
+    def test_in_memory_history(self):
+        self.assertEqual(
+            self.backend.get_stats(self.commits[1])['patha'],
+            {'insertions': 2, 'deletions': 1, 'lines': 3})
+        self.assertEqual(self.backend.get_line_count('b' * 40, 'patha'), 5)
+        self.assertEqual(self.backend.get_tree_files('b' * 40), ['patha'])
+
+        diffs = dict((d.b_path, d) for d in self.backend.get_diffs(
+            self.commits[1]))
+        self.assertEqual(diffs[None].deleted_file, True)
+        self.assertEqual(
+            parsing.get_deleted_intervals_from_diff(diffs['patha'].diff),
+            [(1, 1)])
+
+        blame = self.backend.blame('c' * 40, 'patha')
+        self.assertEqual([(h, len(lines)) for h, lines in blame], [
+            ('a' * 40, 1), ('b' * 40, 1), ('c' * 40, 1), ('a' * 40, 2)])
+
+    def test_blame_multiple(self):
+        class FailingBackend(backend.InMemoryBackend):
+            def blame(self, hexsha, path):
+                if path == 'pathb':
+                    raise backend.BackendError('No pathb')
+                return [(hexsha, [path])]
+
+        failing = FailingBackend(self.commits, {})
+        for workers in (1, 2):
+            failing.blame_workers = workers
+            blames = failing.blame_multiple('a' * 40, ['patha', 'pathb'])
+
+            self.assertEqual(blames['patha'], [('a' * 40, ['patha'])])
+            self.assertIsInstance(blames['pathb'], backend.BackendError)
+        failing.close()
+        self.assertEqual(failing._pool, None)
+
+        self.assertEqual(
+            self.backend.blame_multiple('b' * 40, ['patha'])['patha'],
+            self.backend.blame('b' * 40, 'patha'))
+
+    def test_cache_traces(self):
+        self.assertEqual(tracecache.cache_traces_multiple([]), [])
+
+        cached = tracecache.cache_traces_multiple(
+            ['no-such-repo', 'no-other-repo'], jobs=2)
+        self.assertEqual(sorted(x['repo'] for x in cached),
+                         ['no-other-repo', 'no-such-repo'])
+        self.assertTrue(all(x['error'] is not None for x in cached))
+
+        memory = synthetic.SyntheticHistory(
+            commit_count=50, file_count=20, seed=1).to_backend()
+        failing_backend = FailingBackend(memory.commits, memory.changes)
+        constants.REPO_DICT['failing-repo'] = tempfile.mkdtemp()
+        try:
+            cached = tracecache.cache_traces(
+                'failing-repo', backend_name=failing_backend)
+            self.assertEqual(cached['roots'], None)
+            self.assertTrue(cached['error'].startswith('ValueError'))
+
+            cached = tracecache.cache_traces_multiple(
+                ['failing-repo', 'no-such-repo'], jobs=2,
+                backend_name=failing_backend)
+            self.assertEqual(
+                sorted((x['repo'], x['error'].split(':')[0])
+                       for x in cached),
+                [('failing-repo', 'ValueError'),
+                 ('no-such-repo', 'Unknown repository, please update '
+                                  'constants.py')])
+        finally:
+            del constants.REPO_DICT['failing-repo']
+
+    def test_line_counts(self):
+        self.assertEqual(backend.count_stream_lines(
+            StringIO.StringIO('a\nb\nc'), 5), 3)
+        self.assertEqual(backend.count_stream_lines(
+            StringIO.StringIO('a\n' * 40000), 80000), 40000)
+        self.assertEqual(backend.count_stream_lines(StringIO.StringIO(''), 0),
+                         0)
+        counts = self.backend.get_line_counts('b' * 40, ['patha'])
+        self.assertEqual(counts, {'patha': 5})
+
+        trace_path = os.path.join(tempfile.mkdtemp(), 'line_counts.txt')
+        backend.save_line_counts(trace_path, {u'd\xe9j\xe0': 3, 'a b': 7})
+        self.assertEqual(backend.load_line_counts(trace_path),
+                         {u'd\xe9j\xe0': 3, u'a b': 7})
+
+    def test_parse_patch(self):
+        lines = [
+            'diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"\n',
+            'index 1..2 100644\n',
+            '--- "a/caf\\303\\251.py"\n',
+            '+++ "b/caf\\303\\251.py"\n',
+            '@@ -2 +2 @@\n', '-b\n', '+B\n',
+            'diff --git a/x b/y.py b/x b/y.py\n',
+            'deleted file mode 100644\n',
+            '--- a/x b/y.py\t\n',
+            '+++ /dev/null\n',
+            '@@ -1 +0,0 @@\n', '-y\n',
+            'diff --git a/caf\xc3\xa9.py b/th\xc3\xa9.py\n',
+            'similarity index 90%\n',
+            'rename from "caf\\303\\251.py"\n',
+            'rename to "th\\303\\251.py"\n',
+        ]
+        subprocess_backend = backend.SubprocessBackend.__new__(
+            backend.SubprocessBackend)
+        diffs = subprocess_backend._parse_patch(lines)
+
+        self.assertEqual(
+            [(d.a_path, d.b_path, d.renamed, d.deleted_file) for d in diffs],
+            [(u'caf\xe9.py', u'caf\xe9.py', False, False),
+             (u'x b/y.py', None, False, True),
+             (u'caf\xe9.py', u'th\xe9.py', True, False)])
+        self.assertEqual(diffs[0].diff, '@@ -2 +2 @@\n-b\n+B\n')
+
+    def test_parse_ls_tree(self):
+        out = ('100644 blob %s\tpatha\x00160000 commit %s\tsub\x00'
+               '100755 blob %s\tdir/pathb\x00') % (
+                   '1' * 40, '2' * 40, '3' * 40)
+        self.assertEqual(backend.parse_ls_tree(out), [
+            ('patha', '1' * 40), ('dir/pathb', '3' * 40)])
+
+    def test_repository_timer(self):
+        repo = repository.Repository(
+            'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+            pre_fetch_size=0.5, backend=self.backend)
+        repo.run_fixcache()
+
+        summary = repo.timer.get_summary()
+        self.assertEqual((summary['commits'], summary['fix_commits']), (3, 1))
+        self.assertEqual(summary['phases']['stats']['calls'], 3)
+        self.assertEqual(len(repo.timer.get_row()), len(timing.COLUMNS))
+
+        repo.reset()
+        self.assertEqual(repo.timer.get_summary()['commits'], 0)
+
+    def test_repository_events(self):
+        repo = repository.Repository(
+            'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+            pre_fetch_size=0.5, backend=self.backend)
+        replay = list(repo.iter_fixcache())
+
+        # the file prefetched by the root commit is a tie
+        self.assertEqual(
+            [(x.commit, x.kind) for x in replay if x.kind != 'prefetch'],
+            [(0, 'created'), (0, 'created'), (1, 'deleted'), (2, 'hit')])
+        self.assertEqual(replay[2].kind, 'prefetch')
+        self.assertEqual(replay[3].get_paths(), ['pathb'])
+        self.assertEqual(str(replay[-1]), '2 hit patha')
+        # only run_fixcache counts
+        self.assertEqual(repo.hit_count, 0)
+
+        repo.reset()
+        first = next(repo.iter_fixcache())
+        self.assertIsInstance(first, events.FileCreated)
+        self.assertEqual(repo.timer.commits, 1)
+
+        repo.reset()
+        repo.run_fixcache()
+        self.assertEqual((repo.hit_count, repo.miss_count), (1, 0))
+
+    def test_repository_tree_files(self):
+        repo = repository.Repository(
+            'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+            pre_fetch_size=0.5, backend=self.backend)
+        files = repo._get_commit_tree_files(repo.commit_list[-1])
+        repo.reset(cache_ratio=0.5)
+
+        self.assertEqual(files, ('patha',))
+        self.assertTrue(
+            repo._get_commit_tree_files(repo.commit_list[-1]) is files)
+        self.assertEqual(repo.tree_files.keys(), ['c' * 40])
+        self.assertEqual(repo.cache_traces(), 1)
+        self.assertEqual(repo.line_counts.keys(), ['a' * 40])
+
+    def test_repository_profiler(self):
+        repo = repository.Repository(
+            'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+            pre_fetch_size=0.5, backend=self.backend, profile_interval=2)
+        repo.run_fixcache()
+
+        samples = repo.profiler.samples
+        self.assertEqual([x['commits'] for x in samples], [2, 3])
+        self.assertEqual(samples[-1]['files'], 1)
+        self.assertEqual(samples[-1]['retained_commits'], 3)
+        self.assertEqual(samples[-1]['cache_files'], 1)
+
+    def test_random_repository_expected_hits(self):
+        history = [
+            backend.Commit('a' * 40, [], 'initial commit'),
+            backend.Commit('b' * 40, ['a' * 40], 'fix bug in path1'),
+            backend.Commit('c' * 40, ['b' * 40], 'add feature'),
+            backend.Commit('d' * 40, ['c' * 40], 'fix bug in path5'),
+        ]
+        changed = (1, 1, 1, 1)
+        changes = {
+            'a' * 40: dict(('path%s' % i, [(0, 0, 1, 2)])
+                           for i in range(1, 5)),
+            'b' * 40: {'path1': [changed], 'path2': [changed]},
+            'c' * 40: {'path5': [(0, 0, 1, 2)]},
+            'd' * 40: {'path1': [changed], 'path3': [changed],
+                       'path5': [changed]},
+        }
+        repo = repository.RandomRepository(
+            'in-memory', cache_ratio=0.4,
+            backend=backend.InMemoryBackend(history, changes))
+        repo.run_fixcache()
+
+        self.assertEqual(repo.cache_size, 2)
+        self.assertEqual(repo.fix_events, [(4, 2), (5, 3)])
+        self.assertEqual(repo.hit_count + repo.miss_count, 5)
+
+        # hypergeometric, 2 of 4 files then 3 of 5 files, 2 of them cached
+        hits, misses, sd = repo.get_expected_hits(2)
+        self.assertAlmostEqual(hits, 2 * 2 / 4.0 + 3 * 2 / 5.0)
+        self.assertAlmostEqual(misses, 5 - hits)
+        self.assertAlmostEqual(
+            sd, (2 * 0.5 * 0.5 * 2 / 3.0 + 3 * 0.4 * 0.6 * 2 / 4.0) ** 0.5)
+
+        # a cache of every file hits every time
+        self.assertEqual(repo.get_expected_hits(5), (5.0, 0.0, 0.0))
+        self.assertEqual(repo.get_expected_hits(10), (5.0, 0.0, 0.0))
+
+        # no file existed, the changed file is missed
+        repo.fix_events.append((0, 1))
+        self.assertEqual(repo.get_expected_hits(10), (5.0, 1.0, 0.0))
+
+        repo.reset()
+        self.assertEqual(repo.fix_events, [])
+
+        # the analytic replay draws no random cache
+        repo.run_fixcache(sampled=False)
+        self.assertEqual(repo.fix_events, [(4, 2), (5, 3)])
+        self.assertEqual((repo.hit_count, repo.miss_count), (0, 0))
+
+    def test_repository_in_memory(self):
+        for line_provenance in (False, True):
+            repo = repository.Repository(
+                'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+                pre_fetch_size=0.5, line_provenance=line_provenance,
+                backend=self.backend)
+            repo.run_fixcache()
+
+            self.assertEqual(repo.head, 'c' * 40)
+            self.assertEqual(repo.file_count, 1)
+            self.assertEqual((repo.hit_count, repo.miss_count), (1, 0))
+            self.assertEqual(repo.file_set.files['patha'].faults, 1)
+
+        for distance in ('approximate', 'decayed'):
+            repo = repository.Repository(
+                'in-memory', cache_ratio=1.0, distance_to_fetch=0.5,
+                pre_fetch_size=0.5, backend=self.backend, distance=distance)
+            repo.run_fixcache()
+
+            self.assertEqual((repo.hit_count, repo.miss_count), (1, 0))
+
+
+class CommitTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = commits.CommitTable()
+        self.table.append('a' * 40, [], False)
+        self.table.append('b' * 40, ['a' * 40], True)
+        self.table.append('c' * 40, ['b' * 40, 'a' * 40], False)
+
+    def test_table(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.get_index('b' * 40), 1)
+        self.assertEqual(self.table.get_index('d' * 40), None)
+        self.assertEqual(self.table.get_parents(0), ())
+        self.assertEqual(self.table.get_parents(1), ('a' * 40,))
+        self.assertEqual(self.table.get_parents(2), ('b' * 40, 'a' * 40))
+        self.assertEqual(
+            [self.table.is_fix(x) for x in range(3)], [False, True, False])
+
+    def test_commit_list(self):
+        commit_list = commits.CommitList(self.table)
+        head, tail = commit_list[:1], commit_list[1:]
+
+        self.assertEqual([c.hexsha for c in tail], ['b' * 40, 'c' * 40])
+        self.assertEqual(tail[-1].index, 2)
+        self.assertEqual(len(head + tail), 3)
+        self.assertEqual((head + tail)[1].fix, True)
+        with self.assertRaises(IndexError):
+            head[1]
+
+
+class SyntheticTestCase(unittest.TestCase):
+    def setUp(self):
+        self.history = synthetic.SyntheticHistory(
+            commit_count=50, file_count=20, fix_ratio=0.5, seed=1)
+
+    def test_history(self):
+        memory = self.history.to_backend()
+        commits = memory.iter_commits('master')
+
+        self.assertEqual(len(commits), 50)
+        self.assertEqual(commits[1].parents, (commits[0].hexsha,))
+        self.assertEqual(len(memory.get_tree_files(commits[-1].hexsha)), 20)
+        self.assertTrue(0 < sum(
+            parsing.is_fix_commit(c.message) for c in commits) < 50)
+
+    def test_save_load_trace(self):
+        fd, path = tempfile.mkstemp(suffix='.trace')
+        os.close(fd)
+        try:
+            self.history.save_trace(path)
+            loaded = synthetic.load_trace(path)
+
+            self.assertEqual(loaded.changes, self.history.to_backend().changes)
+        finally:
+            os.remove(path)
+
+
+    def test_deletions_and_renames(self):
+        history = synthetic.SyntheticHistory(
+            commit_count=200, file_count=30, fix_ratio=0.3,
+            delete_ratio=0.1, rename_ratio=0.1, seed=2)
+        memory = history.to_backend()
+        commits = memory.iter_commits('master')
+        diffs = [d for c in commits[1:] for d in memory.get_diffs(c)]
+
+        self.assertTrue(any(d.deleted_file for d in diffs))
+        self.assertTrue(any(d.renamed for d in diffs))
+        head = set(memory.get_tree_files(commits[-1].hexsha))
+        self.assertTrue(0 < len(head) < 30)
+
+        for line_provenance in (False, True):
+            repo = repository.Repository(
+                'in-memory', cache_ratio=0.2, distance_to_fetch=0.3,
+                pre_fetch_size=0.2, line_provenance=line_provenance,
+                backend=memory)
+            repo.run_fixcache()
+
+            self.assertEqual(set(repo.file_set.files), head)
+            if line_provenance:
+                self.assertEqual(set(repo.line_origins.origins), head)
+
+    def test_fast_import(self):
+        history = synthetic.SyntheticHistory(
+            commit_count=60, file_count=15, delete_ratio=0.1,
+            rename_ratio=0.1, seed=3)
+        memory = history.to_backend()
+        path = os.path.join(tempfile.mkdtemp(), 'synthetic')
+        git_backend = None
+        try:
+            synthetic.create_repository(history, path)
+            git_backend = backend.SubprocessBackend(path)
+            commits = git_backend.iter_commits('master')
+
+            self.assertEqual(len(commits), 60)
+            for commit, memory_commit in zip(
+                    commits[1:], memory.iter_commits('master')[1:]):
+                self.assertEqual(git_backend.get_stats(commit),
+                                 memory.get_stats(memory_commit))
+                self.assertEqual(
+                    sorted((d.a_path, d.b_path, d.renamed, d.deleted_file)
+                           for d in git_backend.get_diffs(commit)),
+                    sorted((d.a_path, d.b_path, d.renamed, d.deleted_file)
+                           for d in memory.get_diffs(memory_commit)))
+            self.assertEqual(
+                sorted(git_backend.get_tree_files(commits[-1].hexsha)),
+                sorted(memory.get_tree_files(
+                    memory.iter_commits('master')[-1].hexsha)))
+        finally:
+            if git_backend is not None:
+                git_backend.close()
+            shutil.rmtree(os.path.dirname(path))
+
+    def test_repository_close(self):
+        history = synthetic.SyntheticHistory(commit_count=10, file_count=5)
+        memory = history.to_backend()
+        roots = constants.REPO_DIR, constants.TRACE_ROOT
+        constants.REPO_DIR = tempfile.mkdtemp()
+        constants.TRACE_ROOT = tempfile.mkdtemp()
+        try:
+            synthetic.create_repository(
+                history, os.path.join(constants.REPO_DIR, 'synthetic'))
+            with repository.Repository(
+                    'synthetic', cache_ratio=0.5,
+                    backend='subprocess') as repo:
+                repo.run_fixcache()
+                self.assertNotEqual(repo.backend._cat_file, None)
+            # the backend opened by the repository is closed
+            self.assertEqual(repo.backend._cat_file, None)
+
+            memory.blame_workers = 2
+            memory.blame_multiple(memory.iter_commits('master')[0].hexsha,
+                                  ['file0', 'file1'])
+            with repository.Repository(
+                    'synthetic', cache_ratio=0.5, backend=memory):
+                pass
+            # a given backend is left open
+            self.assertNotEqual(memory._pool, None)
+            memory.close()
+        finally:
+            shutil.rmtree(constants.REPO_DIR)
+            shutil.rmtree(constants.TRACE_ROOT)
+            constants.REPO_DIR, constants.TRACE_ROOT = roots
+
+
+class _FrozenWindowedRepository(repository.WindowedRepository):
+    """Records the cache and the files of every window cut, as sets."""
+
+    def _open_horizon(self, window, writer=None):
+        self.frozen[window] = (
+            set(x.path for x in self.cache.file_set),
+            set(self.file_set.files))
+        return super(_FrozenWindowedRepository, self)._open_horizon(
+            window, writer)
+
+
+class WindowedRepositoryTestCase(unittest.TestCase):
+    def setUp(self):
+        history = synthetic.SyntheticHistory(
+            commit_count=200, file_count=40, delete_ratio=0.05,
+            rename_ratio=0.05, seed=7)
+        self.backend = history.to_backend()
+
+    def _get_repository(self, window, cls=repository.WindowedRepository):
+        return cls(
+            repo_dir='synthetic', cache_ratio=0.2, distance_to_fetch=0.3,
+            pre_fetch_size=0.2, window=window, backend=self.backend)
+
+    def _get_expected_rows(self, repo, window):
+        """Score the horizon of a window with sets, from the frozen cut."""
+        cache_paths, paths = repo.frozen[window]
+        c_list = repo.commit_list + repo.horizon_commit_list
+        faulty, normal = set(), set()
+        rows = []
+        for counter, commit in enumerate(
+                [c for c in c_list[repo.window_cuts[window]:]
+                 if len(c.parents) == 1], 1):
+            changed = set(self.backend.get_stats(commit)) & paths
+            if not repo.commit_table.is_fix(commit.index):
+                normal |= changed
+                continue
+
+            faulty |= changed
+            normal_only = normal - faulty
+            row = (counter, len(faulty & cache_paths),
+                   len(normal_only & cache_paths),
+                   len(normal_only - cache_paths),
+                   len(faulty - cache_paths))
+            rows.append(row + (sum(row[1:]), commit.hexsha))
+
+        return rows
+
+    def test_horizon_rows(self):
+        repo = self._get_repository(0.6, cls=_FrozenWindowedRepository)
+        repo.frozen = {}
+        rows = repo.evaluate()
+
+        self.assertTrue(len(rows) > 5)
+        self.assertEqual(rows, self._get_expected_rows(repo, 0.6))
+        self.assertTrue(any(row[2] > 0 for row in rows))
+        self.assertTrue(any(row[4] > 0 for row in rows))
+
+    def test_several_windows(self):
+        windows = [0.5, 0.7, 0.9]
+        repo = self._get_repository(windows)
+        outputs = repo.evaluate()
+
+        self.assertEqual(sorted(outputs), windows)
+        for window in windows:
+            self.assertTrue(len(outputs[window]) > 0)
+            self.assertEqual(
+                outputs[window], self._get_repository(window).evaluate())
+
+    def test_window_without_horizon(self):
+        repo = self._get_repository(1.0)
+
+        self.assertEqual(len(repo.horizon_commit_list), 0)
+        self.assertEqual(repo.evaluate(), [])
+
+        outputs = self._get_repository([0.8, 1.0]).evaluate()
+        self.assertEqual(outputs[1.0], [])
+        self.assertEqual(outputs[0.8], self._get_repository(0.8).evaluate())
+
+    def test_reset_windows(self):
+        repo = self._get_repository(0.9)
+        single = repo.evaluate()
+
+        repo.reset(window=[0.6, 0.9])
+        self.assertEqual(repo.windows, [0.6, 0.9])
+        self.assertEqual(len(repo.commit_list), 180)
+        outputs = repo.evaluate()
+        self.assertEqual(outputs[0.9], single)
+        self.assertEqual(outputs[0.6], self._get_repository(0.6).evaluate())
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_memory_suite(self):
+        history = synthetic.SyntheticHistory(commit_count=30, file_count=10)
+        suite = benchmark.BenchmarkSuite(history, repeat=1, sample=5)
+        try:
+            results = suite.run(
+                ['diff_parsing', 'blame', 'distance_update', 'cache'])
+        finally:
+            suite.close()
+
+        self.assertEqual(sorted(results), [
+            'blame', 'cache', 'diff_parsing', 'distance_update'])
+        self.assertEqual(results['cache']['units'], 30)
+        self.assertEqual(results['cache']['unit'], 'commits')
+        self.assertTrue(results['cache']['seconds'] > 0)
+        self.assertEqual(results['blame']['units'], 5)
+
+    def test_measure_setup(self):
+        calls = []
+        result = benchmark.measure(
+            lambda: calls.append('run'), 1, 'runs', repeat=2,
+            setup=lambda: calls.append('setup'))
+
+        self.assertEqual(calls, ['setup', 'run', 'setup', 'run'])
+        self.assertEqual(result['units'], 1)
+
+    def test_save_results(self):
+        root = constants.BENCHMARK_ROOT
+        constants.BENCHMARK_ROOT = tempfile.mkdtemp()
+        try:
+            history = synthetic.SyntheticHistory(
+                commit_count=30, file_count=10)
+            parameters = benchmark.get_parameters(history)
+            benchmark.save_results({'cache': 1, 'blame': 2}, parameters,
+                                   'memory', revision='r')
+            benchmark.save_results({'cache': 3}, parameters, 'memory',
+                                   revision='r')
+            parameters['seed'] += 1
+            path = benchmark.save_results({'cache': 4}, parameters, 'memory',
+                                          revision='r')
+            with open(path) as in_:
+                runs = json.load(in_)['runs']
+        finally:
+            shutil.rmtree(constants.BENCHMARK_ROOT)
+            constants.BENCHMARK_ROOT = root
+
+        self.assertEqual(sorted(run['results']['cache']
+                                for run in runs.itervalues()), [3, 4])
+        self.assertTrue(all(len(run['results']) == 1
+                            for run in runs.itervalues()))
+
+
+class _SnapshotCommit(object):
+    def __init__(self, hexsha):
+        self.hexsha = hexsha
+
+
+class _SnapshotRepository(object):
+    def __init__(self):
+        self.repo_dir = 'snapshot-test'
+        self.commit_list = [_SnapshotCommit('%040d' % x) for x in range(3)]
+        self.cache_size = 1
+        self.distance_to_fetch = 1
+        self.pre_fetch_size = 1
+        self.file_set = filemanagement.FileSet()
+        self.file_distances = filemanagement.DistanceSet()
+        self.cache = cache.Cache(self.cache_size)
+
+
+class ResultStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = results.ResultStore(
+            os.path.join(self.dir, 'results.sqlite3'), batch_size=2)
+        timings = (0.0,) * len(timing.COLUMNS)
+        for cr, hits in [(0.1, 1), (0.2, 3), (0.3, 2)]:
+            self.store.add_analysis(
+                5, 'cache_ratio_progressive', cr, 0.1, 0.2,
+                ('repo1', hits, 4 - hits, 1, 3, 2, 1.5) + timings,
+                head='a' * 40)
+        self.store.add_analysis(
+            5, 'cache_ratio_progressive', 0.1, 0.1, 0.2,
+            ('repo2', 1, 1, 1, 3, 2, 1.5) + timings, head='a' * 40)
+        self.timings = timings
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_analysis(self):
+        self.assertEqual(len(self.store.pending), 0)
+        self.assertEqual(self.store.has_analysis(
+            'repo1', 'version_5', 'cache_ratio_progressive', 0.1 + 0.2,
+            0.1, 0.2, head='a' * 40), True)
+        self.assertEqual(self.store.has_analysis(
+            'repo1', 5, 'cache_ratio_progressive', 0.4, 0.1, 0.2,
+            head='a' * 40), False)
+
+        rows = self.store.get_analysis(
+            'repo1', 5, 'cache_ratio_progressive', distance_to_fetch=0.1,
+            pre_fetch_size=0.2)
+        self.assertEqual([row['hits'] for row in rows], [1, 3, 2])
+
+        best = self.store.get_best_hit_rates(5)
+        self.assertEqual([(row['repo'], row['cr'], row['hit_rate'])
+                          for row in best],
+                         [('repo1', 0.2, 0.75), ('repo2', 0.1, 0.5)])
+
+    def test_analysis_stale(self):
+        self.assertEqual(self.store.has_analysis(
+            'repo1', 5, 'cache_ratio_progressive', 0.1, 0.1, 0.2,
+            head='b' * 40), False)
+        self.assertEqual(self.store.has_analysis(
+            'repo1', 5, 'cache_ratio_progressive', 0.1, 0.1, 0.2,
+            branch='develop', head='a' * 40), False)
+
+        self.store.add_analysis(
+            5, 'cache_ratio_progressive', 0.1, 0.1, 0.2,
+            ('repo1', 4, 0, 1, 3, 2, 1.5) + self.timings, head='b' * 40)
+        rows = self.store.get_analysis(
+            'repo1', 5, 'cache_ratio_progressive', branch='master')
+        self.assertEqual([(row['hits'], row['head']) for row in rows], [
+            (4, 'b' * 40), (3, 'a' * 40), (2, 'a' * 40)])
+        self.assertEqual(len(self.store.get_analysis(
+            'repo1', 5, 'cache_ratio_progressive', head='a' * 40)), 2)
+
+    def test_analysis_new_head(self):
+        for head in ['a' * 40, 'b' * 40]:
+            self.store.add_analysis(
+                'random', 'random_cache_analytic', 0.1, None, None,
+                ('repo1', 1, 3, 1, None, None, 0) + self.timings,
+                hits_low=0.5, hits_high=1.5, head=head)
+        rows = self.store.get_analysis(
+            'repo1', 'random', 'random_cache_analytic')
+        self.assertEqual([row['head'] for row in rows], ['b' * 40])
+
+        self.store.add_analysis(
+            5, 'cache_ratio_progressive', 0.3, 0.1, 0.2,
+            ('repo1', 1, 3, 1, 3, 2, 1.5) + self.timings, head='b' * 40)
+        rows = self.store.get_analysis(
+            'repo1', 5, 'cache_ratio_progressive', latest=True)
+        self.assertEqual([(row['cr'], row['hits']) for row in rows],
+                         [(0.3, 1)])
+        best = self.store.get_best_hit_rates(5)
+        self.assertEqual([(row['repo'], row['cr'], row['hit_rate'])
+                          for row in best],
+                         [('repo1', 0.3, 0.25), ('repo2', 0.1, 0.5)])
+
+    def test_analysis_classifier(self):
+        history = [
+            backend.Commit('a' * 40, [], 'initial commit'),
+            backend.Commit('b' * 40, ['a' * 40], 'fix bug in patha'),
+        ]
+        changes = {
+            'a' * 40: {'patha': [(0, 0, 1, 2)]},
+            'b' * 40: {'patha': [(1, 1, 1, 1)]},
+        }
+        regex_repo = repository.Repository(
+            'in-memory', cache_ratio=1.0,
+            backend=backend.InMemoryBackend(history, changes))
+        issues_repo = repository.Repository(
+            'in-memory', cache_ratio=1.0,
+            backend=backend.InMemoryBackend(history, changes),
+            classifier=classifier.IssueClassifier(['PROJ-12']))
+        self.assertEqual(regex_repo.head, issues_repo.head)
+
+        self.store.add_analysis(
+            5, 'cache_ratio', 0.1, 0.1, 0.2,
+            ('in-memory', 1, 0, 1, 1, 1, 1.5) + self.timings,
+            head=regex_repo.head, classifier=regex_repo.classifier.name)
+        self.assertEqual(self.store.has_analysis(
+            'in-memory', 5, 'cache_ratio', 0.1, 0.1, 0.2,
+            head=regex_repo.head, classifier=regex_repo.classifier.name),
+            True)
+        # the --issues run does not reuse the rows of the regexes
+        self.assertEqual(self.store.has_analysis(
+            'in-memory', 5, 'cache_ratio', 0.1, 0.1, 0.2,
+            head=issues_repo.head, classifier=issues_repo.classifier.name),
+            False)
+
+        self.store.add_analysis(
+            5, 'cache_ratio', 0.1, 0.1, 0.2,
+            ('in-memory', 0, 0, 1, 1, 1, 1.5) + self.timings,
+            head=issues_repo.head, classifier=issues_repo.classifier.name)
+        rows = self.store.get_analysis(
+            'in-memory', 5, 'cache_ratio',
+            classifier=regex_repo.classifier.name)
+        self.assertEqual([row['hits'] for row in rows], [1])
+        self.assertEqual(len(self.store.get_analysis(
+            'in-memory', 5, 'cache_ratio')), 2)
+
+    def test_schema_upgrade(self):
+        path = os.path.join(self.dir, 'old.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            'CREATE TABLE analysis (repo TEXT NOT NULL, version TEXT NOT '
+            'NULL, analysis TEXT NOT NULL, cr REAL NOT NULL, dtf REAL, '
+            'pfs REAL, hits INTEGER, misses INTEGER, created TEXT, '
+            'UNIQUE (repo, version, cr, dtf, pfs, analysis));\n'
+            'CREATE TABLE evaluation (id INTEGER PRIMARY KEY, repo TEXT, '
+            'version TEXT, cr REAL, dtf REAL, pfs REAL, window REAL, '
+            'commit_num INTEGER);\n'
+            "INSERT INTO analysis VALUES ('repo1', 'version_5', "
+            "'cache_ratio', 0.1, 0.1, 0.2, 1, 1, '2016');\n"
+            "INSERT INTO evaluation VALUES (7, 'repo1', 'version_5', 0.1, "
+            "0.3, 0.2, 0.9, 10);\n")
+        connection.commit()
+        connection.close()
+
+        store = results.ResultStore(path)
+        self.assertEqual(
+            [(row['hits'], row['branch'], row['head']) for row in
+             store.get_analysis('repo1', 5, 'cache_ratio')],
+            [(1, 'master', None)])
+        self.assertEqual(store.has_analysis(
+            'repo1', 5, 'cache_ratio', 0.1, 0.1, 0.2, head='a' * 40), False)
+        self.assertEqual(store.get_evaluation(
+            'repo1', 5, 0.1, 0.3, 0.2)['id'], 7)
+
+        store.add_analysis(
+            5, 'cache_ratio', 0.1, 0.1, 0.2,
+            ('repo1', 2, 1, 1, 3, 2, 1.5) + self.timings, branch='develop',
+            head='a' * 40)
+        self.assertEqual(len(store.get_analysis('repo1', 5, 'cache_ratio')),
+                         2)
+        store.close()
+
+    def test_schema_upgrade_classifier(self):
+        # a store of SCHEMA_VERSION 1, keyed without the classifier
+        path = os.path.join(self.dir, 'old.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            'CREATE TABLE analysis (repo TEXT NOT NULL, version TEXT NOT '
+            'NULL, branch TEXT NOT NULL, head TEXT, analysis TEXT NOT '
+            'NULL, cr REAL NOT NULL, dtf REAL, pfs REAL, hits INTEGER, '
+            'misses INTEGER, hit_rate REAL, created TEXT, '
+            'UNIQUE (repo, version, branch, cr, dtf, pfs, analysis));\n'
+            'CREATE INDEX analysis_hit_rate ON analysis '
+            '(version, repo, hit_rate);\n'
+            "INSERT INTO analysis VALUES ('repo1', 'version_5', 'develop', "
+            "'%s', 'cache_ratio', 0.1, 0.1, 0.2, 1, 1, 0.5, '2016');\n"
+            'PRAGMA user_version = 1;\n' % ('a' * 40,))
+        connection.commit()
+        connection.close()
+
+        store = results.ResultStore(path)
+        self.assertEqual(
+            [(row['branch'], row['classifier'], row['head']) for row in
+             store.get_analysis('repo1', 5, 'cache_ratio')],
+            [('develop', '', 'a' * 40)])
+        self.assertEqual(store.has_analysis(
+            'repo1', 5, 'cache_ratio', 0.1, 0.1, 0.2, branch='develop',
+            head='a' * 40, classifier='regexclassifier_x'), False)
+        indexes = [row[0] for row in store.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND "
+            "tbl_name = 'analysis'")]
+        self.assertTrue('analysis_hit_rate' in indexes)
+        self.assertTrue('analysis_latest' in indexes)
+        store.close()
+
+    def test_evaluation(self):
+        metadata = {'cache_size': 2, 'commit_num': 10, 'file_count': 5}
+        rows = [(0, 1, 1, 2, 1, 5, 'a' * 40), (3, 2, 0, 3, 0, 5, 'b' * 40)]
+        self.store.add_evaluation('repo1', 5, 0.1, 0.3, 0.2, 0.9, metadata,
+                                  rows, head='a' * 40)
+        self.store.add_evaluation('repo1', 5, 0.1, 0.3, 0.2, 0.9, metadata,
+                                  rows[:1], head='b' * 40)
+
+        self.assertEqual(self.store.get_evaluation(
+            'repo1', 5, 0.1, 0.3, 0.2, head='a' * 40), None)
+        evaluation = self.store.get_evaluation(
+            'repo1', 5, 0.1, 0.3, 0.2, head='b' * 40)
+        self.assertEqual(evaluation['commit_num'], 10)
+        self.assertEqual(
+            [row['hexsha'] for row in
+             self.store.get_evaluation_rows(evaluation['id'])], ['a' * 40])
+        self.assertEqual(
+            self.store.has_evaluation('repo1', 5, 0.1, 0.3, 0.2, 0.5), False)
+
+    def test_evaluation_writer(self):
+        path = os.path.join(self.dir, 'evaluate.csv.partial')
+        rows = [(i * 2, i, 0, 5 - i, 0, 5, 'a' * 40) for i in range(1, 6)]
+        writer = results.EvaluationWriter(path, 'a' * 40, batch_size=2)
+        for row in rows[:3]:
+            writer.add(row)
+        # interrupted, with the third row pending and a row cut short
+        writer.out.write('8,4,0')
+        writer.out.close()
+
+        writer = results.EvaluationWriter(path, 'a' * 40, batch_size=2)
+        self.assertEqual((writer.resumed, writer.rows), (4, 2))
+        for row in rows:
+            writer.add(row)
+        writer.close()
+        self.assertEqual(list(writer.iter_rows()), rows)
+
+        file_ = os.path.join(self.dir, 'evaluate.csv')
+        writer.finish(file_)
+        self.assertFalse(os.path.exists(path))
+        with open(file_, 'rb') as csv_file:
+            self.assertEqual(len(csv_file.readlines()), 6)
+
+        writer = results.EvaluationWriter(path, 'a' * 40)
+        writer.close()
+        writer = results.EvaluationWriter(path, 'b' * 40)
+        self.assertEqual(writer.resumed, None)
+        writer.close()
+
+    def test_evaluation_writer_other_classifier(self):
+        path = os.path.join(self.dir, 'evaluate.csv.partial')
+        rows = [(i * 2, i, 0, 5 - i, 0, 5, 'a' * 40) for i in range(1, 4)]
+        writer = results.EvaluationWriter(
+            path, 'a' * 40, classifier='issueclassifier_1')
+        for row in rows[:2]:
+            writer.add(row)
+        # interrupted --issues run
+        writer.close()
+
+        writer = results.EvaluationWriter(
+            path, 'a' * 40, classifier='regexclassifier_1')
+        self.assertEqual((writer.resumed, writer.rows), (None, 0))
+        writer.add(rows[2])
+        writer.close()
+        self.assertEqual(list(writer.iter_rows()), rows[2:])
+
+        writer = results.EvaluationWriter(
+            path, 'a' * 40, branch='develop', classifier='regexclassifier_1')
+        self.assertEqual(writer.resumed, None)
+        writer.close()
+
+    def test_export_csv(self):
+        self.assertEqual(self.store.export_csv(5, self.dir), 2)
+
+        path = os.path.join(
+            self.dir, 'version_5', 'repo1',
+            'analyse_by_cache_ratio_progressive_dtf_0.1_pfs_0.2.csv')
+        with open(path, 'r') as csv_file:
+            lines = csv_file.read().splitlines()
+        self.assertEqual(lines[0].split(',')[:7], results.ANALYSIS_COLUMNS)
+        self.assertEqual(
+            [line.split(',')[1:6] for line in lines[1:]],
+            [['1', '3', '1', '3', '2'], ['3', '1', '1', '3', '2'],
+             ['2', '2', '1', '3', '2']])
+
+
+class SearchTestCase(unittest.TestCase):
+    def test_golden_section_search(self):
+        calls = []
+
+        def function(value):
+            calls.append(value)
+            return -(value - 13) ** 2
+
+        self.assertEqual(
+            search.golden_section_search(function, range(21)), 13)
+        self.assertLess(len(set(calls)), 21)
+
+        self.assertEqual(
+            search.golden_section_search(lambda v: 0, range(5)), 0)
+        self.assertEqual(search.golden_section_search(lambda v: v, [7]), 7)
+
+    def test_coordinate_search(self):
+        dtf_set = [float(x + 2) / 20 for x in range(10)]
+        pfs_set = dtf_set[:6]
+
+        def function(dtf, pfs):
+            return -(dtf - 0.4) ** 2 - (pfs - 0.15) ** 2 - dtf * pfs / 10
+
+        best, score, scored = search.coordinate_search(
+            function, [dtf_set, pfs_set])
+        grid_best = max(((d, p) for d in dtf_set for p in pfs_set),
+                        key=lambda point: function(*point))
+        self.assertEqual(tuple(best), grid_best)
+        self.assertEqual(score, function(*grid_best))
+        self.assertLess(scored, len(dtf_set) * len(pfs_set) / 2)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.repo = _SnapshotRepository()
+        _, self.file1 = self.repo.file_set.get_or_create_file('patha', 1)
+        _, self.file2 = self.repo.file_set.get_or_create_file('pathb', 2)
+        self.file1.fault(2)
+        self.repo.file_distances.add_occurrence(self.file1, self.file2, 2)
+        self.repo.cache.add(self.file1)
+
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        snapshot.save_snapshot(self.repo, self.path)
+        self.snapshot = snapshot.Snapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+        os.remove(self.path)
+
+    def test_snapshot_score(self):
+        score = self.snapshot.score('patha')
+
+        self.assertEqual(score['in_cache'], True)
+        self.assertEqual(score['faults'], 1)
+        self.assertEqual(score['last_found'], 1)
+        self.assertEqual(score['last_found_hexsha'], '%040d' % 1)
+        self.assertEqual(score['closest_files'], [('pathb', 1)])
+
+        self.assertEqual(self.snapshot.score('pathb')['in_cache'], False)
+        self.assertEqual(self.snapshot.score('pathc')['known'], False)
+
+    def test_snapshot_invalid(self):
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.Snapshot(self.path + '.missing')
+
+
 if __name__ == '__main__':
     s1 = unittest.TestLoader().loadTestsFromTestCase(FilemanagementTestCase)
     s2 = unittest.TestLoader().loadTestsFromTestCase(CacheTestCase)
     s3 = unittest.TestLoader().loadTestsFromTestCase(ParsingTestCase)
-    suite = unittest.TestSuite([s1, s2, s3])
+    s4 = unittest.TestLoader().loadTestsFromTestCase(SnapshotTestCase)
+    s5 = unittest.TestLoader().loadTestsFromTestCase(ClassifierTestCase)
+    s6 = unittest.TestLoader().loadTestsFromTestCase(ProvenanceTestCase)
+    s7 = unittest.TestLoader().loadTestsFromTestCase(BackendTestCase)
+    s8 = unittest.TestLoader().loadTestsFromTestCase(SyntheticTestCase)
+    s9 = unittest.TestLoader().loadTestsFromTestCase(BenchmarkTestCase)
+    s10 = unittest.TestLoader().loadTestsFromTestCase(CommitTableTestCase)
+    s11 = unittest.TestLoader().loadTestsFromTestCase(ResultStoreTestCase)
+    s12 = unittest.TestLoader().loadTestsFromTestCase(SearchTestCase)
+    suite = unittest.TestSuite(
+        [s1, s2, s3, s4, s5, s6, s7, s8, s9, s10, s11, s12])
     unittest.TextTestRunner(verbosity=2).run(suite)
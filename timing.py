@@ -0,0 +1,112 @@
+"""Timing module, low overhead phase timers for the fixcache replay.
+
+A PhaseTimer accumulates the wall time spent in every phase of a replay,
+and counts the replayed commits and fixing commits. A phase is timed by
+reading the clock before it, and handing that start time to add() after
+it, so no context manager or closure is created in the hot loop:
+
+    start = timer.clock()
+    ...
+    timer.add('stats', start)
+"""
+import logging
+import timeit
+
+
+logger = logging.getLogger('fixcache_logger')
+
+PHASES = [
+    'stats',
+    'diff',
+    'blame',
+    'closest_files',
+    'distance',
+    'cache',
+    'evaluate']
+
+# extra csv columns, in the order of PhaseTimer.get_row()
+COLUMNS = ['t_' + phase for phase in PHASES] + [
+    'commits_per_second', 'fix_commits_per_second']
+
+PROGRESS_INTERVAL = 1000
+
+
+class PhaseTimer(object):
+    """Per phase timers and commit counters of a replay."""
+
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__(self, progress_interval=PROGRESS_INTERVAL):
+        """Initialization, progress is logged every progress_interval."""
+        self.progress_interval = progress_interval
+        self.reset()
+
+    def reset(self):
+        """Reset every timer and counter."""
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.commits = 0
+        self.fix_commits = 0
+        self.elapsed = 0.0
+        self._started = None
+
+    def start(self):
+        """Start the wall clock of the replay."""
+        self._started = self.clock()
+
+    def stop(self):
+        """Stop the wall clock of the replay."""
+        if self._started is not None:
+            self.elapsed += self.clock() - self._started
+            self._started = None
+
+    def add(self, phase, start):
+        """Account the time since start to a phase."""
+        self.seconds[phase] += self.clock() - start
+        self.calls[phase] += 1
+
+    def commit(self, fix=False):
+        """Count a replayed commit, logging the progress periodically."""
+        self.commits += 1
+        if fix:
+            self.fix_commits += 1
+
+        if self.commits % self.progress_interval == 0:
+            commit_rate, fix_rate = self.get_rates()
+            logger.info(
+                '%s commits replayed, %.1f commits/s, %.1f fix commits/s' %
+                (self.commits, commit_rate, fix_rate))
+
+    def get_elapsed(self):
+        """Return the wall time of the replay, including a running one."""
+        if self._started is None:
+            return self.elapsed
+        return self.elapsed + self.clock() - self._started
+
+    def get_rates(self):
+        """Return the commits/s and fix commits/s of the replay."""
+        elapsed = self.get_elapsed()
+        if elapsed <= 0:
+            return (0.0, 0.0)
+
+        return (self.commits / elapsed, self.fix_commits / elapsed)
+
+    def get_row(self):
+        """Return the values of the COLUMNS."""
+        return [self.seconds[phase] for phase in PHASES] + list(
+            self.get_rates())
+
+    def get_summary(self):
+        """Return the timers and counters as a dict."""
+        commit_rate, fix_rate = self.get_rates()
+        return {
+            'elapsed': self.get_elapsed(),
+            'commits': self.commits,
+            'fix_commits': self.fix_commits,
+            'commits_per_second': commit_rate,
+            'fix_commits_per_second': fix_rate,
+            'phases': dict(
+                (phase, {'seconds': self.seconds[phase],
+                         'calls': self.calls[phase]})
+                for phase in PHASES),
+        }
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+"""Tracecache module, caching the verdicts and line counts of repositories.
+
+Opening a repository reads its history with git log and classifies it,
+its first replay counts the lines of its root commits with git cat-file.
+Only the verdicts of the classifier and the line counts of the root
+commits are cached, as trace files under constants.TRACE_ROOT, see
+Repository.cache_traces(). The history and the numstats of the commits
+are not: every run still reads them from git, the cache only spares the
+classification and the line counting.
+
+This module fills the trace caches of several repositories concurrently,
+each in a worker process of its own, so the git processes of up to jobs
+repositories run in parallel. The progress is logged as every
+repository finishes.
+"""
+import argparse
+import logging
+import multiprocessing
+import timeit
+import backend
+import constants
+import repository
+from classifier import get_classifier
+
+
+logger = logging.getLogger('fixcache_logger')
+
+
+def cache_traces(repo_name, branch='master', issues=None,
+                 backend_name='subprocess'):
+    """Cache the verdicts and line counts of a constants.REPO_DICT repo.
+
+    Returns a dict of the repo, its number of commits and root commits and
+    the seconds taken, or the error if the caching failed.
+    """
+    start = timeit.default_timer()
+    result = {'repo': repo_name, 'commits': None, 'roots': None,
+              'error': None}
+    try:
+        repo_dir = constants.REPO_DICT[repo_name]
+    except KeyError:
+        repo_dir = None
+        result['error'] = 'Unknown repository, please update constants.py'
+
+    if repo_dir is not None:
+        try:
+            repo = repository.Repository(
+                repo_dir, branch=branch, classifier=get_classifier(issues),
+                backend=backend_name)
+            with repo:
+                result['roots'] = repo.cache_traces()
+                result['commits'] = len(repo.commit_table)
+        except (repository.RepositoryError, backend.BackendError) as e:
+            logging.warning(e)
+            result['error'] = str(e)
+        except Exception as e:
+            # a failing repository must not abort the others of the pool
+            logger.exception('Caching the traces of %s failed' % (repo_name,))
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+
+    result['seconds'] = timeit.default_timer() - start
+    return result
+
+
+def _cache_traces(kwargs):
+    return cache_traces(**kwargs)
+
+
+def cache_traces_multiple(repo_names, jobs=None, branch='master',
+                          issues=None, backend_name='subprocess'):
+    """Cache the traces of several repositories, jobs at a time.
+
+    Every repository is cached by a worker process of its own, jobs
+    processes run at once, one per CPU by default. Returns the results of
+    cache_traces(), in the order the repositories finish.
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    tasks = [{'repo_name': x, 'branch': branch, 'issues': issues,
+              'backend_name': backend_name} for x in repo_names]
+    if len(tasks) == 0:
+        return []
+
+    start = timeit.default_timer()
+    pool = multiprocessing.Pool(min(jobs, len(tasks)), maxtasksperchild=1)
+    results = []
+    try:
+        for result in pool.imap_unordered(_cache_traces, tasks):
+            results.append(result)
+            if result['error'] is None:
+                logger.info(
+                    '[%s/%s] %s cached, %s commits in %.1fs' % (
+                        len(results), len(tasks), result['repo'],
+                        result['commits'], result['seconds']))
+            else:
+                logger.warning('[%s/%s] %s failed: %s' % (
+                    len(results), len(tasks), result['repo'],
+                    result['error']))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    logger.info('%s repositories cached in %.1fs' % (
+        len(results), timeit.default_timer() - start))
+
+    return results
+
+
+def main(args):
+    """Main entry."""
+    repo_names = args.repositories or sorted(constants.REPO_DICT)
+    results = cache_traces_multiple(
+        repo_names, jobs=args.jobs, branch=args.b, issues=args.issues,
+        backend_name=args.backend)
+
+    print 'repo : commits : roots : seconds'
+    for result in sorted(results, key=lambda x: x['repo']):
+        if result['error'] is None:
+            print result['repo'], ':', result['commits'], ':', \
+                result['roots'], ':', '%.1f' % (result['seconds'],)
+        else:
+            print result['repo'], ': failed :', result['error']
+
+
+parser = argparse.ArgumentParser(
+    description='Cache the verdicts and root line counts of several '
+                'repositories concurrently')
+parser.add_argument('repositories', metavar='repo', nargs='*',
+                    help='repositories of constants.REPO_DICT, all of them '
+                         'by default')
+parser.add_argument('--jobs', type=int, default=None,
+                    help='repositories cached at once, one per CPU')
+parser.add_argument('--b', '--branch', type=str, default='master')
+parser.add_argument('--issues', type=str, default=None,
+                    help='file of bug issue ids, one per line')
+parser.add_argument('--backend', choices=backend.BACKEND_CHOICES,
+                    default='subprocess')
+parser.add_argument('--logging', default='info')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.logging == 'info':
+        logger.setLevel(logging.INFO)
+    elif args.logging == 'debug':
+        logger.setLevel(logging.DEBUG)
+
+    main(args)